@@ -0,0 +1,194 @@
+"""
+Server-side inventory analytics for GET /api/analytics.
+
+The analytics page used to download the whole catalogue and crunch it in the
+browser. ``compute_analytics`` does that work on the in-memory products and
+returns only what the charts draw: totals, per-group aggregates, fixed-size
+histograms, margin statistics and short top-N lists.
+
+The products are read once into per-field columns, and every statistic is
+then a pass over those columns (``map``, ``sum``, ``itemgetter``, ``heapq``), rather than a
+separate walk over the product dicts for each chart.
+"""
+
+import heapq
+import math
+from collections import Counter
+from operator import itemgetter
+from statistics import quantiles
+
+GROUP_FIELDS = ('category', 'status', 'unit')
+
+# Products needing attention returned with the analytics
+MAX_ALERTS = 50
+
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return number if math.isfinite(number) else 0.0
+
+
+def _numeric_column(products, field):
+    values = [p.get(field) for p in products]
+    try:
+        column = list(map(float, values))
+    except (TypeError, ValueError):
+        return [_number(value) for value in values]
+    # NaN or infinity would poison every sum, so the slow path cleans them up
+    return column if math.isfinite(sum(column)) else [_number(value) for value in values]
+
+
+def _columns(products):
+    """Per-field columns of the fields the analytics use"""
+    return {
+        'id': [p.get('id') for p in products],
+        'name': [p.get('name') for p in products],
+        'category': [p.get('category') or 'Uncategorized' for p in products],
+        'status': [p.get('status') or 'unknown' for p in products],
+        'unit': [p.get('unit') or 'units' for p in products],
+        'stock': _numeric_column(products, 'current_stock'),
+        'min_stock': _numeric_column(products, 'min_stock_level'),
+        'cost': _numeric_column(products, 'cost_price'),
+        'price': _numeric_column(products, 'selling_price'),
+        'sales': _numeric_column(products, 'sales_count'),
+    }
+
+
+def _gather(column, indexes):
+    """column[i] for every i in indexes"""
+    gathered = itemgetter(*indexes)(column)
+    return gathered if len(indexes) > 1 else (gathered,)
+
+
+def histogram(values, buckets):
+    """Equal-width histogram: {'edges': buckets + 1 edges, 'counts': buckets counts}"""
+    if not values:
+        return {'edges': [], 'counts': []}
+    low, high = min(values), max(values)
+    if high == low:
+        return {'edges': [low, high], 'counts': [len(values)]}
+    width = (high - low) / buckets
+    scale = 1 / width
+    tally = Counter([int((value - low) * scale) for value in values])
+    counts = [tally[bucket] for bucket in range(buckets)]
+    # The maximum itself lands one past the last bucket
+    counts[-1] += tally[buckets]
+    return {'edges': [round(low + width * i, 4) for i in range(buckets + 1)], 'counts': counts}
+
+
+def margin_stats(margins):
+    if not margins:
+        return {'count': 0}
+    ordered = sorted(margins)
+    deciles = quantiles(ordered, n=10) if len(ordered) > 1 else [ordered[0]] * 9
+    return {
+        'count': len(ordered),
+        'min': round(ordered[0], 2),
+        'p10': round(deciles[0], 2),
+        'median': round(deciles[4], 2),
+        'mean': round(sum(ordered) / len(ordered), 2),
+        'p90': round(deciles[8], 2),
+        'max': round(ordered[-1], 2),
+        'negative': sum(1 for margin in ordered if margin < 0),
+    }
+
+
+def _group(columns, field, value, cost):
+    members = {}
+    for index, key in enumerate(columns[field]):
+        members.setdefault(key, []).append(index)
+    result = []
+    for key in sorted(members, key=str):
+        indexes = members[key]
+        revenue = sum(_gather(value, indexes))
+        inventory_cost = sum(_gather(cost, indexes))
+        sales = sum(_gather(columns['sales'], indexes))
+        result.append({
+            'key': key,
+            'count': len(indexes),
+            'stock': round(sum(_gather(columns['stock'], indexes)), 2),
+            'sales_count': round(sales, 2),
+            'inventory_value': round(revenue, 2),
+            'inventory_cost': round(inventory_cost, 2),
+            'margin': round((revenue - inventory_cost) / revenue * 100, 2) if revenue else 0.0,
+            'turnover': sales / revenue if revenue else 0.0,
+        })
+    return result
+
+
+def compute_analytics(products, group_by=GROUP_FIELDS, buckets=10, top=10):
+    # Other threads append to the live list; every column must come from the same snapshot
+    products = list(products)
+    columns = _columns(products)
+    stock, price, cost_price = columns['stock'], columns['price'], columns['cost']
+    value = [s * p for s, p in zip(stock, price)]
+    cost = [s * c for s, c in zip(stock, cost_price)]
+    margins = [(p - c) / p * 100 for p, c in zip(price, cost_price) if p > 0]
+
+    inventory_value, inventory_cost = sum(value), sum(cost)
+    profit = inventory_value - inventory_cost
+
+    # Status buckets as the stock level chart draws them: no stock is out of stock whatever the status
+    stock_status = {'active': 0, 'low_stock': 0, 'out_of_stock': 0}
+    for status, level in zip(columns['status'], stock):
+        if level == 0 or status in ('out_of_stock', 'inactive'):
+            stock_status['out_of_stock'] += 1
+        elif status == 'low_stock':
+            stock_status['low_stock'] += 1
+        else:
+            stock_status['active'] += 1
+
+    indexes = range(len(columns['id']))
+
+    def entry(i, **fields):
+        return dict({'id': columns['id'][i], 'name': columns['name'][i]}, **fields)
+
+    by_value = heapq.nlargest(top, indexes, key=value.__getitem__)
+    by_price = heapq.nlargest(top, indexes, key=price.__getitem__)
+    by_ratio = heapq.nsmallest(
+        top, (i for i in indexes if columns['min_stock'][i] > 0 and stock[i] >= 0),
+        key=lambda i: stock[i] / columns['min_stock'][i]
+    )
+
+    # Out of stock first, then low stock, like the notifications panel lists them
+    needing_attention = sorted(
+        (i for i in indexes if stock[i] == 0 or columns['status'][i] in ('out_of_stock', 'low_stock')
+         or stock[i] <= columns['min_stock'][i]),
+        key=lambda i: (stock[i] != 0 and columns['status'][i] != 'out_of_stock', stock[i])
+    )
+
+    return {
+        'totals': {
+            'products': len(columns['id']),
+            'categories': len(set(columns['category'])),
+            'inventory_value': round(inventory_value, 2),
+            'inventory_cost': round(inventory_cost, 2),
+            'potential_profit': round(profit, 2),
+            'profit_margin': round(profit / inventory_value * 100, 2) if inventory_value else 0.0,
+            'low_stock': stock_status['low_stock'],
+            'out_of_stock': stock_status['out_of_stock'],
+        },
+        'stock_status': stock_status,
+        'groups': {field: _group(columns, field, value, cost) for field in group_by},
+        'histograms': {
+            'current_stock': histogram(stock, buckets),
+            'margin': histogram(margins, buckets),
+        },
+        'margins': margin_stats(margins),
+        'top': {
+            'inventory_value': [entry(i, value=round(value[i], 2), current_stock=stock[i]) for i in by_value],
+            'selling_price': [entry(i, cost_price=cost_price[i], selling_price=price[i]) for i in by_price],
+            'stock_ratio': [entry(i, current_stock=stock[i], min_stock_level=columns['min_stock'][i])
+                            for i in by_ratio],
+        },
+        'alert_count': len(needing_attention),
+        'alerts': [
+            entry(i, current_stock=stock[i], min_stock_level=columns['min_stock'][i], unit=columns['unit'][i],
+                  status=columns['status'][i],
+                  updated_at=products[i].get('updated_at') or products[i].get('created_at'))
+            for i in needing_attention[:MAX_ALERTS]
+        ],
+    }
@@ -1,27 +1,69 @@
-from flask import Flask, request, jsonify, send_from_directory
+import time
+
+# Process start, used to report time-to-first-request
+BOOT_STARTED = time.perf_counter()
+
+from flask import Flask, request, jsonify, send_from_directory, g, Response, has_request_context
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import json
 import os
 import sys
-import subprocess
 from datetime import datetime
 import uuid
 import threading
-import time
+import atexit
+from contextlib import contextmanager
 from random import randint, choice, uniform
 
+import analytics
+import forecast
+import history
+import lots
+import metrics
+import outbound
+import profiling
+import rankings
+import storage as storage_backends
+import tenants
+import trace_recorder
+
 # Get the absolute path to directories
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIR = os.path.dirname(CURRENT_DIR)
 FRONTEND_PATH = os.path.join(ROOT_DIR, 'frontend')
 DATA_DIR = os.path.join(CURRENT_DIR, 'data')
 
+# Token required by the /admin endpoints; they are disabled when unset
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
 # Ensure data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Storage backend for products: json, sqlite or mongo (overridden by --storage)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'json')
+
+# Events queued per Socket.IO client before updates are collapsed or the client
+# is told to resync; 0 sends broadcasts directly (overridden by --socket-queue)
+SOCKET_QUEUE_SIZE = int(os.environ.get('SOCKET_QUEUE_SIZE', 256))
+
+# Seconds a company partition stays loaded without requests (overridden by --tenant-idle)
+TENANT_IDLE_SECONDS = float(os.environ.get('TENANT_IDLE_SECONDS', 600))
+
+# Half-life in seconds of the consumption rates behind the stockout forecast
+CONSUMPTION_HALF_LIFE = float(os.environ.get('CONSUMPTION_HALF_LIFE', forecast.CONSUMPTION_HALF_LIFE))
+
+# Hours before its expiry date a lot is announced as expiring, and how often lots are checked
+EXPIRY_WARNING_HOURS = float(os.environ.get('EXPIRY_WARNING_HOURS', lots.EXPIRY_WARNING_HOURS))
+LOT_CHECK_INTERVAL = float(os.environ.get('LOT_CHECK_INTERVAL', 60))
+
+# Stock samples kept in memory per product before older ones are spilled to data/history/
+HISTORY_RING_SIZE = int(os.environ.get('HISTORY_RING_SIZE', 256))
+
 # Function to check and install required packages
 def check_and_install_requirements():
+    import subprocess
+    
     print("Checking required packages...")
     requirements_file = os.path.join(ROOT_DIR, 'requirements.txt')
     
@@ -51,6 +93,8 @@ def check_and_install_requirements():
 
 # Function to run data generator if needed
 def run_data_generator_if_needed():
+    import subprocess
+    
     data_file = os.path.join(DATA_DIR, 'products.json')
     
     if not os.path.exists(data_file) or os.path.getsize(data_file) == 0:
@@ -71,39 +115,155 @@ def run_data_generator_if_needed():
         # Change back to original directory
         os.chdir(original_dir)
 
+# Generate sample data in-process (fast-start mode, only when requested)
+def generate_data_in_process(num_products=30):
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    # Faker is heavy, so the generator is only imported when actually needed
+    import data_generator
+    
+    data_file = data_generator.write_products(
+        data_generator.generate_products(num_products=num_products),
+        os.path.join(DATA_DIR, 'products.json')
+    )
+    print(f"Generated {num_products} products in-process and saved to {data_file}")
+
 app = Flask(__name__, static_folder=None)
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins="*")
 
+# Bounded per-client queues for product and activity broadcasts (started in __main__)
+outbound_queues = None
+
 # In-memory storage for products and activities
 products = []
 activities = []
 
+# Persistent storage behind the in-memory product list
+storage = storage_backends.create_backend(STORAGE_BACKEND, DATA_DIR)
+
+# Top-K rankings served by /api/products/top, kept up to date on every change
+product_rankings = rankings.ProductRankings(float(os.environ.get('VELOCITY_HALF_LIFE', rankings.VELOCITY_HALF_LIFE)))
+
+# Stock level time series served by /api/products/<id>/history; rings are written out on exit
+stock_history = history.StockHistory(os.path.join(DATA_DIR, 'history'), HISTORY_RING_SIZE)
+atexit.register(stock_history.flush)
+
+# Consumption rates and projected stockouts served by /api/forecast/stockouts
+stockout_forecaster = forecast.StockoutForecaster(CONSUMPTION_HALF_LIFE)
+
+# Perishable lots ordered by expiry, served by /api/lots/expiring and consumed FEFO on stock decreases
+lot_index = lots.LotIndex()
+
+# Per-company partitions served under /api/companies/<company_id>/
+tenant_registry = tenants.TenantRegistry(DATA_DIR, STORAGE_BACKEND, TENANT_IDLE_SECONDS)
+
+# Metrics exposed at /metrics
+REQUEST_COUNT = metrics.Counter('http_requests_total', 'HTTP requests by route, method and status',
+                                labels=('route', 'method', 'status'))
+REQUEST_LATENCY = metrics.Histogram('http_request_duration_seconds', 'HTTP request latency by route, method and status',
+                                    labels=('route', 'method', 'status'))
+SAVE_DURATION = metrics.Histogram('save_data_duration_seconds', 'Time spent writing to the storage backend')
+SAVE_BYTES = metrics.Counter('save_data_bytes_written_total', 'Bytes written to the storage backend')
+SAVE_SIZE = metrics.Gauge('save_data_last_size_bytes', 'Size of the last storage backend write')
+SOCKET_EMITS = metrics.Counter('socketio_emits_total', 'Socket.IO emits by event', labels=('event',))
+SOCKET_FANOUT = metrics.Counter('socketio_emit_recipients_total', 'Socket.IO messages delivered by event (emits x recipients)',
+                                labels=('event',))
+CONNECTED_CLIENTS = metrics.Gauge('socketio_connected_clients', 'Currently connected Socket.IO clients')
+PRODUCT_COUNT = metrics.Gauge('products_total', 'Products held in memory', callback=lambda: len(products))
+LOOP_LAG = metrics.Histogram('periodic_updates_lag_seconds', 'Delay of the periodic update loop beyond its interval',
+                             buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+LOOP_LAST_LAG = metrics.Gauge('periodic_updates_last_lag_seconds', 'Most recent periodic update loop lag')
+STARTUP_READY = metrics.Gauge('startup_ready_seconds', 'Seconds from process start until the server began listening')
+STARTUP_FIRST_REQUEST = metrics.Gauge('startup_first_request_seconds', 'Seconds from process start until the first request')
+TENANTS_LOADED = metrics.Gauge('tenants_loaded', 'Company partitions held in memory', callback=lambda: tenant_registry.loaded())
+TENANT_EVICTIONS = metrics.Counter('tenant_evictions_total', 'Company partitions evicted after being idle')
+OUTBOUND_DEPTH = metrics.Gauge('socketio_outbound_queue_depth', 'Events queued for Socket.IO clients',
+                               callback=lambda: outbound_queues.depth() if outbound_queues else 0)
+OUTBOUND_MAX_DEPTH = metrics.Gauge('socketio_outbound_queue_max_depth', 'Longest Socket.IO client queue',
+                                   callback=lambda: outbound_queues.max_depth() if outbound_queues else 0)
+
+# Set once the first request has been seen
+first_request_seen = False
+
+# Change feed for the MongoDB sync worker (enabled with --change-feed)
+change_feed = None
+
+# Traffic trace recorder (started with --trace or /admin/trace/start)
+trace = None
+
+# Record a trace event, if a trace is being recorded
+def record_trace(kind, **fields):
+    if trace is not None:
+        trace.record(kind, **fields)
+
+# Publish a mutation event to the change feed, if enabled
+def publish_change(event_type, product_id, fields=None):
+    if change_feed is not None:
+        change_feed.publish(event_type, product_id, fields)
+    # Mutations made inside a request are already traced as that request
+    if trace is not None and not has_request_context():
+        trace.record('u', type=event_type, id=product_id, f=fields)
+
+# Copies of the products for a change feed resync, taken on the feed's writer thread.
+# Copying a dict is atomic under the GIL, so each copy is one consistent state of its product.
+def snapshot_products():
+    return [dict(product) for product in list(products)]
+
+# Emit a Socket.IO event and record emit count and fan-out
+def emit_event(event, data, room=None):
+    if room is None:
+        recipients = CONNECTED_CLIENTS.value()
+    else:
+        recipients = len(socketio.server.manager.rooms.get('/', {}).get(room, ()))
+    SOCKET_EMITS.inc(event)
+    SOCKET_FANOUT.inc(event, amount=recipients)
+    if outbound_queues is not None and event in outbound.QUEUED_EVENTS:
+        outbound_queues.enqueue(event, data, room)
+    elif room is None:
+        socketio.emit(event, data)
+    else:
+        socketio.emit(event, data, to=room)
+
 # Load initial data if available
-def load_initial_data():
+def load_initial_data(announce=True):
     global products
     try:
+        products = storage.load()
+        
+        # Seed an empty database backend from products.json the first time it is used
         data_file = os.path.join(DATA_DIR, 'products.json')
-        if os.path.exists(data_file) and os.path.getsize(data_file) > 0:
-            with open(data_file, 'r') as f:
-                products = json.load(f)
-            
-            print(f"Loaded {len(products)} products from data file.")
-            
-            # Generate initial activities from products
+        if not products and storage.name != 'json' and os.path.exists(data_file) and os.path.getsize(data_file) > 0:
+            from product_stream import iter_products, chunked
+            for chunk in chunked(iter_products(data_file), 1000):
+                storage.batch(upserts=chunk)
+            products = storage.load()
+            print(f"Imported {len(products)} products from products.json into {storage.name} storage.")
+        
+        if products:
+            print(f"Loaded {len(products)} products from {storage.name} storage.")
+            # Products saved before versioning start at version 1, like newly created ones
             for product in products:
-                add_activity('create', product['id'], f"Added new product: {product['name']}", product['name'])
+                product.setdefault('version', 1)
+            product_rankings.rebuild(products)
+            stockout_forecaster.rebuild(products, stock_history)
+            lot_index.rebuild(products)
+            
+            # Generate initial activities from products (skipped in fast-start mode)
+            if announce:
+                for product in products:
+                    add_activity('create', product['id'], f"Added new product: {product['name']}", product['name'])
             return True
         else:
-            print("No product data file found or file is empty.")
+            print(f"No product data found in {storage.name} storage.")
             return False
     except Exception as e:
         print(f"Error loading data: {str(e)}")
         products = []
         return False
 
-# Add a new activity entry
-def add_activity(action, product_id, description, product_name):
+# Add a new activity entry (to a company's log and room when tenant is given)
+def add_activity(action, product_id, description, product_name, tenant=None):
     global activities
     
     activity = {
@@ -115,42 +275,268 @@ def add_activity(action, product_id, description, product_name):
         'timestamp': datetime.now().isoformat()
     }
     
+    if tenant is not None:
+        tenant.add_activity(activity)
+        emit_event('activity-update', activity, room=tenant.room)
+        return activity
+    
     activities.append(activity)
+    record_trace('a', action=action, id=product_id)
     
     # Keep only the last 100 activities
     if len(activities) > 100:
         activities = activities[-100:]
     
     # Broadcast activity to all clients
-    socketio.emit('activity-update', activity)
+    emit_event('activity-update', activity)
     
     return activity
 
-# Broadcast a product update
-def broadcast_product_update(product_id, update_type, product_data):
+# Fields whose values differ between an old and a new copy of a product
+def changed_fields(old_product, product):
+    return {key: value for key, value in product.items() if old_product.get(key) != value}
+
+# Broadcast a product update (only to a company's room when tenant is given).
+# Updates with changes send just those fields and the new version; clients
+# apply them to their copy at the previous version and refetch on a gap.
+def broadcast_product_update(product_id, update_type, product_data, tenant=None, changes=None):
     update = {
         'type': update_type,
         'id': product_id,
-        'data': product_data,
         'timestamp': datetime.now().isoformat()
     }
+    if 'version' in product_data:
+        update['version'] = product_data['version']
+    if update_type == 'update' and changes is not None:
+        update['changes'] = {key: value for key, value in changes.items() if key != 'version'}
+    else:
+        update['data'] = product_data
+    if tenant is not None:
+        update['company_id'] = tenant.company_id
     
-    # Emit to all clients
-    socketio.emit('product-update', update)
+    # Emit to all clients, or to the company's subscribers
+    emit_event('product-update', update, room=tenant.room if tenant is not None else None)
     
     # Add to activity log
     if update_type == 'create':
-        add_activity('create', product_id, f"Added new product: {product_data['name']}", product_data['name'])
+        add_activity('create', product_id, f"Added new product: {product_data['name']}", product_data['name'], tenant)
     elif update_type == 'update':
-        add_activity('update', product_id, f"Updated product: {product_data['name']}", product_data['name'])
+        add_activity('update', product_id, f"Updated product: {product_data['name']}", product_data['name'], tenant)
     elif update_type == 'delete':
-        add_activity('delete', product_id, f"Deleted product: {product_data['name']}", product_data['name'])
+        add_activity('delete', product_id, f"Deleted product: {product_data['name']}", product_data['name'], tenant)
 
-# Save data to file
-def save_data():
-    data_file = os.path.join(DATA_DIR, 'products.json')
-    with open(data_file, 'w') as f:
-        json.dump(products, f, indent=2)
+# Save changed products to the storage backend (a company's own backend when given)
+def save_data(upserts=(), deletes=(), backend=None):
+    backend = backend or storage
+    start = time.perf_counter()
+    backend.batch(upserts=upserts, deletes=deletes)
+    size = backend.last_write_bytes
+    SAVE_DURATION.observe(time.perf_counter() - start)
+    SAVE_BYTES.inc(amount=size)
+    SAVE_SIZE.set(size)
+
+# Request instrumentation
+@app.before_request
+def start_request_timer():
+    global first_request_seen
+    g.request_start = time.perf_counter()
+    if not first_request_seen:
+        first_request_seen = True
+        elapsed = g.request_start - BOOT_STARTED
+        STARTUP_FIRST_REQUEST.set(elapsed)
+        print(f"Time to first request: {elapsed:.3f}s")
+    profiling.begin_timing(request.headers)
+    profiling.begin_request_profile()
+
+@app.after_request
+def record_request_metrics(response):
+    profiling.end_request_profile()
+    server_timing = profiling.server_timing_header()
+    if server_timing:
+        response.headers['Server-Timing'] = server_timing
+    start = getattr(g, 'request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        labels = (route, request.method, str(response.status_code))
+        REQUEST_COUNT.inc(*labels)
+        REQUEST_LATENCY.observe(time.perf_counter() - start, *labels)
+        if trace is not None and request.path.startswith('/api/'):
+            trace_request(route, response, time.perf_counter() - start)
+    return response
+
+# Record an API request (and the id of any product or lot it created) in the trace
+def trace_request(route, response, duration):
+    created_id = created_lot_id = None
+    if request.method == 'POST' and route == '/api/products' and response.status_code == 200:
+        created_id = (response.get_json(silent=True) or {}).get('data', {}).get('id')
+    if request.method == 'POST' and route == '/api/products/<product_id>/lots' and response.status_code == 200:
+        created_lot_id = response.headers.get('Location', '').rsplit('/', 1)[-1] or None
+    trace.record(
+        'r',
+        m=request.method,
+        p=route,
+        id=(request.view_args or {}).get('product_id'),
+        co=(request.view_args or {}).get('company_id'),
+        l=(request.view_args or {}).get('lot_id'),
+        q=request.query_string.decode() or None,
+        b=request.get_json(silent=True) if request.method in ('POST', 'PUT') else None,
+        s=response.status_code,
+        d=round(duration * 1000, 2),
+        i=created_id,
+        il=created_lot_id
+    )
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# Reject admin requests unless a matching X-Admin-Token header is sent
+def check_admin_token():
+    if not ADMIN_TOKEN:
+        return jsonify({
+            'success': False,
+            'message': 'Admin endpoints are disabled. Set ADMIN_TOKEN to enable them.'
+        }), 403
+    if request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid admin token'
+        }), 401
+    return None
+
+@app.route('/admin/profile/start', methods=['POST'])
+def start_profile():
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    params = request.get_json(silent=True) or request.args
+    try:
+        mode = params.get('mode', 'sampling')
+        seconds = min(float(params.get('seconds', 10)), 300)
+        interval = float(params.get('interval', 0.005))
+        session = profiling.start(mode, seconds, interval)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    if session is None:
+        return jsonify({
+            'success': False,
+            'message': 'A profiling session is already running'
+        }), 409
+    
+    return jsonify({
+        'success': True,
+        'data': session.summary()
+    })
+
+@app.route('/admin/profile/stop', methods=['POST'])
+def stop_profile():
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    session = profiling.stop()
+    if session is None:
+        return jsonify({
+            'success': False,
+            'message': 'No profiling session has been run'
+        }), 404
+    return Response(session.report(), content_type='text/plain; charset=utf-8')
+
+@app.route('/admin/profile', methods=['GET'])
+def get_profile():
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    session = profiling.status()
+    if session is None:
+        return jsonify({
+            'success': False,
+            'message': 'No profiling session has been run'
+        }), 404
+    if request.args.get('format') == 'report':
+        return Response(session.report(), content_type='text/plain; charset=utf-8')
+    return jsonify({
+        'success': True,
+        'data': session.summary()
+    })
+
+# Traffic trace recording for load tests; traces are always written under data/traces
+@app.route('/admin/trace/start', methods=['POST'])
+def start_trace():
+    global trace
+    denied = check_admin_token()
+    if denied:
+        return denied
+    if trace is not None:
+        return jsonify({
+            'success': False,
+            'message': 'A trace is already being recorded',
+            'data': trace.summary()
+        }), 409
+    options = request.get_json(silent=True) or {}
+    path = None
+    if options.get('name'):
+        try:
+            path = trace_recorder.trace_path(options['name'])
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+    trace = trace_recorder.TraceRecorder(path)
+    return jsonify({
+        'success': True,
+        'data': trace.summary()
+    })
+
+@app.route('/admin/trace/stop', methods=['POST'])
+def stop_trace():
+    global trace
+    denied = check_admin_token()
+    if denied:
+        return denied
+    if trace is None:
+        return jsonify({
+            'success': False,
+            'message': 'No trace is being recorded'
+        }), 409
+    recorder, trace = trace, None
+    return jsonify({
+        'success': True,
+        'data': recorder.close()
+    })
+
+@app.route('/admin/trace', methods=['GET'])
+def get_trace():
+    denied = check_admin_token()
+    if denied:
+        return denied
+    return jsonify({
+        'success': True,
+        'data': trace.summary() if trace is not None else None
+    })
+
+@app.route('/admin/forecast/rebuild', methods=['POST'])
+def rebuild_forecast():
+    denied = check_admin_token()
+    if denied:
+        return denied
+    started = time.perf_counter()
+    forecast_count = stockout_forecaster.rebuild(products, stock_history)
+    return jsonify({
+        'success': True,
+        'data': {
+            'products': len(products),
+            'forecast': forecast_count,
+            'seconds': round(time.perf_counter() - started, 3)
+        }
+    })
 
 # Serve frontend static files
 @app.route('/', defaults={'path': ''})
@@ -169,10 +555,16 @@ def serve_frontend(path):
 # WebSocket event handlers
 @socketio.on('connect')
 def handle_connect():
+    CONNECTED_CLIENTS.inc()
+    record_trace('c', sid=request.sid)
     print('Client connected')
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    CONNECTED_CLIENTS.dec()
+    record_trace('x', sid=request.sid)
+    if outbound_queues is not None:
+        outbound_queues.discard(request.sid)
     print('Client disconnected')
 
 @socketio.on('join')
@@ -185,13 +577,51 @@ def handle_leave(room):
     leave_room(room)
     print(f'Client left room: {room}')
 
+# Required fields of a new product
+REQUIRED_PRODUCT_FIELDS = ['name', 'category', 'sku', 'unit', 'current_stock', 
+                           'min_stock_level', 'cost_price', 'selling_price']
+
+# Build a new product from create-request data (required fields already checked)
+def build_product(data):
+    return {
+        'id': str(uuid.uuid4()),
+        'name': data['name'],
+        'category': data['category'],
+        'sku': data['sku'],
+        'unit': data['unit'],
+        'current_stock': float(data['current_stock']),
+        'min_stock_level': float(data['min_stock_level']),
+        'cost_price': float(data['cost_price']),
+        'selling_price': float(data['selling_price']),
+        'description': data.get('description', ''),
+        'status': 'low_stock' if float(data['current_stock']) <= float(data['min_stock_level']) else 'active',
+        'created_at': datetime.now().isoformat(),
+        'version': 1
+    }
+
+# Apply update-request data to a product in place, bumping its version
+def apply_product_changes(product, data):
+    for key, value in data.items():
+        if key in ['name', 'category', 'sku', 'unit', 'description']:
+            product[key] = value
+        elif key in ['current_stock', 'min_stock_level', 'cost_price', 'selling_price']:
+            product[key] = float(value)
+    
+    # Update status
+    product['status'] = 'low_stock' if float(product['current_stock']) <= float(product['min_stock_level']) else 'active'
+    
+    # Add updated_at timestamp
+    product['updated_at'] = datetime.now().isoformat()
+    product['version'] = product.get('version', 0) + 1
+
 # API routes
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    return jsonify({
-        'success': True,
-        'data': products
-    })
+    with profiling.phase('serialization'):
+        return jsonify({
+            'success': True,
+            'data': products
+        })
 
 @app.route('/api/products', methods=['POST'])
 def create_product():
@@ -199,41 +629,48 @@ def create_product():
         data = request.json
         
         # Validate required fields
-        required_fields = ['name', 'category', 'sku', 'unit', 'current_stock', 
-                         'min_stock_level', 'cost_price', 'selling_price']
-        for field in required_fields:
+        for field in REQUIRED_PRODUCT_FIELDS:
             if field not in data:
                 return jsonify({
                     'success': False,
                     'message': f'Missing required field: {field}'
                 }), 400
         
+        # Perishable products can be created with their lots
+        try:
+            new_lots = [lots.new_lot(lot.get('quantity'), lot.get('expires_at'), lot.get('received_at'))
+                        for lot in data.get('lots') or []]
+        except (AttributeError, TypeError, ValueError) as e:
+            return jsonify({
+                'success': False,
+                'message': f'Invalid lot: {e}'
+            }), 400
+        
         # Create new product
-        product = {
-            'id': str(uuid.uuid4()),
-            'name': data['name'],
-            'category': data['category'],
-            'sku': data['sku'],
-            'unit': data['unit'],
-            'current_stock': float(data['current_stock']),
-            'min_stock_level': float(data['min_stock_level']),
-            'cost_price': float(data['cost_price']),
-            'selling_price': float(data['selling_price']),
-            'description': data.get('description', ''),
-            'status': 'low_stock' if float(data['current_stock']) <= float(data['min_stock_level']) else 'active',
-            'created_at': datetime.now().isoformat()
-        }
+        with profiling.phase('mutation'):
+            product = build_product(data)
+            if new_lots:
+                # current_stock is the total of the lots
+                lot_index.stock(product, new_lots)
+                product['status'] = 'low_stock' if product['current_stock'] <= product['min_stock_level'] else 'active'
+            products.append(product)
+            product_rankings.update(product)
+            stockout_forecaster.update(product)
+            stock_history.record(product['id'], product['current_stock'])
         
-        products.append(product)
-        save_data()
+        with profiling.phase('persistence'):
+            save_data(upserts=[product])
+            publish_change('create', product['id'], product)
         
         # Broadcast the new product
-        broadcast_product_update(product['id'], 'create', product)
+        with profiling.phase('broadcast'):
+            broadcast_product_update(product['id'], 'create', product)
         
-        return jsonify({
-            'success': True,
-            'data': product
-        })
+        with profiling.phase('serialization'):
+            return jsonify({
+                'success': True,
+                'data': product
+            })
         
     except Exception as e:
         return jsonify({
@@ -243,12 +680,14 @@ def create_product():
 
 @app.route('/api/products/<product_id>', methods=['GET'])
 def get_product(product_id):
-    product = next((p for p in products if p['id'] == product_id), None)
+    with profiling.phase('lookup'):
+        product = next((p for p in products if p['id'] == product_id), None)
     if product:
-        return jsonify({
-            'success': True,
-            'data': product
-        })
+        with profiling.phase('serialization'):
+            return jsonify({
+                'success': True,
+                'data': product
+            })
     return jsonify({
         'success': False,
         'message': 'Product not found'
@@ -260,7 +699,8 @@ def update_product(product_id):
         data = request.json
         
         # Find the product
-        product_index = next((i for i, p in enumerate(products) if p['id'] == product_id), None)
+        with profiling.phase('lookup'):
+            product_index = next((i for i, p in enumerate(products) if p['id'] == product_id), None)
         
         if product_index is None:
             return jsonify({
@@ -268,24 +708,23 @@ def update_product(product_id):
                 'message': 'Product not found'
             }), 404
             
-        # Keep track of previous values for activity logging
-        old_product = products[product_index].copy()
-        
-        # Update product data
-        for key, value in data.items():
-            if key in ['name', 'category', 'sku', 'unit', 'description']:
-                products[product_index][key] = value
-            elif key in ['current_stock', 'min_stock_level', 'cost_price', 'selling_price']:
-                products[product_index][key] = float(value)
-        
-        # Update status
-        products[product_index]['status'] = 'low_stock' if float(products[product_index]['current_stock']) <= float(products[product_index]['min_stock_level']) else 'active'
-        
-        # Add updated_at timestamp
-        products[product_index]['updated_at'] = datetime.now().isoformat()
+        with profiling.phase('mutation'):
+            # Keep track of previous values for activity logging
+            old_product = products[product_index].copy()
+            
+            # Update product data
+            apply_product_changes(products[product_index], data)
+            lot_index.sync(products[product_index], old_product['current_stock'])
+            product_rankings.update(products[product_index], previous_stock=old_product['current_stock'])
+            stockout_forecaster.update(products[product_index], previous_stock=old_product['current_stock'])
+            stock_history.record(product_id, products[product_index]['current_stock'],
+                                 previous=old_product['current_stock'])
         
         # Save changes
-        save_data()
+        changes = changed_fields(old_product, products[product_index])
+        with profiling.phase('persistence'):
+            save_data(upserts=[products[product_index]])
+            publish_change('update', product_id, changes)
         
         # Generate activity description
         description = "Product updated"
@@ -295,12 +734,14 @@ def update_product(product_id):
             description = f"Stock updated from {old_product['current_stock']} to {products[product_index]['current_stock']} {products[product_index]['unit']}"
         
         # Broadcast the update
-        broadcast_product_update(product_id, 'update', products[product_index])
+        with profiling.phase('broadcast'):
+            broadcast_product_update(product_id, 'update', products[product_index], changes=changes)
         
-        return jsonify({
-            'success': True,
-            'data': products[product_index]
-        })
+        with profiling.phase('serialization'):
+            return jsonify({
+                'success': True,
+                'data': products[product_index]
+            })
         
     except Exception as e:
         return jsonify({
@@ -311,7 +752,8 @@ def update_product(product_id):
 @app.route('/api/products/<product_id>', methods=['DELETE'])
 def delete_product(product_id):
     global products
-    product = next((p for p in products if p['id'] == product_id), None)
+    with profiling.phase('lookup'):
+        product = next((p for p in products if p['id'] == product_id), None)
     
     if not product:
         return jsonify({
@@ -319,17 +761,229 @@ def delete_product(product_id):
             'message': 'Product not found'
         }), 404
     
-    products = [p for p in products if p['id'] != product_id]
-    save_data()
+    with profiling.phase('mutation'):
+        products = [p for p in products if p['id'] != product_id]
+        product_rankings.remove(product_id)
+        stockout_forecaster.remove(product_id)
+        lot_index.remove_product(product)
+        stock_history.remove(product_id)
+    with profiling.phase('persistence'):
+        save_data(deletes=[product_id])
+        publish_change('delete', product_id)
     
     # Broadcast the deletion
-    broadcast_product_update(product_id, 'delete', {'id': product_id, 'name': product['name']})
+    with profiling.phase('broadcast'):
+        broadcast_product_update(product_id, 'delete', {'id': product_id, 'name': product['name']})
+    
+    with profiling.phase('serialization'):
+        return jsonify({
+            'success': True,
+            'message': 'Product deleted successfully'
+        })
+
+@app.route('/api/products/top', methods=['GET'])
+def get_top_products():
+    by = request.args.get('by', 'sales_count')
+    category = request.args.get('category')
+    try:
+        k = int(request.args.get('k', 10))
+    except ValueError:
+        k = 0
+    if by not in rankings.METRICS or not 1 <= k <= 1000:
+        return jsonify({
+            'success': False,
+            'message': f"Expected by={'|'.join(rankings.METRICS)} and k between 1 and 1000"
+        }), 400
+    
+    with profiling.phase('lookup'):
+        ranked = product_rankings.top(by, k, category)
+    with profiling.phase('serialization'):
+        return jsonify({
+            'success': True,
+            'data': [dict(product, rank_value=value) for product, value in ranked]
+        })
+
+@app.route('/api/products/<product_id>/history', methods=['GET'])
+def get_product_history(product_id):
+    if not any(p['id'] == product_id for p in products):
+        return jsonify({
+            'success': False,
+            'message': 'Product not found'
+        }), 404
+    try:
+        start = history.parse_time(request.args.get('from'))
+        end = history.parse_time(request.args.get('to'))
+        points = int(request.args.get('points', history.DEFAULT_POINTS))
+    except ValueError:
+        points = 0
+    if not 3 <= points <= history.MAX_POINTS:
+        return jsonify({
+            'success': False,
+            'message': f"Expected from/to as epoch seconds or ISO 8601 and points between 3 and {history.MAX_POINTS}"
+        }), 400
     
+    with profiling.phase('lookup'):
+        samples, series = stock_history.query(product_id, start, end, points)
+    with profiling.phase('serialization'):
+        return jsonify({
+            'success': True,
+            'data': {
+                'product_id': product_id,
+                'from': start,
+                'to': end,
+                'samples': samples,
+                'points': series
+            }
+        })
+
+@app.route('/api/forecast/stockouts', methods=['GET'])
+def get_stockout_forecast():
+    try:
+        within = float(request.args.get('within', 24))
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        within = limit = 0
+    if not 0 < within <= 8760 or not 1 <= limit <= 1000:
+        return jsonify({
+            'success': False,
+            'message': 'Expected within (hours) between 0 and 8760 and limit between 1 and 1000'
+        }), 400
+    
+    now = time.time()
+    with profiling.phase('lookup'):
+        projected = stockout_forecaster.stockouts(within, limit, now)
+    with profiling.phase('serialization'):
+        forecast_data = []
+        for product, hours, rate in projected:
+            stock, min_stock = float(product['current_stock']), float(product['min_stock_level'])
+            forecast_data.append({
+                'id': product['id'],
+                'name': product['name'],
+                'category': product.get('category'),
+                'unit': product.get('unit'),
+                'current_stock': product['current_stock'],
+                'min_stock_level': product['min_stock_level'],
+                'consumption_rate': round(rate, 4),
+                'hours_to_stockout': round(hours, 2),
+                'stockout_at': datetime.fromtimestamp(now + hours * 3600).isoformat(),
+                'hours_to_min_stock': round(max(0.0, stock - min_stock) / rate, 2) if rate else None
+            })
+        return jsonify({
+            'success': True,
+            'data': forecast_data
+        })
+
+# Finish a lot change of a product: update the indexes, save and broadcast it like update_product.
+# previous_stock is None for write-offs, which are not consumption.
+def commit_lot_change(product, old_product, description, previous_stock=None):
+    product['status'] = 'low_stock' if float(product['current_stock']) <= float(product['min_stock_level']) else 'active'
+    product['updated_at'] = datetime.now().isoformat()
+    product['version'] = product.get('version', 0) + 1
+    product_rankings.update(product, previous_stock=previous_stock)
+    stockout_forecaster.update(product, previous_stock=previous_stock)
+    stock_history.record(product['id'], product['current_stock'], previous=old_product['current_stock'])
+    
+    changes = changed_fields(old_product, product)
+    with profiling.phase('persistence'):
+        save_data(upserts=[product])
+        publish_change('update', product['id'], changes)
+    with profiling.phase('broadcast'):
+        broadcast_product_update(product['id'], 'update', product, changes=changes)
+        add_activity('update', product['id'], description, product['name'])
+
+@app.route('/api/products/<product_id>/lots', methods=['GET'])
+def get_product_lots(product_id):
+    product = next((p for p in products if p['id'] == product_id), None)
+    if not product:
+        return jsonify({
+            'success': False,
+            'message': 'Product not found'
+        }), 404
     return jsonify({
         'success': True,
-        'message': 'Product deleted successfully'
+        'data': product.get('lots', [])
     })
 
+@app.route('/api/products/<product_id>/lots', methods=['POST'])
+def receive_product_lot(product_id):
+    product = next((p for p in products if p['id'] == product_id), None)
+    if not product:
+        return jsonify({
+            'success': False,
+            'message': 'Product not found'
+        }), 404
+    data = request.get_json(silent=True) or {}
+    try:
+        lot = lots.new_lot(data.get('quantity'), data.get('expires_at'), data.get('received_at'))
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid lot: {e}'
+        }), 400
+    
+    with profiling.phase('mutation'):
+        old_product = product.copy()
+        lot_index.receive(product, lot)
+    expiry = f", expires {lot['expires_at'][:10]}" if lot['expires_at'] else ''
+    commit_lot_change(product, old_product, f"Received {lot['quantity']} {product['unit']}{expiry}")
+    
+    with profiling.phase('serialization'):
+        response = jsonify({
+            'success': True,
+            'data': product
+        })
+    # The new lot's URL, which is also where it is written off
+    response.headers['Location'] = f"/api/products/{product_id}/lots/{lot['id']}"
+    return response
+
+@app.route('/api/products/<product_id>/lots/<lot_id>', methods=['DELETE'])
+def discard_product_lot(product_id, lot_id):
+    product = next((p for p in products if p['id'] == product_id), None)
+    if not product:
+        return jsonify({
+            'success': False,
+            'message': 'Product not found'
+        }), 404
+    
+    with profiling.phase('mutation'):
+        old_product = product.copy()
+        lot = lot_index.discard(product, lot_id)
+    if lot is None:
+        return jsonify({
+            'success': False,
+            'message': 'Lot not found'
+        }), 404
+    commit_lot_change(product, old_product, f"Wrote off {lot['quantity']} {product['unit']} ({lot['id']})")
+    
+    with profiling.phase('serialization'):
+        return jsonify({
+            'success': True,
+            'data': product
+        })
+
+@app.route('/api/lots/expiring', methods=['GET'])
+def get_expiring_lots():
+    try:
+        days = float(request.args.get('days', 7))
+    except ValueError:
+        days = 0
+    if not 0 < days <= 365:
+        return jsonify({
+            'success': False,
+            'message': 'Expected days between 0 and 365'
+        }), 400
+    
+    now = time.time()
+    with profiling.phase('lookup'):
+        due = lot_index.expiring(days * 86400, now)
+    with profiling.phase('serialization'):
+        return jsonify({
+            'success': True,
+            'data': [dict(lot, product_id=product['id'], product_name=product['name'], unit=product['unit'],
+                          days_left=round((expiry - now) / 86400, 2), expired=expiry <= now)
+                     for expiry, product, lot in due]
+        })
+
 @app.route('/api/products/low-stock', methods=['GET'])
 def get_low_stock_products():
     low_stock_products = [p for p in products if p['status'] == 'low_stock']
@@ -355,6 +1009,30 @@ def get_product_stats():
         }
     })
 
+@app.route('/api/analytics', methods=['GET'])
+def get_analytics():
+    group_by = [field for field in request.args.get('group_by', ','.join(analytics.GROUP_FIELDS)).split(',') if field]
+    try:
+        buckets = int(request.args.get('buckets', 10))
+        top = int(request.args.get('top', 10))
+    except ValueError:
+        buckets = top = 0
+    if any(field not in analytics.GROUP_FIELDS for field in group_by) or not 1 <= buckets <= 100 \
+            or not 1 <= top <= 100:
+        return jsonify({
+            'success': False,
+            'message': f"Expected group_by from {','.join(analytics.GROUP_FIELDS)}, "
+                       f"buckets and top between 1 and 100"
+        }), 400
+    
+    with profiling.phase('aggregation'):
+        data = analytics.compute_analytics(products, group_by=group_by, buckets=buckets, top=top)
+    with profiling.phase('serialization'):
+        return jsonify({
+            'success': True,
+            'data': data
+        })
+
 @app.route('/api/dashboard/summary', methods=['GET'])
 def get_dashboard_summary():
     try:
@@ -470,6 +1148,263 @@ def get_sales_trends():
             'message': str(e)
         }), 500
 
+# Company-scoped routes: each company's products live in their own partition
+@contextmanager
+def company_partition(company_id, create=False):
+    tenant = tenant_registry.acquire(company_id, create=create)
+    try:
+        yield tenant
+    finally:
+        if tenant is not None:
+            tenant_registry.release(tenant)
+
+# Return an error response for an invalid or unknown company, else None
+def check_company(company_id, tenant=None, require_loaded=True):
+    if not tenants.valid_company_id(company_id):
+        return jsonify({
+            'success': False,
+            'message': 'Invalid company id'
+        }), 400
+    if require_loaded and tenant is None:
+        return jsonify({
+            'success': False,
+            'message': 'Company not found'
+        }), 404
+    return None
+
+@app.route('/api/companies', methods=['GET'])
+def get_companies():
+    companies = []
+    for company_id in tenant_registry.company_ids():
+        company = tenant_registry.company_info(company_id)
+        company['loaded'] = tenant_registry.is_loaded(company_id)
+        companies.append(company)
+    return jsonify({
+        'success': True,
+        'data': companies
+    })
+
+@app.route('/api/companies/<company_id>/products', methods=['GET'])
+def get_company_products(company_id):
+    denied = check_company(company_id, require_loaded=False)
+    if denied:
+        return denied
+    with company_partition(company_id) as tenant:
+        denied = check_company(company_id, tenant)
+        if denied:
+            return denied
+        # Writers change the products under the lock; serialize copies taken under it
+        with tenant.lock:
+            company_products = [dict(product) for product in tenant.products.values()]
+        with profiling.phase('serialization'):
+            return jsonify({
+                'success': True,
+                'data': company_products
+            })
+
+@app.route('/api/companies/<company_id>/products', methods=['POST'])
+def create_company_product(company_id):
+    denied = check_company(company_id, require_loaded=False)
+    if denied:
+        return denied
+    try:
+        data = request.json
+
+        for field in REQUIRED_PRODUCT_FIELDS:
+            if field not in data:
+                return jsonify({
+                    'success': False,
+                    'message': f'Missing required field: {field}'
+                }), 400
+
+        # The first product created for a company creates its partition
+        with company_partition(company_id, create=True) as tenant:
+            with tenant.lock:
+                with profiling.phase('mutation'):
+                    product = build_product(data)
+                    product['company_id'] = company_id
+                    tenant.put(product)
+                with profiling.phase('persistence'):
+                    save_data(upserts=[product], backend=tenant.storage)
+
+            with profiling.phase('broadcast'):
+                broadcast_product_update(product['id'], 'create', product, tenant)
+
+        with profiling.phase('serialization'):
+            return jsonify({
+                'success': True,
+                'data': product
+            })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@app.route('/api/companies/<company_id>/products/<product_id>', methods=['GET'])
+def get_company_product(company_id, product_id):
+    denied = check_company(company_id, require_loaded=False)
+    if denied:
+        return denied
+    with company_partition(company_id) as tenant:
+        denied = check_company(company_id, tenant)
+        if denied:
+            return denied
+        with tenant.lock:
+            product = tenant.get(product_id)
+            product = dict(product) if product else None
+        if product:
+            with profiling.phase('serialization'):
+                return jsonify({
+                    'success': True,
+                    'data': product
+                })
+    return jsonify({
+        'success': False,
+        'message': 'Product not found'
+    }), 404
+
+@app.route('/api/companies/<company_id>/products/<product_id>', methods=['PUT'])
+def update_company_product(company_id, product_id):
+    denied = check_company(company_id, require_loaded=False)
+    if denied:
+        return denied
+    try:
+        data = request.json
+        with company_partition(company_id) as tenant:
+            denied = check_company(company_id, tenant)
+            if denied:
+                return denied
+            with tenant.lock:
+                product = tenant.get(product_id)
+                if product is None:
+                    return jsonify({
+                        'success': False,
+                        'message': 'Product not found'
+                    }), 404
+                with profiling.phase('mutation'):
+                    old_product = product.copy()
+                    apply_product_changes(product, data)
+                    tenant.put(product, previous=old_product)
+                    changes = changed_fields(old_product, product)
+                with profiling.phase('persistence'):
+                    save_data(upserts=[product], backend=tenant.storage)
+
+            with profiling.phase('broadcast'):
+                broadcast_product_update(product_id, 'update', product, tenant, changes=changes)
+
+        with profiling.phase('serialization'):
+            return jsonify({
+                'success': True,
+                'data': product
+            })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@app.route('/api/companies/<company_id>/products/<product_id>', methods=['DELETE'])
+def delete_company_product(company_id, product_id):
+    denied = check_company(company_id, require_loaded=False)
+    if denied:
+        return denied
+    with company_partition(company_id) as tenant:
+        denied = check_company(company_id, tenant)
+        if denied:
+            return denied
+        with tenant.lock:
+            with profiling.phase('mutation'):
+                product = tenant.remove(product_id)
+            if product is None:
+                return jsonify({
+                    'success': False,
+                    'message': 'Product not found'
+                }), 404
+            with profiling.phase('persistence'):
+                save_data(deletes=[product_id], backend=tenant.storage)
+
+        with profiling.phase('broadcast'):
+            broadcast_product_update(product_id, 'delete', {'id': product_id, 'name': product['name']}, tenant)
+
+    return jsonify({
+        'success': True,
+        'message': 'Product deleted successfully'
+    })
+
+@app.route('/api/companies/<company_id>/products/stats', methods=['GET'])
+def get_company_stats(company_id):
+    denied = check_company(company_id, require_loaded=False)
+    if denied:
+        return denied
+    with company_partition(company_id) as tenant:
+        denied = check_company(company_id, tenant)
+        if denied:
+            return denied
+        # Aggregates are maintained on every write, so this does not scan the products
+        with tenant.lock:
+            stats = tenant.stats()
+        return jsonify({
+            'success': True,
+            'data': stats
+        })
+
+@app.route('/api/companies/<company_id>/activity', methods=['GET'])
+def get_company_activity(company_id):
+    denied = check_company(company_id, require_loaded=False)
+    if denied:
+        return denied
+    with company_partition(company_id) as tenant:
+        denied = check_company(company_id, tenant)
+        if denied:
+            return denied
+        with tenant.lock:
+            recent = tenant.activities[-10:][::-1]
+        return jsonify({
+            'success': True,
+            'data': recent
+        })
+
+# Unload company partitions that have not been used recently
+def evict_idle_tenants():
+    interval = max(1.0, min(60.0, tenant_registry.idle_seconds / 2))
+    while True:
+        time.sleep(interval)
+        try:
+            evicted = tenant_registry.evict_idle()
+        except Exception as e:
+            print(f"Error evicting idle companies: {e}")
+            continue
+        if evicted:
+            TENANT_EVICTIONS.inc(amount=len(evicted))
+            print(f"Unloaded idle companies: {', '.join(evicted)}")
+
+# Push expiry alerts as lots enter the warning window and again when they expire
+def watch_lot_expiry():
+    while True:
+        time.sleep(LOT_CHECK_INTERVAL)
+        try:
+            alerts = lot_index.due_alerts(EXPIRY_WARNING_HOURS * 3600)
+        except Exception as e:
+            print(f"Error checking lot expiry: {e}")
+            continue
+        for state, expiry, product, lot in alerts:
+            emit_event('expiry-alert', {
+                'state': state,
+                'product_id': product['id'],
+                'product_name': product['name'],
+                'lot_id': lot['id'],
+                'quantity': lot['quantity'],
+                'unit': product['unit'],
+                'expires_at': lot['expires_at'],
+                'timestamp': datetime.now().isoformat()
+            })
+            if state == 'expired':
+                add_activity('expiry', product['id'],
+                             f"Lot {lot['id']} ({lot['quantity']} {product['unit']}) expired", product['name'])
+
 # Initialize data
 def generate_initial_products():
     if not products:
@@ -488,21 +1423,33 @@ def generate_initial_products():
                 'cost_price': round(uniform(10, 50), 2),
                 'selling_price': round(uniform(50, 100), 2),
                 'description': f"Description for Product {i+1}",
-                'created_at': datetime.now().isoformat()
+                'created_at': datetime.now().isoformat(),
+                'version': 1
             }
             product['status'] = 'low_stock' if product['current_stock'] <= product['min_stock_level'] else 'active'
             products.append(product)
         
-        save_data()
+        product_rankings.rebuild(products)
+        stockout_forecaster.rebuild(products)
+        lot_index.rebuild(products)
+        for product in products:
+            stock_history.record(product['id'], product['current_stock'])
+        save_data(upserts=products)
 
 def periodic_updates():
+    interval = 3  # Update every 3 seconds
     while True:
         try:
-            generate_fake_update()
-            time.sleep(3)  # Update every 3 seconds
+            with profiling.profiled():
+                generate_fake_update()
         except Exception as e:
             print(f"Error in periodic updates: {e}")
-            time.sleep(3)  # Wait before retrying
+        # Measure how late the loop wakes up compared to the requested interval
+        sleep_start = time.perf_counter()
+        time.sleep(interval)
+        lag = max(0.0, time.perf_counter() - sleep_start - interval)
+        LOOP_LAG.observe(lag)
+        LOOP_LAST_LAG.set(lag)
 
 def generate_fake_update():
     global products
@@ -511,6 +1458,7 @@ def generate_fake_update():
     
     # Randomly select a product to update
     product = choice(products)
+    old_product = product.copy()
     old_stock = product['current_stock']
     
     # Randomly modify stock level
@@ -520,9 +1468,18 @@ def generate_fake_update():
     # Update status based on stock level
     old_status = product['status']
     product['status'] = 'low_stock' if float(product['current_stock']) <= float(product['min_stock_level']) else 'active'
+    product['updated_at'] = datetime.now().isoformat()
+    product['version'] = product.get('version', 0) + 1
+    lot_index.sync(product, old_stock)
+    product_rankings.update(product, previous_stock=old_stock)
+    stockout_forecaster.update(product, previous_stock=old_stock)
+    stock_history.record(product['id'], product['current_stock'], previous=old_stock)
+    # Everything that changed, including version and updated_at, so feed consumers stay in step
+    changes = changed_fields(old_product, product)
     
     # Save changes
-    save_data()
+    save_data(upserts=[product])
+    publish_change('update', product['id'], changes)
     
     # Create description
     description = ""
@@ -534,7 +1491,7 @@ def generate_fake_update():
         description = f"Product {product['name']} updated"
     
     # Broadcast the update
-    broadcast_product_update(product['id'], 'update', product)
+    broadcast_product_update(product['id'], 'update', product, changes=changes)
     
     # Add specific activity for stock change
     if stock_change != 0:
@@ -546,32 +1503,93 @@ def generate_fake_update():
         )
 
 if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Food Inventory Management System")
+    parser.add_argument("--fast", action="store_true", default=os.environ.get('FAST_START') == '1',
+                        help="Production fast start: skip package checks, boot-time activity fan-out and the debug reloader (or set FAST_START=1)")
+    parser.add_argument("--generate-data", action="store_true",
+                        help="In fast-start mode, generate sample data in-process if products.json is missing")
+    parser.add_argument("--change-feed", action="store_true", default=os.environ.get('CHANGE_FEED') == '1',
+                        help="Publish mutation events for 'db_sync.py --feed' (or set CHANGE_FEED=1)")
+    parser.add_argument("--storage", choices=storage_backends.BACKENDS, default=STORAGE_BACKEND,
+                        help="Storage backend for products (or set STORAGE_BACKEND)")
+    parser.add_argument("--trace", metavar="FILE", nargs="?", const="", default=os.environ.get('TRACE_FILE'),
+                        help="Record a load-test trace from startup, to FILE or data/traces/ (or set TRACE_FILE)")
+    parser.add_argument("--tenant-idle", type=float, default=TENANT_IDLE_SECONDS,
+                        help="Seconds before an unused company partition is unloaded (or set TENANT_IDLE_SECONDS)")
+    parser.add_argument("--socket-queue", type=int, default=SOCKET_QUEUE_SIZE,
+                        help="Events queued per Socket.IO client before it is told to resync, 0 to disable (or set SOCKET_QUEUE_SIZE)")
+    args = parser.parse_args()
+    
+    if args.storage != storage.name:
+        storage.close()
+        storage = storage_backends.create_backend(args.storage, DATA_DIR)
+    tenant_registry.storage_name = args.storage
+    tenant_registry.idle_seconds = args.tenant_idle
+    
     print("\n===============================================")
     print(" Food Inventory Management System")
     print("===============================================")
     
-    # Check and install required packages
-    check_and_install_requirements()
-    
-    # Run data generator if needed
-    run_data_generator_if_needed()
+    if args.fast:
+        print(" Fast-start mode")
+        data_file = os.path.join(DATA_DIR, 'products.json')
+        if args.generate_data and (not os.path.exists(data_file) or os.path.getsize(data_file) == 0):
+            generate_data_in_process()
+    else:
+        # Check and install required packages
+        check_and_install_requirements()
+        
+        # Run data generator if needed
+        run_data_generator_if_needed()
     
     # Load the data
-    data_loaded = load_initial_data()
+    print(f" Storage backend: {storage.name}")
+    data_loaded = load_initial_data(announce=not args.fast)
     
     # Generate initial data only if none was loaded
     if not data_loaded or len(products) == 0:
         print("Generating initial product data...")
         generate_initial_products()
     
+    if args.change_feed and storage.name == 'mongo':
+        # The mongo backend already writes the products collection the feed consumer would write
+        print(" Change feed disabled: the mongo storage backend writes to MongoDB directly")
+    elif args.change_feed:
+        import change_feed as change_feed_module
+        change_feed = change_feed_module.ChangeFeedWriter(snapshot=snapshot_products)
+        print(f" Publishing changes to {change_feed.directory}")
+    
+    if args.trace is not None:
+        trace = trace_recorder.TraceRecorder(args.trace or None)
+        atexit.register(lambda: trace.close() if trace is not None else None)
+        print(f" Recording trace to {trace.path}")
+    
     # Start periodic updates in a background thread
     update_thread = threading.Thread(target=periodic_updates, daemon=True)
     update_thread.start()
     
+    if args.socket_queue > 0:
+        outbound_queues = outbound.OutboundQueues(socketio, max_queue=args.socket_queue)
+        outbound_queues.start()
+    
+    # Unload idle company partitions in the background
+    eviction_thread = threading.Thread(target=evict_idle_tenants, daemon=True)
+    eviction_thread.start()
+    
+    # Announce lots that are about to expire or have expired
+    expiry_thread = threading.Thread(target=watch_lot_expiry, daemon=True)
+    expiry_thread.start()
+    
+    ready = time.perf_counter() - BOOT_STARTED
+    STARTUP_READY.set(ready)
+    
     print("\n===============================================")
     print(" Starting server...")
+    print(f" Startup took {ready:.3f}s")
     print(" Access the application at http://localhost:5000")
     print("===============================================\n")
     
-    # Run the Flask app
-    socketio.run(app, debug=True, port=5000) 
\ No newline at end of file
+    # Run the Flask app (the debug reloader re-executes the whole startup, so it is off in fast-start mode)
+    socketio.run(app, debug=not args.fast, port=5000, allow_unsafe_werkzeug=args.fast)
\ No newline at end of file
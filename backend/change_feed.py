@@ -0,0 +1,291 @@
+"""
+Append-only change feed between the app and the MongoDB sync worker.
+
+The app publishes structured mutation events (create, update and delete with
+the changed fields) instead of making db_sync re-read products.json. Events
+are written as JSON lines to numbered segment files in FEED_DIR:
+
+    changes-000001.jsonl, changes-000002.jsonl, ...
+
+Each line is ``{"seq": 1, "type": "update", "id": "7", "fields": {...},
+"timestamp": "..."}``. A ``resync`` event tells the consumer to fall back to a
+full diff sync; it is written when events had to be dropped. When the writer
+was given a ``snapshot`` callable, the app's products are written next to the
+segments as ``snapshot-<seq>.jsonl`` and the event names that file in
+``fields["snapshot"]``, so the consumer resyncs from the app's own state
+whatever storage backend it uses.
+
+Backpressure: ``publish`` puts events on a bounded queue drained by a writer
+thread, and never waits: when the queue is full the event is dropped and a
+``resync`` is recorded, so API requests never stall on the feed. When the
+consumer's unread backlog exceeds ``max_backlog_bytes`` the writer thread stops
+appending until the consumer catches up; the queue then fills up and further
+events are dropped the same way.
+
+The consumer keeps a durable offset (segment number and byte offset) in
+``OFFSET_FILE`` so a restarted sync worker resumes where it stopped. Fully
+consumed segments are deleted.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+FEED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "feed")
+OFFSET_FILE = "consumer.offset"
+SEGMENT_PREFIX = "changes-"
+SEGMENT_SUFFIX = ".jsonl"
+SNAPSHOT_PREFIX = "snapshot-"
+
+
+def segment_name(number):
+    return f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}"
+
+
+def snapshot_name(seq):
+    return f"{SNAPSHOT_PREFIX}{seq:06d}{SEGMENT_SUFFIX}"
+
+
+def list_segments(directory, prefix=SEGMENT_PREFIX):
+    """Return the sorted segment (or snapshot) numbers present in the feed directory"""
+    numbers = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return numbers
+    for name in names:
+        if name.startswith(prefix) and name.endswith(SEGMENT_SUFFIX):
+            try:
+                numbers.append(int(name[len(prefix):-len(SEGMENT_SUFFIX)]))
+            except ValueError:
+                continue
+    return sorted(numbers)
+
+
+def read_offset(directory):
+    """Read the consumer's committed position as (segment, offset, seq)"""
+    try:
+        with open(os.path.join(directory, OFFSET_FILE), "r") as f:
+            data = json.load(f)
+        return data["segment"], data["offset"], data.get("seq", 0)
+    except (FileNotFoundError, ValueError, KeyError):
+        segments = list_segments(directory)
+        return (segments[0] if segments else 1), 0, 0
+
+
+class ChangeFeedWriter:
+    """Producer side of the change feed, used by the app.
+
+    ``snapshot`` returns the app's current products; it is called from the
+    writer thread when a resync has to be written.
+    """
+
+    def __init__(self, directory=FEED_DIR, snapshot=None, max_queue=10000,
+                 segment_bytes=16 * 1024 * 1024, max_backlog_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.snapshot = snapshot
+        self.segment_bytes = segment_bytes
+        self.max_backlog_bytes = max_backlog_bytes
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.published = 0
+        self._resync_needed = False
+        os.makedirs(directory, exist_ok=True)
+
+        segments = list_segments(directory)
+        self.segment = segments[-1] if segments else 1
+        self.seq = self._last_seq(self.segment)
+        self._file = open(os.path.join(directory, segment_name(self.segment)), "a", encoding="utf-8")
+
+        self._thread = threading.Thread(target=self._run, name="change-feed-writer", daemon=True)
+        self._thread.start()
+
+    def _last_seq(self, segment):
+        """Recover the last sequence number written to a segment"""
+        path = os.path.join(self.directory, segment_name(segment))
+        last = read_offset(self.directory)[2]
+        try:
+            with open(path, "rb") as f:
+                for line in f:
+                    if line.endswith(b"\n"):
+                        try:
+                            last = max(last, json.loads(line)["seq"])
+                        except (ValueError, KeyError):
+                            continue
+        except FileNotFoundError:
+            pass
+        return last
+
+    def publish(self, event_type, product_id, fields=None):
+        """Queue a mutation event without waiting; returns False if it had to be dropped"""
+        event = {
+            "type": event_type,
+            "id": product_id,
+            "fields": fields or {},
+            "timestamp": datetime.now().isoformat()
+        }
+        try:
+            self.queue.put_nowait(event)
+            self.published += 1
+            return True
+        except queue.Full:
+            self.dropped += 1
+            self._resync_needed = True
+            logging.warning(f"Change feed is full; dropped {event_type} event for product {product_id}")
+            return False
+
+    def backlog_bytes(self):
+        """Bytes written to the feed but not yet consumed"""
+        segment, offset, _ = read_offset(self.directory)
+        total = 0
+        for number in list_segments(self.directory):
+            if number < segment:
+                continue
+            try:
+                size = os.path.getsize(os.path.join(self.directory, segment_name(number)))
+            except FileNotFoundError:
+                continue
+            total += size - offset if number == segment else size
+        return total
+
+    def _wait_for_consumer(self):
+        """Hold back writes while the consumer is too far behind"""
+        warned = False
+        while self.backlog_bytes() > self.max_backlog_bytes:
+            if not warned:
+                logging.warning("Change feed consumer is behind; pausing writes")
+                warned = True
+            time.sleep(0.1)
+
+    def _write_snapshot(self, seq):
+        """Write the app's products as JSON Lines for a resync; returns the file name"""
+        name = snapshot_name(seq)
+        path = os.path.join(self.directory, name)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            products = self.snapshot()
+            for product in products:
+                f.write(json.dumps(product, separators=(",", ":")) + "\n")
+            if not products:
+                # An empty file reads as a bad snapshot; an empty array is an empty catalogue
+                f.write("[]\n")
+        os.replace(temp_path, path)
+        return name
+
+    def _write(self, events):
+        lines = []
+        for event in events:
+            self.seq += 1
+            event["seq"] = self.seq
+            if event["type"] == "resync" and self.snapshot is not None:
+                event["fields"] = {"snapshot": self._write_snapshot(self.seq)}
+            lines.append(json.dumps(event, separators=(",", ":")))
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        if self._file.tell() >= self.segment_bytes:
+            self._file.close()
+            self.segment += 1
+            self._file = open(os.path.join(self.directory, segment_name(self.segment)), "a", encoding="utf-8")
+
+    def _run(self):
+        while True:
+            events = [self.queue.get()]
+            # Drain whatever else is queued so events are written in batches
+            while len(events) < 1000:
+                try:
+                    events.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self._resync_needed:
+                self._resync_needed = False
+                events.append({"type": "resync", "id": None, "fields": {},
+                               "timestamp": datetime.now().isoformat()})
+            self._wait_for_consumer()
+            try:
+                self._write(events)
+            except Exception as e:
+                logging.error(f"Error writing change feed: {e}")
+                self._resync_needed = True
+
+
+class ChangeFeedReader:
+    """Consumer side of the change feed, used by db_sync"""
+
+    def __init__(self, directory=FEED_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.segment, self.offset, self.seq = read_offset(directory)
+
+    def read_batch(self, max_events=1000):
+        """Read up to max_events complete events after the current position.
+
+        Returns (events, position); pass position to commit() once the events
+        have been applied. A trailing line without a newline is still being
+        written and is left for the next read.
+        """
+        events = []
+        segment, offset = self.segment, self.offset
+        while len(events) < max_events:
+            path = os.path.join(self.directory, segment_name(segment))
+            try:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        offset += len(line)
+                        try:
+                            events.append(json.loads(line))
+                        except ValueError:
+                            logging.error(f"Skipping corrupt change feed entry in {path} at offset {offset}")
+                            continue
+                        if len(events) >= max_events:
+                            break
+            except FileNotFoundError:
+                pass
+            if len(events) >= max_events:
+                break
+            # Move on to the next segment only once the writer has rotated past this one
+            later = [number for number in list_segments(self.directory) if number > segment]
+            if not later:
+                break
+            try:
+                if offset < os.path.getsize(path):
+                    break
+            except FileNotFoundError:
+                pass
+            segment, offset = later[0], 0
+        seq = events[-1].get("seq", self.seq) if events else self.seq
+        return events, (segment, offset, seq)
+
+    def snapshot_path(self, event):
+        """Path of the snapshot a resync event refers to, or None when it has none"""
+        name = event.get("fields", {}).get("snapshot")
+        return os.path.join(self.directory, os.path.basename(name)) if name else None
+
+    def commit(self, position):
+        """Durably record the position and delete fully consumed segments and snapshots"""
+        self.segment, self.offset, self.seq = position
+        path = os.path.join(self.directory, OFFSET_FILE)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"segment": self.segment, "offset": self.offset, "seq": self.seq}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        for number in list_segments(self.directory):
+            if number < self.segment:
+                try:
+                    os.remove(os.path.join(self.directory, segment_name(number)))
+                except FileNotFoundError:
+                    pass
+        for number in list_segments(self.directory, SNAPSHOT_PREFIX):
+            if number <= self.seq:
+                try:
+                    os.remove(os.path.join(self.directory, snapshot_name(number)))
+                except FileNotFoundError:
+                    pass
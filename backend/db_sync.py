@@ -1,10 +1,20 @@
+import argparse
 import json
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne, UpdateOne, DeleteOne, DeleteMany
+from pymongo.errors import BulkWriteError
 import logging
 import hashlib
+import zlib
+
+from file_watcher import create_watcher, file_signature
+from change_feed import ChangeFeedReader, SEGMENT_PREFIX
+from product_stream import iter_products, chunked, READ_SIZE
+from mongo_queries import ensure_indexes
 
 # Setup logging
 logging.basicConfig(
@@ -17,18 +27,75 @@ MONGO_URI = "mongodb://localhost:27017/"
 DB_NAME = "neunatics_db"
 COLLECTION_NAME = "products"
 
+# Maximum number of operations sent in one bulk_write call
+BULK_BATCH_SIZE = 1000
+
+# Fields added by the sync itself, excluded from the product content hash
+SYNC_FIELDS = ("_id", "last_synced", "content_hash")
+
+# Quiet period after the last write event before a change is synced
+DEBOUNCE_SECONDS = 0.05
+
+# Upper bound on how long a continuous burst of writes can delay a sync
+MAX_DEBOUNCE_SECONDS = 1.0
+
+# Number of hash buckets product ids (or categories) are spread over for sharded sync
+PARTITION_BUCKETS = 64
+
+# Product fields a sharded sync can partition on
+PARTITION_KEYS = ("id", "category")
+
+# Content hash of each product as last written to MongoDB, keyed by product id.
+# None means the state has not been loaded from the collection yet.
+synced_hashes = None
+
+# Partition of the catalogue this process syncs; None means every product
+partition = None
+
+# Counts and timing of the last completed sync
+last_sync_stats = {}
+
+# The app's storage backend; with "mongo" the app writes the products collection itself
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+
 # Path to products.json file
 PRODUCTS_JSON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "products.json")
 
-def connect_to_mongodb():
+def partition_bucket(value):
+    """Stable bucket of a partition key value (Python's hash() differs per process)"""
+    return zlib.crc32(str(value).encode("utf-8")) % PARTITION_BUCKETS
+
+def parse_buckets(spec):
+    """Parse a bucket list such as "0-15,32,40-47" """
+    buckets = set()
+    for part in spec.split(","):
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        buckets.update(range(int(start), int(end or start) + 1))
+    return buckets
+
+class Partition:
+    """The buckets of the catalogue one sync worker owns"""
+    
+    def __init__(self, buckets, key="id"):
+        if key not in PARTITION_KEYS:
+            raise ValueError(f"Unknown partition key: {key} (expected one of {', '.join(PARTITION_KEYS)})")
+        self.buckets = frozenset(buckets)
+        self.key = key
+    
+    def owns(self, product):
+        return partition_bucket(product.get(self.key)) in self.buckets
+
+def connect_to_mongodb(max_pool_size=100):
     """Establish connection to MongoDB"""
     try:
-        client = MongoClient(MONGO_URI)
+        client = MongoClient(MONGO_URI, maxPoolSize=max_pool_size)
         db = client[DB_NAME]
         products_collection = db[COLLECTION_NAME]
         
-        # Create index on product ID for faster lookups
-        products_collection.create_index("id", unique=True)
+        # Create the declared indexes (id, sku, status, category+status, sales_count)
+        ensure_indexes(products_collection)
         
         logging.info(f"Successfully connected to MongoDB: {DB_NAME}.{COLLECTION_NAME}")
         return client, products_collection
@@ -36,49 +103,205 @@ def connect_to_mongodb():
         logging.error(f"Failed to connect to MongoDB: {e}")
         raise
 
-def get_file_hash(file_path):
-    """Calculate MD5 hash of file contents"""
+def get_file_hash(file_path, read_size=READ_SIZE):
+    """Calculate MD5 hash of file contents, reading it in blocks"""
+    file_hash = hashlib.md5()
     with open(file_path, 'rb') as f:
-        file_hash = hashlib.md5(f.read()).hexdigest()
-    return file_hash
+        for block in iter(lambda: f.read(read_size), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
 
-def load_products_from_json():
-    """Load products from JSON file"""
-    try:
-        with open(PRODUCTS_JSON_PATH, 'r') as file:
-            products = json.load(file)
-        return products
-    except Exception as e:
-        logging.error(f"Error loading products from JSON: {e}")
-        return None
+def load_products_from_json(file_path=None):
+    """Stream products from a JSON array or JSON Lines file"""
+    return iter_products(file_path or PRODUCTS_JSON_PATH)
 
-def sync_products_to_mongodb(products_collection):
-    """Synchronize products from JSON file to MongoDB"""
-    products = load_products_from_json()
-    if not products:
-        return False
+def validate_product_file(file_path=None):
+    """Parse a whole product file without keeping it; returns the product count, ValueError if invalid"""
+    count = 0
+    for product in load_products_from_json(file_path):
+        if not isinstance(product, dict) or "id" not in product:
+            raise ValueError(f"Product entry {count + 1} has no id")
+        count += 1
+    return count
+
+def get_product_hash(product):
+    """Calculate a stable MD5 hash of a product's content"""
+    content = {key: value for key, value in product.items() if key not in SYNC_FIELDS}
+    return hashlib.md5(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def load_synced_hashes(products_collection):
+    """Read the content hash of every product already stored in MongoDB"""
+    hashes = {}
+    projection = {"_id": 0, "id": 1, "content_hash": 1}
+    if partition is not None:
+        projection[partition.key] = 1
+    for document in products_collection.find({}, projection):
+        if partition is None or partition.owns(document):
+            hashes[document["id"]] = document.get("content_hash")
+    return hashes
+
+def compute_sync_operations(products, hashes, new_hashes, counts, now):
+    """Diff a chunk of products against the last synced hashes.
+
+    Records each product's hash in new_hashes, bumps the inserted/updated
+    counts and returns the bulk write operations for the chunk.
+    """
+    operations = []
+    for product in products:
+        product_id = product["id"]
+        product_hash = get_product_hash(product)
+        new_hashes[product_id] = product_hash
+        if product_id in hashes and hashes[product_id] == product_hash:
+            continue
+        
+        counts["updated" if product_id in hashes else "inserted"] += 1
+        document = dict(product, last_synced=now, content_hash=product_hash)
+        document.pop("_id", None)
+        operations.append(ReplaceOne({"id": product_id}, document, upsert=True))
+    return operations
+
+def compute_delete_operations(hashes, new_hashes, counts):
+    """Return operations deleting products that are no longer present"""
+    if not new_hashes and hashes:
+        # A scan that found nothing would delete everything; treat it as a bad read instead
+        logging.warning(f"No products scanned; not deleting the {len(hashes)} synced products")
+        counts["deleted"] = 0
+        return []
+    deleted_ids = [product_id for product_id in hashes if product_id not in new_hashes]
+    counts["deleted"] = len(deleted_ids)
+    operations = []
+    for start in range(0, len(deleted_ids), BULK_BATCH_SIZE):
+        batch = deleted_ids[start:start + BULK_BATCH_SIZE]
+        query = {"id": {"$in": batch}}
+        if partition is not None:
+            # A product that moved to another shard's partition may already have
+            # been rewritten by that shard; only delete the version this shard wrote
+            query["content_hash"] = {"$in": list({hashes[product_id] for product_id in batch})}
+        operations.append(DeleteMany(query))
+    return operations
+
+def apply_bulk_operations(products_collection, operations, batch_size=BULK_BATCH_SIZE, ordered=False):
+    """Apply operations through bulk_write calls of bounded size (unordered by default)"""
+    for start in range(0, len(operations), batch_size):
+        products_collection.bulk_write(operations[start:start + batch_size], ordered=ordered)
+
+class BulkWriter:
+    """Send bulk_write batches, optionally from a pool of worker threads.
+
+    At most two batches per worker are in flight, so a fast reader cannot
+    queue up an unbounded number of pending operations.
+    """
+    
+    def __init__(self, products_collection, workers=1):
+        self.products_collection = products_collection
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        self.slots = threading.BoundedSemaphore(workers * 2)
+        self.futures = []
+    
+    def submit(self, operations):
+        if not operations:
+            return
+        if self.executor is None:
+            self.products_collection.bulk_write(operations, ordered=False)
+            return
+        self.slots.acquire()
+        future = self.executor.submit(self.products_collection.bulk_write, operations, ordered=False)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures.append(future)
+        # Surface errors early and drop references to finished batches
+        done = [f for f in self.futures if f.done()]
+        self.futures = [f for f in self.futures if not f.done()]
+        for f in done:
+            f.result()
     
+    def close(self):
+        if self.executor is None:
+            return
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.executor.shutdown(wait=True)
+
+def sync_products_to_mongodb(products_collection, products=None, file_path=None,
+                             chunk_size=BULK_BATCH_SIZE, workers=1):
+    """Synchronize products from JSON file to MongoDB.
+
+    Products are streamed from the file and diffed in chunks of chunk_size.
+    Only products whose content hash differs from the last synced state are
+    written, so the cost scales with the number of changed products and peak
+    memory stays flat regardless of file size. With workers > 1 the chunks
+    are written by parallel bulk_write calls.
+    
+    A file is parsed in full before anything is written, so a truncated or
+    corrupt file is rejected as a whole instead of being applied in part.
+    """
+    global synced_hashes, last_sync_stats
+    
+    started = time.perf_counter()
     try:
-        # First clear the collection
-        products_collection.delete_many({})
+        if products is None:
+            validate_product_file(file_path)
+            products = load_products_from_json(file_path)
+        if partition is not None:
+            products = (product for product in products if partition.owns(product))
         
-        # Insert all products with a sync timestamp
-        for product in products:
-            product["last_synced"] = datetime.now().isoformat()
+        if synced_hashes is None:
+            synced_hashes = load_synced_hashes(products_collection)
         
-        # Insert all products
-        result = products_collection.insert_many(products)
-        logging.info(f"Synchronized {len(result.inserted_ids)} products to MongoDB")
+        now = datetime.now().isoformat()
+        new_hashes = {}
+        counts = {"inserted": 0, "updated": 0, "deleted": 0}
+        writer = BulkWriter(products_collection, workers)
+        try:
+            for chunk in chunked(products, chunk_size):
+                writer.submit(compute_sync_operations(chunk, synced_hashes, new_hashes, counts, now))
+            for operation_batch in chunked(compute_delete_operations(synced_hashes, new_hashes, counts), chunk_size):
+                writer.submit(operation_batch)
+        finally:
+            writer.close()
+        if new_hashes or not synced_hashes:
+            # An empty scan deleted nothing, so the last synced state still stands
+            synced_hashes = new_hashes
+        
+        elapsed = time.perf_counter() - started
+        last_sync_stats = dict(counts, scanned=len(new_hashes), seconds=elapsed)
+        changed = counts["inserted"] + counts["updated"] + counts["deleted"]
+        if not changed:
+            logging.info("MongoDB already up to date")
+            return True
+        
+        logging.info(
+            f"Synchronized products to MongoDB: {counts['inserted']} inserted, "
+            f"{counts['updated']} updated, {counts['deleted']} deleted "
+            f"({len(new_hashes)} scanned in {elapsed:.2f}s, {len(new_hashes) / max(elapsed, 1e-9):.0f} products/s)"
+        )
         return True
+    except ValueError as e:
+        # Only reached when the file changed after it was validated; reload the state on the next sync
+        synced_hashes = None
+        logging.warning(f"Product file is incomplete or invalid, not syncing it: {e}")
+        return False
+    except BulkWriteError as e:
+        # Some operations may have been applied; reload the state on the next sync
+        synced_hashes = None
+        logging.error(f"Bulk write errors while syncing products to MongoDB: {e.details.get('writeErrors', [])[:3]}")
+        return False
     except Exception as e:
+        synced_hashes = None
         logging.error(f"Error syncing products to MongoDB: {e}")
         return False
 
 def update_existing_product(products_collection, product):
     """Update a single product in MongoDB"""
     try:
+        product_hash = get_product_hash(product)
         product["last_synced"] = datetime.now().isoformat()
+        product["content_hash"] = product_hash
         result = products_collection.replace_one({"id": product["id"]}, product, upsert=True)
+        if synced_hashes is not None:
+            synced_hashes[product["id"]] = product_hash
         if result.modified_count > 0:
             logging.info(f"Updated product {product['id']} in MongoDB")
         elif result.upserted_id:
@@ -88,38 +311,233 @@ def update_existing_product(products_collection, product):
         logging.error(f"Error updating product {product['id']}: {e}")
         return False
 
-def monitor_json_file(products_collection):
-    """Monitor products.json file for changes and update MongoDB accordingly"""
-    last_hash = get_file_hash(PRODUCTS_JSON_PATH)
+def stable_file_hash(file_path):
+    """Hash a file in blocks, returning None if it changed while being read"""
+    before = file_signature(file_path)
+    if before is None:
+        return None
+    try:
+        file_hash = get_file_hash(file_path)
+    except FileNotFoundError:
+        return None
+    if file_signature(file_path) != before:
+        return None
+    return file_hash
+
+def report_shard_status(shard, signature, initial=False):
+    """Log a machine-readable status line for the sharded sync coordinator.
+
+    lag is the time from the file write to this shard's sync completing; it is
+    not meaningful for the initial sync, where the file may be arbitrarily old.
+    """
+    if signature is None:
+        return
+    file_mtime = signature[0] / 1e9
+    status = dict(last_sync_stats, shard=shard, file_mtime=file_mtime,
+                  lag=None if initial else max(0.0, time.time() - file_mtime))
+    logging.info(f"shard-status {json.dumps(status)}")
+
+def sync_file_if_changed(products_collection, last_signature, last_hash, workers=1, shard=None, file_path=None):
+    """Sync products.json if its content changed since the last sync.
+
+    The stat signature is compared first so unchanged files are never hashed.
+    The file is hashed and then diff-synced as a stream of bounded chunks, so
+    memory stays flat whatever its size. Half-written files (which change
+    while being read or fail to parse) are retried once the writer finishes,
+    and nothing from them is written.
+    Returns the new (signature, hash).
+    """
+    file_path = file_path or PRODUCTS_JSON_PATH
+    signature = file_signature(file_path)
+    if signature is None or signature == last_signature:
+        return last_signature, last_hash
     
-    while True:
-        try:
-            # Sleep to avoid high CPU usage
-            time.sleep(1)
+    current_hash = stable_file_hash(file_path)
+    if current_hash is None:
+        logging.debug("products.json is still being written; waiting")
+        return last_signature, last_hash
+    if current_hash == last_hash:
+        return signature, last_hash
+    
+    logging.info("Detected change in products.json")
+    if not sync_products_to_mongodb(products_collection, file_path=file_path, workers=workers):
+        return last_signature, last_hash
+    if file_signature(file_path) != signature:
+        # Rewritten while it was being synced; the next change event syncs it again
+        return last_signature, last_hash
+    if shard is not None:
+        report_shard_status(shard, signature)
+    return signature, current_hash
+
+def monitor_json_file(products_collection, workers=1, shard=None, file_path=None, stop=None):
+    """Monitor products.json file for changes and update MongoDB accordingly.
+
+    Runs until interrupted, or until the stop event is set when one is given.
+    """
+    file_path = file_path or PRODUCTS_JSON_PATH
+    watcher = create_watcher(file_path)
+    logging.info(f"Watching products.json using {watcher.name}")
+    
+    last_signature = file_signature(file_path)
+    last_hash = get_file_hash(file_path)
+    
+    try:
+        while stop is None or not stop.is_set():
+            try:
+                # Sleep until the file is touched
+                if not watcher.wait(None if stop is None else 0.5):
+                    continue
+                
+                # Debounce bursts of writes, but never delay longer than MAX_DEBOUNCE_SECONDS
+                deadline = time.monotonic() + MAX_DEBOUNCE_SECONDS
+                while watcher.wait(min(DEBOUNCE_SECONDS, max(0.0, deadline - time.monotonic()))):
+                    if time.monotonic() >= deadline:
+                        break
+                
+                last_signature, last_hash = sync_file_if_changed(products_collection, last_signature, last_hash,
+                                                                 workers=workers, shard=shard, file_path=file_path)
+            except Exception as e:
+                logging.error(f"Error monitoring file: {e}")
+                # Wait before trying again
+                time.sleep(5)
+    finally:
+        watcher.close()
+
+def feed_event_operation(event, now):
+    """Translate one change-feed event into a bulk write operation"""
+    product_id = event["id"]
+    if event["type"] == "create":
+        product_hash = get_product_hash(event["fields"])
+        if synced_hashes is not None:
+            synced_hashes[product_id] = product_hash
+        document = dict(event["fields"], last_synced=now, content_hash=product_hash)
+        return ReplaceOne({"id": product_id}, document, upsert=True)
+    if event["type"] == "update":
+        # The stored content hash no longer matches; a later diff sync rewrites it
+        if synced_hashes is not None and product_id in synced_hashes:
+            synced_hashes[product_id] = None
+        return UpdateOne(
+            {"id": product_id},
+            {"$set": dict(event["fields"], last_synced=now), "$unset": {"content_hash": ""}}
+        )
+    if event["type"] == "delete":
+        if synced_hashes is not None:
+            synced_hashes.pop(product_id, None)
+        return DeleteOne({"id": product_id})
+    logging.warning(f"Ignoring unknown change feed event type: {event['type']}")
+    return None
+
+def apply_feed_events(products_collection, events, reader=None):
+    """Apply change-feed events as batched, ordered bulk writes.
+
+    Ordered writes keep create/update/delete sequences for the same product
+    correct. A resync event falls back to a full diff sync from the snapshot
+    of the app's products written with it (products.json only for events
+    from a writer without a snapshot).
+    """
+    global synced_hashes
+    
+    now = datetime.now().isoformat()
+    operations = []
+    try:
+        for event in events:
+            if event["type"] == "resync":
+                apply_bulk_operations(products_collection, operations, ordered=True)
+                operations = []
+                snapshot = reader.snapshot_path(event) if reader is not None else None
+                logging.info(f"Change feed requested a full resync from {snapshot or 'products.json'}")
+                if not sync_products_to_mongodb(products_collection, file_path=snapshot):
+                    return False
+                continue
+            operation = feed_event_operation(event, now)
+            if operation is not None:
+                operations.append(operation)
+        apply_bulk_operations(products_collection, operations, ordered=True)
+        return True
+    except Exception as e:
+        synced_hashes = None
+        logging.error(f"Error applying change feed events: {e}")
+        return False
+
+def consume_change_feed(products_collection, reader=None, batch_size=BULK_BATCH_SIZE):
+    """Apply events from the app's change feed as they are published"""
+    reader = reader or ChangeFeedReader()
+    watcher = create_watcher(reader.directory, prefix=SEGMENT_PREFIX)
+    logging.info(f"Consuming change feed from {reader.directory} (seq {reader.seq}) using {watcher.name}")
+    
+    try:
+        while True:
+            events, position = reader.read_batch(batch_size)
+            if not events:
+                if position[:2] != (reader.segment, reader.offset):
+                    # Moved past a fully consumed segment
+                    reader.commit(position)
+                    continue
+                watcher.wait()
+                continue
             
-            # Check if file has changed
-            current_hash = get_file_hash(PRODUCTS_JSON_PATH)
-            if current_hash != last_hash:
-                logging.info("Detected change in products.json")
-                sync_products_to_mongodb(products_collection)
-                last_hash = current_hash
-        except Exception as e:
-            logging.error(f"Error monitoring file: {e}")
-            # Wait before trying again
-            time.sleep(5)
+            if apply_feed_events(products_collection, events, reader):
+                reader.commit(position)
+                logging.info(f"Applied {len(events)} change feed events (seq {position[2]})")
+            else:
+                # Retry the same batch after a pause
+                time.sleep(5)
+    finally:
+        watcher.close()
 
 def main():
     """Main function to start MongoDB synchronization"""
+    parser = argparse.ArgumentParser(description="Synchronize products to MongoDB")
+    parser.add_argument("--feed", action="store_true",
+                        help="Consume the app's change feed instead of watching products.json")
+    parser.add_argument("--load", metavar="FILE",
+                        help="Bulk load FILE (JSON array or JSON Lines) into MongoDB and exit")
+    parser.add_argument("--chunk-size", type=int, default=BULK_BATCH_SIZE,
+                        help="Products per bulk_write batch when loading")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Parallel bulk_write workers (loading and file sync)")
+    parser.add_argument("--shard", help="Name of this sync worker when the catalogue is sharded")
+    parser.add_argument("--buckets", help=f"Partition buckets this worker owns, e.g. 0-15 (of {PARTITION_BUCKETS})")
+    parser.add_argument("--partition-key", choices=PARTITION_KEYS, default="id",
+                        help="Product field hashed into partition buckets")
+    args = parser.parse_args()
+    
+    global partition
+    if args.buckets is not None:
+        if args.feed:
+            parser.error("--buckets cannot be combined with --feed: the change feed has a single consumer")
+        partition = Partition(parse_buckets(args.buckets), args.partition_key)
+        logging.info(f"Shard {args.shard or args.buckets} owns {len(partition.buckets)} of "
+                     f"{PARTITION_BUCKETS} buckets by {args.partition_key}")
+    
     try:
-        client, products_collection = connect_to_mongodb()
+        client, products_collection = connect_to_mongodb(max_pool_size=max(10, args.workers * 2))
+        
+        if args.load:
+            logging.info(f"Bulk loading {args.load}...")
+            sync_products_to_mongodb(products_collection, file_path=args.load,
+                                     chunk_size=args.chunk_size, workers=args.workers)
+            return
+        
+        if STORAGE_BACKEND == "mongo":
+            # Syncing products.json would overwrite the app's writes with a stale file
+            logging.info(f"STORAGE_BACKEND=mongo: the app writes {DB_NAME}.{COLLECTION_NAME} directly; "
+                         "not syncing products.json")
+            return
         
         # Initial sync
         logging.info("Performing initial synchronization...")
-        sync_products_to_mongodb(products_collection)
+        sync_products_to_mongodb(products_collection, workers=args.workers)
+        if args.shard is not None:
+            report_shard_status(args.shard, file_signature(PRODUCTS_JSON_PATH), initial=True)
         
-        # Start monitoring for changes
-        logging.info("Starting real-time monitoring of products.json...")
-        monitor_json_file(products_collection)
+        if args.feed:
+            logging.info("Starting change feed consumer...")
+            consume_change_feed(products_collection)
+        else:
+            # Start monitoring for changes
+            logging.info("Starting real-time monitoring of products.json...")
+            monitor_json_file(products_collection, workers=args.workers, shard=args.shard)
     except KeyboardInterrupt:
         logging.info("Process interrupted. Shutting down...")
     except Exception as e:
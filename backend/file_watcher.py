@@ -0,0 +1,165 @@
+"""
+File change watchers used by db_sync.
+
+``InotifyWatcher`` uses the Linux inotify API through ctypes, so it sleeps
+until the kernel reports a write, close or rename affecting the watched file.
+``PollingWatcher`` is the portable fallback; it only compares ``os.stat``
+results (mtime, size and inode), which costs one syscall per poll interval and
+never reads the file. ``create_watcher`` picks the best available one.
+
+Both can also watch every file in a directory whose name starts with a given
+prefix, which the change-feed consumer uses for its rotating segment files.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+# inotify event flags (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def file_signature(path):
+    """Return a cheap (mtime, size, inode) signature of a file, or None if missing"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def directory_signature(directory, prefix):
+    """Return the signatures of all files in a directory whose names start with prefix"""
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.startswith(prefix))
+    except FileNotFoundError:
+        return None
+    return tuple((name, file_signature(os.path.join(directory, name))) for name in names)
+
+
+class PollingWatcher:
+    """Detect changes by polling the file's stat signature"""
+
+    name = "polling"
+
+    def __init__(self, path, poll_interval=0.25, prefix=None):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self.last_signature = self._signature()
+
+    def _signature(self):
+        if self.prefix is not None:
+            return directory_signature(self.path, self.prefix)
+        return file_signature(self.path)
+
+    def wait(self, timeout=None):
+        """Block until the file may have changed or timeout expires; returns True on change"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            signature = self._signature()
+            if signature != self.last_signature:
+                self.last_signature = signature
+                return True
+            if deadline is None:
+                time.sleep(self.poll_interval)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.poll_interval, remaining))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Detect changes with Linux inotify on the file's parent directory.
+
+    The directory is watched rather than the file so that atomic
+    write-to-temp-and-rename replacements are seen as well. With a prefix,
+    path is a directory and any file whose name starts with prefix matches.
+    """
+
+    name = "inotify"
+
+    def __init__(self, path, prefix=None):
+        self.path = path
+        if prefix is not None:
+            self.directory = os.path.abspath(path)
+            self.prefix = os.fsencode(prefix)
+            self.filename = None
+        else:
+            self.directory = os.path.dirname(os.path.abspath(path))
+            self.prefix = None
+            self.filename = os.fsencode(os.path.basename(path))
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(self.directory), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {self.directory}")
+
+    def _matches(self, name):
+        if self.prefix is not None:
+            return name.startswith(self.prefix)
+        return name == self.filename
+
+    def _drain(self):
+        """Read all queued events; returns True if any concern the watched file"""
+        changed = False
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(buffer):
+                _, mask, _, name_length = _EVENT_HEADER.unpack_from(buffer, offset)
+                offset += _EVENT_HEADER.size
+                name = buffer[offset:offset + name_length].rstrip(b"\0")
+                offset += name_length
+                if mask & IN_Q_OVERFLOW or self._matches(name):
+                    changed = True
+
+    def wait(self, timeout=None):
+        """Block until the file may have changed or timeout expires; returns True on change"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if not readable:
+                return False
+            if self._drain():
+                return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(path, poll_interval=0.25, prefix=None):
+    """Return an inotify watcher on Linux, falling back to stat polling"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(path, prefix)
+        except (OSError, AttributeError) as e:
+            logging.warning(f"inotify unavailable ({e}); falling back to polling")
+    return PollingWatcher(path, poll_interval, prefix)
@@ -0,0 +1,152 @@
+"""
+Consumption rates and projected stockouts for GET /api/forecast/stockouts.
+
+Each product's consumption rate is an exponentially weighted average of the
+stock decreases seen by the server, with a half-life of ``half_life`` seconds.
+Like the velocity ranking, it uses forward decay: a decrease of u units at
+time t adds u * exp(rate * (t - landmark)) to the product's consumed total, an
+O(1) update, and the rate at any later time is read off that total.
+
+The projected time to stockout is current_stock / rate. Because every
+product's rate decays by the same factor as time passes, the order of the
+projections never changes between updates: the index stores
+``current_stock / (decay_rate * consumed)`` once per update, and today's hours
+to stockout are that key scaled by a single factor. "Everything running out
+within N hours" is then a walk from the front of the index.
+
+``rebuild`` is the batch mode. It recomputes every rate from the recorded
+stock history, column by column, and sorts the index once.
+"""
+
+import math
+import threading
+import time
+from bisect import bisect_left, insort
+from operator import mul
+
+# Default half-life of the consumption rate
+CONSUMPTION_HALF_LIFE = 86400.0
+
+# Forward-decay weights are rebased before exp() gets anywhere near overflowing
+MAX_DECAY_EXPONENT = 500.0
+
+# History older than this many half-lives weighs less than 0.1% and is not read by rebuild()
+REBUILD_HALF_LIVES = 10
+
+
+class StockoutForecaster:
+    """Per-product consumption rates and an index ordered by projected stockout"""
+
+    def __init__(self, half_life=CONSUMPTION_HALF_LIFE):
+        self.half_life = half_life
+        self.decay_rate = math.log(2) / half_life
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self, now=None):
+        self._landmark = now or time.time()
+        self._products = {}
+        self._consumed = {}
+        self._keys = {}
+        self._index = []
+
+    def _key(self, product_id, stock):
+        consumed = self._consumed.get(product_id, 0.0)
+        if consumed <= 0 or stock <= 0:
+            return None
+        return stock / (self.decay_rate * consumed)
+
+    def _unindex(self, product_id):
+        key = self._keys.pop(product_id, None)
+        if key is None:
+            return
+        index = bisect_left(self._index, (key, product_id))
+        if index < len(self._index) and self._index[index] == (key, product_id):
+            del self._index[index]
+
+    def _reindex(self, product):
+        product_id = product['id']
+        self._unindex(product_id)
+        key = self._key(product_id, float(product['current_stock']))
+        if key is not None:
+            insort(self._index, (key, product_id))
+            self._keys[product_id] = key
+        self._products[product_id] = product
+
+    def _rebase(self, now):
+        factor = math.exp(-self.decay_rate * (now - self._landmark))
+        self._landmark = now
+        self._consumed = {product_id: consumed * factor for product_id, consumed in self._consumed.items()}
+        # Keys are inversely proportional to the consumed totals; scaling them all keeps the order
+        self._keys = {product_id: key / factor for product_id, key in self._keys.items()}
+        self._index = [(key / factor, product_id) for key, product_id in self._index]
+
+    def update(self, product, previous_stock=None, now=None):
+        """Re-index a created or changed product; a stock decrease from previous_stock counts as consumption"""
+        with self._lock:
+            if previous_stock is not None:
+                consumed = float(previous_stock) - float(product['current_stock'])
+                if consumed > 0:
+                    now = now or time.time()
+                    if self.decay_rate * (now - self._landmark) > MAX_DECAY_EXPONENT:
+                        self._rebase(now)
+                    weight = math.exp(self.decay_rate * (now - self._landmark))
+                    self._consumed[product['id']] = self._consumed.get(product['id'], 0.0) + consumed * weight
+            self._reindex(product)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._unindex(product_id)
+            self._products.pop(product_id, None)
+            self._consumed.pop(product_id, None)
+
+    def _scale(self, now):
+        """Factor turning index keys into seconds until stockout at time now"""
+        return math.exp(self.decay_rate * (now - self._landmark))
+
+    def rate(self, product_id, now=None):
+        """Consumption rate of a product in units per hour"""
+        with self._lock:
+            consumed = self._consumed.get(product_id, 0.0)
+            return consumed * self.decay_rate * 3600 / self._scale(now or time.time())
+
+    def stockouts(self, within_hours, limit=None, now=None):
+        """Return [(product, hours until stockout, units per hour)] within within_hours, soonest first"""
+        now = now or time.time()
+        with self._lock:
+            scale = self._scale(now)
+            bound = within_hours * 3600 / scale
+            forecast = []
+            for key, product_id in self._index:
+                if key > bound or (limit is not None and len(forecast) >= limit):
+                    break
+                product = self._products[product_id]
+                hours = key * scale / 3600
+                forecast.append((product, hours, float(product['current_stock']) / hours if hours else 0.0))
+            return forecast
+
+    def rebuild(self, products, history=None, now=None):
+        """Batch mode: recompute every rate from the stock history and index the catalogue in one sort"""
+        now = now or time.time()
+        start = now - REBUILD_HALF_LIVES * self.half_life
+        with self._lock:
+            self._reset(now)
+            for product in products:
+                product_id = product['id']
+                self._products[product_id] = product
+                if history is None:
+                    continue
+                timestamps, stocks = history.samples(product_id, start, now)
+                if len(stocks) < 2:
+                    continue
+                # Decreases between consecutive samples, weighted by how recent they are
+                decreases = [max(0.0, before - after) for before, after in zip(stocks, stocks[1:])]
+                weights = [math.exp(self.decay_rate * (timestamp - now)) for timestamp in timestamps[1:]]
+                consumed = sum(map(mul, decreases, weights))
+                if consumed > 0:
+                    self._consumed[product_id] = consumed
+            keys = ((self._key(product_id, float(product['current_stock'])), product_id)
+                    for product_id, product in self._products.items())
+            self._index = sorted(entry for entry in keys if entry[0] is not None)
+            self._keys = {product_id: key for key, product_id in self._index}
+            return len(self._index)
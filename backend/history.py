@@ -0,0 +1,266 @@
+"""
+Per-product stock history served by GET /api/products/<id>/history.
+
+Every change of a product's current_stock is recorded as a (timestamp, stock)
+sample. The newest samples of each product live in a fixed-size ring of two
+``array('d')`` columns. When a ring fills up, its oldest half is spilled to a
+segment file on disk, so memory stays bounded whatever the update rate.
+
+Segments are stored under ``data/history/<product>/`` as raw interleaved
+doubles (timestamp, stock, timestamp, stock, ...), named after the first and
+last timestamp they hold in milliseconds, so a range query only opens the
+segments overlapping the range.
+
+Range queries are downsampled with Largest-Triangle-Three-Buckets (LTTB),
+which keeps the peaks and dips of the series instead of averaging them away,
+so a chart gets at most ``points`` samples for any range.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+# Samples held in memory per product before the oldest half is spilled
+RING_SIZE = 256
+
+# Points returned by a range query when none are requested
+DEFAULT_POINTS = 200
+MAX_POINTS = 5000
+
+SEGMENT_PATTERN = re.compile(r'^(\d+)-(\d+)\.seg$')
+SAFE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def parse_time(value):
+    """Epoch seconds from a query parameter given as epoch seconds or ISO 8601; None when empty"""
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def lttb(timestamps, values, threshold):
+    """Downsample a series to threshold points with Largest-Triangle-Three-Buckets"""
+    length = len(timestamps)
+    if threshold >= length or threshold < 3:
+        return list(zip(timestamps, values))
+
+    sampled = [(timestamps[0], values[0])]
+    bucket_size = (length - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # The next bucket's average is the third corner of the triangle
+        next_start, next_end = end, min(int((bucket + 2) * bucket_size) + 1, length)
+        span = next_end - next_start
+        average_t = sum(timestamps[next_start:next_end]) / span
+        average_v = sum(values[next_start:next_end]) / span
+
+        point_t, point_v = timestamps[previous], values[previous]
+        best, best_area = start, -1.0
+        for index in range(start, end):
+            area = abs((point_t - average_t) * (values[index] - point_v)
+                       - (point_t - timestamps[index]) * (average_v - point_v))
+            if area > best_area:
+                best, best_area = index, area
+        sampled.append((timestamps[best], values[best]))
+        previous = best
+
+    sampled.append((timestamps[-1], values[-1]))
+    return sampled
+
+
+class SampleRing:
+    """Fixed-capacity ring of (timestamp, value) samples in two array('d') columns.
+
+    The columns grow up to ``capacity`` before wrapping around, so products
+    that rarely change only hold the samples they have.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array('d')
+        self.values = array('d')
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def last(self):
+        if not self.count:
+            return None
+        index = (self.head + self.count - 1) % self.capacity
+        return self.timestamps[index], self.values[index]
+
+    def append(self, timestamp, value):
+        if len(self.timestamps) < self.capacity:
+            self.timestamps.append(timestamp)
+            self.values.append(value)
+        else:
+            index = (self.head + self.count) % self.capacity
+            self.timestamps[index] = timestamp
+            self.values[index] = value
+        self.count += 1
+
+    def _ordered(self, column, start, stop):
+        size = len(column)
+        first, last = self.head + start, self.head + stop
+        if last <= size:
+            return column[first:last]
+        if first >= size:
+            return column[first - size:last - size]
+        return column[first:] + column[:last - size]
+
+    def samples(self, start=0, stop=None):
+        """Columns of samples start..stop, oldest first"""
+        stop = self.count if stop is None else stop
+        return self._ordered(self.timestamps, start, stop), self._ordered(self.values, start, stop)
+
+    def pop_oldest(self, count):
+        timestamps, values = self.samples(0, count)
+        if count == self.count:
+            self.timestamps, self.values = array('d'), array('d')
+            self.head = self.count = 0
+        else:
+            # Only a full ring is partially emptied, so the columns are at capacity
+            self.head = (self.head + count) % self.capacity
+            self.count -= count
+        return timestamps, values
+
+
+class ProductSeries:
+    """The ring and the on-disk segments of one product"""
+
+    def __init__(self, directory, ring_size):
+        self.directory = directory
+        self.ring = SampleRing(ring_size)
+        self.segments = None
+
+    def load_segments(self):
+        if self.segments is None:
+            self.segments = []
+            if os.path.isdir(self.directory):
+                for name in os.listdir(self.directory):
+                    match = SEGMENT_PATTERN.match(name)
+                    if match:
+                        self.segments.append((int(match.group(1)), int(match.group(2)), name))
+                self.segments.sort()
+        return self.segments
+
+    def write_segment(self, timestamps, values):
+        interleaved = array('d', bytes(16 * len(timestamps)))
+        interleaved[0::2] = timestamps
+        interleaved[1::2] = values
+        if sys.byteorder != 'little':
+            interleaved.byteswap()
+        first, last = int(timestamps[0] * 1000), int(timestamps[-1] * 1000)
+        name = f"{first}-{last}.seg"
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, name), 'ab') as f:
+            interleaved.tofile(f)
+        if self.segments is not None and (first, last, name) not in self.segments:
+            self.segments.append((first, last, name))
+            self.segments.sort()
+
+    def read_segment(self, name):
+        samples = array('d')
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            samples.frombytes(f.read())
+        if sys.byteorder != 'little':
+            samples.byteswap()
+        return samples[0::2], samples[1::2]
+
+
+class StockHistory:
+    """(timestamp, stock) series of every product, ring-buffered in memory and spilled to disk"""
+
+    def __init__(self, directory, ring_size=RING_SIZE):
+        self.directory = directory
+        self.ring_size = ring_size
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _product_directory(self, product_id):
+        product_id = str(product_id)
+        if SAFE_ID_PATTERN.match(product_id):
+            return os.path.join(self.directory, product_id)
+        # Ids that are not safe file names get a stable hashed directory instead
+        return os.path.join(self.directory, hashlib.sha1(product_id.encode('utf-8')).hexdigest())
+
+    def _get(self, product_id):
+        series = self._series.get(product_id)
+        if series is None:
+            series = self._series[product_id] = ProductSeries(self._product_directory(product_id), self.ring_size)
+        return series
+
+    def record(self, product_id, stock, previous=None, timestamp=None):
+        """Add a sample; repeated samples of an unchanged stock level are skipped.
+
+        ``previous`` is the stock level before this change. It is recorded
+        first when the product has no samples in memory, e.g. on its first
+        change since the server started, so the change itself is not lost.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            series = self._get(product_id)
+            if previous is not None and not len(series.ring):
+                self._append(series, float(previous), timestamp)
+            self._append(series, float(stock), timestamp)
+
+    def _append(self, series, stock, timestamp):
+        ring = series.ring
+        last = ring.last()
+        if last is not None and (last[1] == stock or timestamp < last[0]):
+            return
+        if len(ring) == ring.capacity:
+            series.write_segment(*ring.pop_oldest(ring.capacity // 2))
+        ring.append(timestamp, stock)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._series.pop(product_id, None)
+            shutil.rmtree(self._product_directory(product_id), ignore_errors=True)
+
+    def flush(self):
+        """Write every ring to disk, e.g. before the server exits"""
+        with self._lock:
+            for series in self._series.values():
+                if len(series.ring):
+                    series.write_segment(*series.ring.pop_oldest(len(series.ring)))
+
+    def samples(self, product_id, start=None, end=None):
+        """Raw (timestamps, stocks) columns of a product between start and end"""
+        start = float('-inf') if start is None else start
+        end = float('inf') if end is None else end
+        with self._lock:
+            # Reading does not keep an entry for products that have never been recorded
+            series = self._series.get(product_id) or ProductSeries(self._product_directory(product_id), self.ring_size)
+            timestamps, values = array('d'), array('d')
+            for first, last, name in series.load_segments():
+                if last / 1000 >= start and first / 1000 <= end:
+                    segment_timestamps, segment_values = series.read_segment(name)
+                    timestamps.extend(segment_timestamps)
+                    values.extend(segment_values)
+            ring_timestamps, ring_values = series.ring.samples()
+            timestamps.extend(ring_timestamps)
+            values.extend(ring_values)
+
+        low, high = bisect_left(timestamps, start), bisect_right(timestamps, end)
+        return timestamps[low:high], values[low:high]
+
+    def query(self, product_id, start=None, end=None, points=DEFAULT_POINTS):
+        """Return (number of samples in range, downsampled [(timestamp, stock)])"""
+        timestamps, values = self.samples(product_id, start, end)
+        return len(timestamps), lttb(timestamps, values, points)
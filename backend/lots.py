@@ -0,0 +1,205 @@
+"""
+Perishable stock lots, consumed first-expiry-first-out (FEFO).
+
+A perishable product carries its stock as ``lots``::
+
+    {'id': 'lot-1a2b3c4d', 'quantity': 12.0,
+     'received_at': '2025-06-01T09:30:00', 'expires_at': '2025-06-09T00:00:00'}
+
+kept in FEFO order: earliest expiry first, lots without an expiry date last.
+The product's current_stock is the total of its lots. Products without a
+``lots`` field are not perishable and keep a plain current_stock.
+
+``LotIndex`` orders the lots of the whole catalogue by expiry, so "what
+expires within N days" walks the first k entries instead of scanning every
+product. A stock decrease consumes lots from the front of the product's list,
+and each lot it empties leaves the index with a bisect (O(log n) to find,
+plus a list shift).
+
+Lot lists are replaced rather than changed in place, so a shallow copy of a
+product taken before a change still holds the old lots.
+"""
+
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+
+# Lots are announced as expiring this long before their expiry date
+EXPIRY_WARNING_HOURS = 24.0
+
+# Quantities below this are rounding leftovers of a consumed lot
+EPSILON = 1e-9
+
+
+def parse_datetime(value):
+    """A datetime from an ISO 8601 date or date-time; ValueError when invalid"""
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"Expected an ISO 8601 date, got {value!r}")
+    return datetime.fromisoformat(value)
+
+
+def new_lot(quantity, expires_at=None, received_at=None):
+    """Build a lot from request data; ValueError when a field is invalid"""
+    quantity = float(quantity)
+    if not quantity > 0:
+        raise ValueError('Lot quantity must be positive')
+    return {
+        'id': f"lot-{uuid.uuid4().hex[:8]}",
+        'quantity': quantity,
+        'received_at': (parse_datetime(received_at) if received_at else datetime.now()).isoformat(),
+        'expires_at': parse_datetime(expires_at).isoformat() if expires_at else None
+    }
+
+
+def expiry_timestamp(lot):
+    return datetime.fromisoformat(lot['expires_at']).timestamp() if lot.get('expires_at') else None
+
+
+def fefo_key(lot):
+    expiry = expiry_timestamp(lot)
+    return (0, expiry) if expiry is not None else (1, 0.0)
+
+
+class LotIndex:
+    """Lots of every perishable product, ordered by expiry"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []
+        self._products = {}
+        self._announced = {}
+
+    def _add(self, product_id, lot):
+        expiry = expiry_timestamp(lot)
+        if expiry is not None:
+            insort(self._entries, (expiry, product_id, lot['id']))
+
+    def _remove(self, product_id, lot):
+        self._announced.pop((product_id, lot['id']), None)
+        expiry = expiry_timestamp(lot)
+        if expiry is None:
+            return
+        index = bisect_left(self._entries, (expiry, product_id, lot['id']))
+        if index < len(self._entries) and self._entries[index] == (expiry, product_id, lot['id']):
+            del self._entries[index]
+
+    def rebuild(self, products):
+        with self._lock:
+            self._products = {p['id']: p for p in products if 'lots' in p}
+            self._entries = sorted(
+                (expiry_timestamp(lot), product_id, lot['id'])
+                for product_id, product in self._products.items()
+                for lot in product['lots'] if lot.get('expires_at')
+            )
+            self._announced = {}
+
+    def remove_product(self, product):
+        with self._lock:
+            for lot in product.get('lots', ()):
+                self._remove(product['id'], lot)
+            self._products.pop(product['id'], None)
+
+    def stock(self, product, lots):
+        """Make a new product perishable with the given lots; current_stock becomes their total"""
+        with self._lock:
+            product['lots'] = sorted(lots, key=fefo_key)
+            product['current_stock'] = sum(lot['quantity'] for lot in lots)
+            for lot in product['lots']:
+                self._add(product['id'], lot)
+            self._products[product['id']] = product
+
+    def receive(self, product, lot):
+        """Add a lot to a product, in FEFO position, and raise its current_stock"""
+        with self._lock:
+            lots = list(product.get('lots', ()))
+            if 'lots' not in product and float(product['current_stock']) > 0:
+                # Stock held before the product was tracked in lots has no known expiry
+                lots.append(new_lot(product['current_stock']))
+            keys = [fefo_key(existing) for existing in lots]
+            lots.insert(bisect_right(keys, fefo_key(lot)), lot)
+            product['lots'] = lots
+            product['current_stock'] = float(product['current_stock']) + lot['quantity']
+            self._add(product['id'], lot)
+            self._products[product['id']] = product
+
+    def discard(self, product, lot_id):
+        """Write off a lot (e.g. an expired one); returns it, or None when the product has no such lot"""
+        with self._lock:
+            lot = next((lot for lot in product.get('lots', ()) if lot['id'] == lot_id), None)
+            if lot is None:
+                return None
+            product['lots'] = [other for other in product['lots'] if other is not lot]
+            product['current_stock'] = max(0.0, float(product['current_stock']) - lot['quantity'])
+            self._remove(product['id'], lot)
+            return lot
+
+    def _consume(self, product, quantity):
+        lots = list(product['lots'])
+        consumed = []
+        while quantity > EPSILON and lots:
+            lot = lots[0]
+            taken = min(lot['quantity'], quantity)
+            quantity -= taken
+            consumed.append((lot['id'], taken))
+            if lot['quantity'] - taken <= EPSILON:
+                lots.pop(0)
+                self._remove(product['id'], lot)
+            else:
+                lots[0] = dict(lot, quantity=lot['quantity'] - taken)
+        product['lots'] = lots
+        return consumed
+
+    def sync(self, product, previous_stock):
+        """Bring a perishable product's lots in line after its current_stock changed.
+
+        A decrease is consumed FEFO; an increase that did not come with a lot
+        goes to a lot without an expiry date. Returns [(lot id, quantity
+        consumed)].
+        """
+        if 'lots' not in product:
+            return []
+        change = float(product['current_stock']) - float(previous_stock)
+        with self._lock:
+            if change < 0:
+                return self._consume(product, -change)
+            if change > 0:
+                lots = list(product['lots'])
+                if lots and not lots[-1].get('expires_at'):
+                    lots[-1] = dict(lots[-1], quantity=lots[-1]['quantity'] + change)
+                else:
+                    lots.append(new_lot(change))
+                product['lots'] = lots
+            return []
+
+    def _lots_due(self, bound):
+        """Index entries expiring up to bound, soonest first"""
+        for expiry, product_id, lot_id in self._entries:
+            if expiry > bound:
+                break
+            product = self._products.get(product_id)
+            lot = next((lot for lot in product['lots'] if lot['id'] == lot_id), None) if product else None
+            if lot is not None:
+                yield expiry, product, lot
+
+    def expiring(self, within_seconds, now=None):
+        """Return [(expiry timestamp, product, lot)] expiring within within_seconds, including expired lots"""
+        now = now or time.time()
+        with self._lock:
+            return list(self._lots_due(now + within_seconds))
+
+    def due_alerts(self, warning_seconds=EXPIRY_WARNING_HOURS * 3600, now=None):
+        """Lots that entered the warning window or expired since the last call: [(state, expiry, product, lot)]"""
+        now = now or time.time()
+        alerts = []
+        with self._lock:
+            for expiry, product, lot in self._lots_due(now + warning_seconds):
+                state = 'expired' if expiry <= now else 'expiring'
+                key = (product['id'], lot['id'])
+                if self._announced.get(key) != state:
+                    self._announced[key] = state
+                    alerts.append((state, expiry, product, lot))
+        return alerts
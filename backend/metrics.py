@@ -0,0 +1,161 @@
+"""
+Lightweight in-process metrics registry.
+
+Counters, gauges and histograms are kept in plain dicts keyed by label values
+and rendered in the Prometheus text exposition format by the /metrics route.
+Each observation is a dict lookup plus an addition under a single lock, so the
+per-request overhead stays in the low microseconds.
+"""
+
+import bisect
+import threading
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_lock = threading.Lock()
+_metrics = []
+
+
+def _format_labels(label_names, label_values, extra=None):
+    """Render a Prometheus label set"""
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    rendered = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + rendered + "}"
+
+
+def _format_value(value):
+    """Render a sample value"""
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing counter"""
+
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        # Unlabelled series are exported as 0 until first touched
+        self._values = {} if self.label_names else {(): 0}
+        _metrics.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with _lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, _format_labels(self.label_names, label_values), value
+
+
+class Gauge:
+    """Value that can go up and down, or be computed at scrape time"""
+
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.callback = callback
+        self._values = {} if self.label_names else {(): 0}
+        _metrics.append(self)
+
+    def set(self, value, *label_values):
+        with _lock:
+            self._values[label_values] = value
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def value(self, *label_values):
+        if self.callback is not None:
+            return self.callback()
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        if self.callback is not None:
+            yield self.name, "", self.callback()
+            return
+        with _lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, _format_labels(self.label_names, label_values), value
+
+
+class Histogram:
+    """Cumulative histogram with fixed bucket boundaries"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._values = {}
+        _metrics.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *label_values):
+        series = self._values.get(label_values)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        with _lock:
+            items = [(labels, list(series)) for labels, series in self._values.items()]
+        for label_values, series in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += bucket_count
+                yield (self.name + "_bucket",
+                       _format_labels(self.label_names, label_values, ("le", _format_value(float(bound)))),
+                       cumulative)
+            yield self.name + "_count", _format_labels(self.label_names, label_values), cumulative
+            yield self.name + "_sum", _format_labels(self.label_names, label_values), series[-1]
+
+
+def render():
+    """Render every registered metric in Prometheus text format"""
+    lines = []
+    for metric in list(_metrics):
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
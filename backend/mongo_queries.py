@@ -0,0 +1,155 @@
+"""
+Index management and server-side analytics for the MongoDB products collection.
+
+PRODUCT_INDEXES declares every index the collection should have;
+ensure_indexes creates missing ones. Indexes that are not declared (such as
+ones an operator created by hand) are only dropped when explicitly asked,
+with ``query_mongo_products.py --check-indexes --drop-undeclared``.
+The analytics helpers run as aggregation pipelines on the server and return
+only the projected summary fields. check_query_plans explains each of the
+common query shapes and reports any that would fall back to a collection scan.
+"""
+
+import logging
+
+from pymongo import ASCENDING, DESCENDING
+
+# Declared indexes: name -> (keys, options).
+# The compound category+status index also serves category-only queries through
+# its prefix, so a separate single-field category index would only slow writes.
+PRODUCT_INDEXES = {
+    "id_1": ([("id", ASCENDING)], {"unique": True}),
+    "sku_1": ([("sku", ASCENDING)], {}),
+    "status_1": ([("status", ASCENDING)], {}),
+    "category_1_status_1": ([("category", ASCENDING), ("status", ASCENDING)], {}),
+    "sales_count_-1": ([("sales_count", DESCENDING)], {}),
+}
+
+LOW_STOCK_STATUSES = ["low_stock", "out_of_stock"]
+
+
+def ensure_indexes(products_collection, drop_undeclared=False):
+    """Create declared indexes, and drop undeclared ones if asked; returns (created, dropped)"""
+    existing = {index["name"] for index in products_collection.list_indexes()}
+    created = []
+    for name, (keys, options) in PRODUCT_INDEXES.items():
+        if name not in existing:
+            products_collection.create_index(keys, name=name, **options)
+            created.append(name)
+    dropped = []
+    if drop_undeclared:
+        for name in existing:
+            if name != "_id_" and name not in PRODUCT_INDEXES:
+                logging.warning(f"Dropping undeclared index {name} on {products_collection.full_name}")
+                products_collection.drop_index(name)
+                dropped.append(name)
+    if created or dropped:
+        logging.info(f"Indexes created: {created or 'none'}; dropped: {dropped or 'none'}")
+    return created, dropped
+
+
+def stock_value_pipeline(category=None):
+    """Inventory value (at cost and at selling price) per category"""
+    pipeline = []
+    if category:
+        pipeline.append({"$match": {"category": category}})
+    pipeline.extend([
+        {"$project": {"_id": 0, "category": 1, "current_stock": 1, "cost_price": 1, "selling_price": 1}},
+        {"$group": {
+            "_id": "$category",
+            "products": {"$sum": 1},
+            "units": {"$sum": "$current_stock"},
+            "cost_value": {"$sum": {"$multiply": ["$current_stock", "$cost_price"]}},
+            "retail_value": {"$sum": {"$multiply": ["$current_stock", "$selling_price"]}},
+        }},
+        {"$project": {"_id": 0, "category": "$_id", "products": 1, "units": 1,
+                      "cost_value": {"$round": ["$cost_value", 2]},
+                      "retail_value": {"$round": ["$retail_value", 2]}}},
+        {"$sort": {"retail_value": -1}},
+    ])
+    return pipeline
+
+
+def low_stock_pipeline():
+    """Number of low-stock and out-of-stock products per category"""
+    return [
+        {"$match": {"status": {"$in": LOW_STOCK_STATUSES}}},
+        {"$project": {"_id": 0, "category": 1, "status": 1}},
+        {"$group": {
+            "_id": "$category",
+            "low_stock": {"$sum": {"$cond": [{"$eq": ["$status", "low_stock"]}, 1, 0]}},
+            "out_of_stock": {"$sum": {"$cond": [{"$eq": ["$status", "out_of_stock"]}, 1, 0]}},
+        }},
+        {"$project": {"_id": 0, "category": "$_id", "low_stock": 1, "out_of_stock": 1}},
+        {"$sort": {"low_stock": -1, "out_of_stock": -1}},
+    ]
+
+
+def top_sellers_pipeline(limit=10):
+    """Best-selling products by sales_count"""
+    return [
+        {"$sort": {"sales_count": -1}},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "id": 1, "name": 1, "category": 1, "sales_count": 1, "current_stock": 1}},
+    ]
+
+
+ANALYTICS = {
+    "stock-value": stock_value_pipeline,
+    "low-stock": low_stock_pipeline,
+    "top-sellers": top_sellers_pipeline,
+}
+
+
+def run_analytics(products_collection, name, **kwargs):
+    """Run one of the ANALYTICS pipelines and return its result rows"""
+    return list(products_collection.aggregate(ANALYTICS[name](**kwargs)))
+
+
+def query_shapes():
+    """Common query shapes that must be served by an index"""
+    return {
+        "find by id": ("find", {"id": "1"}),
+        "find by sku": ("find", {"sku": "SKU-0000"}),
+        "find by category": ("find", {"category": "fruits"}),
+        "find by status": ("find", {"status": "low_stock"}),
+        "find by category+status": ("find", {"category": "fruits", "status": "low_stock"}),
+        "top sellers": ("aggregate", top_sellers_pipeline()),
+        "low stock counts": ("aggregate", low_stock_pipeline()),
+        "stock value for one category": ("aggregate", stock_value_pipeline("fruits")),
+    }
+
+
+def _plan_stages(plan):
+    """Yield every winning-plan stage name in an explain() output, however deeply nested"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for key, value in plan.items():
+            if key != "rejectedPlans":
+                yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def explain_query(products_collection, kind, query):
+    """Return the explain() output for a find filter or an aggregation pipeline"""
+    if kind == "find":
+        return products_collection.find(query).explain()
+    return products_collection.database.command(
+        "aggregate", products_collection.name, pipeline=query, explain=True
+    )
+
+
+def check_query_plans(products_collection):
+    """Explain every common query shape; returns {shape: stages} for those using COLLSCAN"""
+    scans = {}
+    for shape, (kind, query) in query_shapes().items():
+        stages = set(_plan_stages(explain_query(products_collection, kind, query)))
+        if "COLLSCAN" in stages:
+            scans[shape] = sorted(stages)
+            logging.warning(f"Collection scan in query plan for '{shape}': {sorted(stages)}")
+        else:
+            logging.info(f"Index-backed plan for '{shape}': {sorted(stages)}")
+    return scans
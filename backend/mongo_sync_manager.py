@@ -1,11 +1,18 @@
 #!/usr/bin/env python3
 import argparse
+import asyncio
+import json
 import logging
+import re
 import subprocess
 import sys
 import os
 import time
-from multiprocessing import Process
+
+from process_supervisor import ManagedProcess, Supervisor, python_command
+from db_sync import PARTITION_BUCKETS, PARTITION_KEYS, PRODUCTS_JSON_PATH
+import sync_benchmark
+from simulate_product_changes import positive_int
 
 # Setup logging
 logging.basicConfig(
@@ -20,23 +27,203 @@ QUERY_SCRIPT = os.path.join(CURRENT_DIR, "query_mongo_products.py")
 SIMULATE_SCRIPT = os.path.join(CURRENT_DIR, "simulate_product_changes.py")
 TEST_CONNECTION_SCRIPT = os.path.join(CURRENT_DIR, "test_mongo_connection.py")
 
-def run_db_sync():
-    """Run the database sync process"""
+# db_sync logs one of these once its initial sync is done and it is watching for changes
+DB_SYNC_READY_PATTERN = r"Watching products\.json|Consuming change feed"
+
+# Status line a sharded db_sync worker logs after every sync
+SHARD_STATUS_PATTERN = re.compile(r"shard-status (\{.*\})")
+
+def db_sync_process(feed=False, workers=1):
+    """Supervised db_sync child; restarted with backoff if it dies"""
+    args = ["--feed"] if feed else []
+    if workers > 1:
+        args.extend(["--workers", str(workers)])
+    return ManagedProcess("DB_SYNC", python_command(DB_SYNC_SCRIPT, *args), ready_pattern=DB_SYNC_READY_PATTERN)
+
+def simulation_process(args):
+    """Supervised simulation child; runs once and is not restarted"""
+    cmd = python_command(SIMULATE_SCRIPT, "--interval", str(args.interval), "--max-changes", str(args.max_changes),
+                         "--batch", str(args.batch))
+    if args.seed is not None:
+        cmd.extend(["--seed", str(args.seed)])
+    return ManagedProcess("SIMULATE", cmd, restart=False)
+
+def bucket_ranges(shards, buckets=PARTITION_BUCKETS):
+    """Split the partition buckets into contiguous ranges, one per shard"""
+    return [f"{index * buckets // shards}-{(index + 1) * buckets // shards - 1}" for index in range(shards)]
+
+class ShardCoordinator:
+    """Run N db_sync workers, each owning a contiguous range of partition buckets.
+
+    Workers log a shard-status line after every sync. The coordinator keeps
+    the latest one per shard and periodically logs each shard's last sync lag
+    and how far it is currently behind products.json. A worker that keeps
+    crashing leaves the group and its buckets are split among the others; it
+    rejoins after rejoin_after seconds and the buckets are rebalanced again.
+    """
+    
+    def __init__(self, supervisor, shards, partition_key="id", workers=1,
+                 status_interval=10.0, rejoin_after=60.0, max_restarts=5):
+        self.supervisor = supervisor
+        self.partition_key = partition_key
+        self.workers = workers
+        self.status_interval = status_interval
+        self.rejoin_after = rejoin_after
+        self.max_restarts = max_restarts
+        self.members = [f"SHARD_{index}" for index in range(shards)]
+        self.departed = {}
+        self.status = {}
+    
+    def assignment(self):
+        return dict(zip(self.members, bucket_ranges(len(self.members))))
+    
+    def worker_command(self, name, buckets):
+        return python_command(DB_SYNC_SCRIPT, "--shard", name, "--buckets", buckets,
+                              "--partition-key", self.partition_key, "--workers", str(self.workers))
+    
+    def on_line(self, child, text):
+        match = SHARD_STATUS_PATTERN.search(text)
+        if not match:
+            return
+        status = json.loads(match.group(1))
+        previous = self.status.get(child.name, {})
+        status["syncs"] = previous.get("syncs", 0) + 1
+        if status.get("lag") is None:
+            status["lag"] = previous.get("lag")
+        self.status[child.name] = status
+    
+    def start(self):
+        for name, buckets in self.assignment().items():
+            self.supervisor.start(self.supervisor.add(ManagedProcess(
+                name, self.worker_command(name, buckets), ready_pattern=DB_SYNC_READY_PATTERN,
+                max_restarts=self.max_restarts, on_line=self.on_line
+            )))
+    
+    async def rebalance(self):
+        """Restart every worker whose bucket range changed (or that is not running)"""
+        if not self.members:
+            logging.error("No sync workers left; waiting for one to rejoin")
+            return
+        for name, buckets in self.assignment().items():
+            child = self.supervisor.children[name]
+            command = self.worker_command(name, buckets)
+            if child.cmd != command or child.finished.is_set():
+                child.cmd = command
+                logging.info(f"{name} now owns buckets {buckets}")
+                await self.supervisor.restart(name)
+    
+    def log_status(self):
+        try:
+            file_mtime = os.stat(PRODUCTS_JSON_PATH).st_mtime
+        except OSError:
+            file_mtime = None
+        now = time.time()
+        for name, buckets in self.assignment().items():
+            status = self.status.get(name)
+            if status is None:
+                logging.info(f"{name} [{buckets}]: no sync reported yet")
+                continue
+            behind = 0.0
+            if file_mtime is not None and file_mtime > status["file_mtime"]:
+                behind = now - file_mtime
+            lag = "n/a" if status.get("lag") is None else f"{status['lag']:.3f}s"
+            logging.info(f"{name} [{buckets}]: last lag {lag}, behind {behind:.1f}s, "
+                         f"{status['syncs']} syncs, {status.get('scanned', 0)} products")
+        for name in self.departed:
+            logging.warning(f"{name}: left the group")
+    
+    async def run(self):
+        """Watch the workers until cancelled, rebalancing as they leave and rejoin"""
+        watchers = {name: asyncio.create_task(self.supervisor.wait_finished(name)) for name in self.members}
+        try:
+            while True:
+                if watchers:
+                    await asyncio.wait(list(watchers.values()), timeout=self.status_interval,
+                                       return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    await asyncio.sleep(self.status_interval)
+                if self.supervisor.stopping:
+                    return
+                changed = False
+                for name, task in list(watchers.items()):
+                    if task.done():
+                        del watchers[name]
+                        self.members.remove(name)
+                        self.departed[name] = time.monotonic()
+                        self.status.pop(name, None)
+                        logging.warning(f"{name} left the sync group; rebalancing {PARTITION_BUCKETS} buckets "
+                                        f"over {len(self.members)} workers")
+                        changed = True
+                for name, left_at in list(self.departed.items()):
+                    if time.monotonic() - left_at >= self.rejoin_after:
+                        del self.departed[name]
+                        self.members.append(name)
+                        self.members.sort(key=lambda member: int(member.rsplit("_", 1)[1]))
+                        logging.info(f"{name} rejoining the sync group")
+                        changed = True
+                if changed:
+                    await self.rebalance()
+                    for name in self.members:
+                        if name not in watchers:
+                            watchers[name] = asyncio.create_task(self.supervisor.wait_finished(name))
+                self.log_status()
+        finally:
+            for task in watchers.values():
+                task.cancel()
+
+def start_sync(supervisor, args):
+    """Start db_sync, sharded over a ShardCoordinator when args.shards > 1; returns the coordinator or None"""
+    if args.shards > 1:
+        coordinator = ShardCoordinator(supervisor, args.shards, args.partition_by, args.workers, args.status_interval)
+        coordinator.start()
+        return coordinator
+    supervisor.start(supervisor.add(db_sync_process(args.feed, args.workers)))
+    return None
+
+async def wait_sync_ready(supervisor, coordinator, timeout):
+    names = coordinator.members if coordinator else ["DB_SYNC"]
+    return all(await asyncio.gather(*(supervisor.wait_ready(name, timeout=timeout) for name in names)))
+
+async def supervise_sync(args):
+    """Run db_sync (or its shards) under supervision until interrupted"""
     logging.info("Starting MongoDB synchronization process...")
+    supervisor = Supervisor()
+    coordinator = start_sync(supervisor, args)
     try:
-        process = subprocess.Popen([sys.executable, DB_SYNC_SCRIPT],
-                                  stdout=subprocess.PIPE,
-                                  stderr=subprocess.STDOUT,
-                                  text=True,
-                                  bufsize=1)
-        
-        for line in iter(process.stdout.readline, ''):
-            print(f"[DB_SYNC] {line}", end='')
-            
-        return process
-    except Exception as e:
-        logging.error(f"Failed to start DB sync process: {e}")
-        return None
+        if coordinator:
+            await coordinator.run()
+        else:
+            await supervisor.run_forever()
+    finally:
+        await supervisor.shutdown()
+
+async def supervise_demo(args):
+    """Start db_sync, wait for it to be ready, then run the simulation alongside it"""
+    logging.info("Starting MongoDB synchronization process...")
+    supervisor = Supervisor()
+    coordinator = start_sync(supervisor, args)
+    coordinating = None
+    try:
+        if not await wait_sync_ready(supervisor, coordinator, args.ready_timeout):
+            logging.error(f"DB sync was not ready within {args.ready_timeout}s; not starting the simulation")
+            return
+        if coordinator:
+            coordinating = asyncio.create_task(coordinator.run())
+        supervisor.start(supervisor.add(simulation_process(args)))
+        await supervisor.wait_finished("SIMULATE")
+        logging.info("Simulation finished")
+    finally:
+        if coordinating:
+            coordinating.cancel()
+        logging.info("Terminating DB sync process...")
+        await supervisor.shutdown()
+
+def run_supervised(coroutine):
+    """Run a supervisor coroutine; Ctrl+C cancels it, which shuts the children down"""
+    try:
+        asyncio.run(coroutine)
+    except KeyboardInterrupt:
+        logging.info("Stopped")
 
 def run_query(args):
     """Run the query script to check MongoDB data"""
@@ -50,6 +237,20 @@ def run_query(args):
         cmd.extend(["--id", args.id])
     if args.all:
         cmd.append("--all")
+    if args.report:
+        cmd.extend(["--report", args.report])
+    if args.check_indexes:
+        cmd.append("--check-indexes")
+    if args.drop_undeclared:
+        cmd.append("--drop-undeclared")
+    if args.shell:
+        cmd.append("--shell")
+    if args.export:
+        cmd.append("--export")
+    for option in ("format", "output", "fields", "sort", "skip", "batch_size"):
+        value = getattr(args, option)
+        if value:
+            cmd.extend(["--" + option.replace("_", "-"), str(value)])
     
     try:
         subprocess.run(cmd)
@@ -60,10 +261,9 @@ def run_simulation(args):
     """Run the simulation script"""
     cmd = [sys.executable, SIMULATE_SCRIPT]
     
-    if args.interval:
-        cmd.extend(["--interval", str(args.interval)])
-    if args.max_changes:
-        cmd.extend(["--max-changes", str(args.max_changes)])
+    cmd.extend(["--interval", str(args.interval), "--max-changes", str(args.max_changes), "--batch", str(args.batch)])
+    if args.seed is not None:
+        cmd.extend(["--seed", str(args.seed)])
     
     try:
         subprocess.run(cmd)
@@ -77,24 +277,17 @@ def test_connection():
     except Exception as e:
         logging.error(f"Error testing connection: {e}")
 
-def start_sync_and_simulate(args):
-    """Start both sync and simulation processes"""
-    # Start the DB sync process
-    sync_process = run_db_sync()
-    if not sync_process:
-        return
-    
-    # Wait a bit to ensure MongoDB connection is established
-    time.sleep(3)
-    
-    try:
-        # Run the simulation
-        run_simulation(args)
-    finally:
-        # Terminate the sync process when simulation is done
-        logging.info("Terminating DB sync process...")
-        sync_process.terminate()
-        sync_process.wait()
+def add_simulation_arguments(parser):
+    parser.add_argument("--interval", type=float, default=5, help="Time interval between writes in seconds (fractions allowed)")
+    parser.add_argument("--max-changes", type=int, default=10, help="Maximum number of changes to make (0 for no limit)")
+    parser.add_argument("--batch", type=positive_int, default=1, help="Number of changes applied per write")
+    parser.add_argument("--seed", type=int, help="Random seed for a reproducible sequence of changes")
+
+def add_sync_arguments(parser):
+    parser.add_argument("--shards", type=int, default=1, help="Number of parallel sync workers, each owning a partition")
+    parser.add_argument("--partition-by", choices=PARTITION_KEYS, default="id", help="Product field shards are partitioned on")
+    parser.add_argument("--workers", type=int, default=1, help="Concurrent bulk_write threads per sync worker")
+    parser.add_argument("--status-interval", type=float, default=10.0, help="Seconds between shard lag reports")
 
 def main():
     parser = argparse.ArgumentParser(description="MongoDB Sync Manager")
@@ -102,6 +295,8 @@ def main():
     
     # Sync command
     sync_parser = subparsers.add_parser("sync", help="Start MongoDB synchronization")
+    sync_parser.add_argument("--feed", action="store_true", help="Consume the app's change feed instead of watching products.json")
+    add_sync_arguments(sync_parser)
     
     # Query command
     query_parser = subparsers.add_parser("query", help="Query MongoDB products")
@@ -109,19 +304,36 @@ def main():
     query_parser.add_argument("--id", help="Filter by product ID")
     query_parser.add_argument("--category", help="Filter by product category")
     query_parser.add_argument("--all", action="store_true", help="Show all products")
+    query_parser.add_argument("--report", choices=["stock-value", "low-stock", "top-sellers"], help="Run a server-side analytics report")
+    query_parser.add_argument("--check-indexes", action="store_true", help="Verify common queries are index-backed")
+    query_parser.add_argument("--drop-undeclared", action="store_true",
+                              help="With --check-indexes, drop indexes not declared in mongo_queries")
+    query_parser.add_argument("--shell", action="store_true", help="Interactive query shell on one pooled connection")
+    query_parser.add_argument("--export", action="store_true", help="Stream results non-interactively")
+    query_parser.add_argument("--format", choices=["jsonl", "csv"], help="Export format (implies --export)")
+    query_parser.add_argument("--output", help="Export to a file instead of stdout (implies --export)")
+    query_parser.add_argument("--fields", help="Comma-separated fields to export")
+    query_parser.add_argument("--sort", help="Sort spec, e.g. sales_count:desc,name")
+    query_parser.add_argument("--skip", type=int, help="Skip the first N products")
+    query_parser.add_argument("--batch-size", type=int, help="Cursor batch size for exports")
     
     # Simulate command
     simulate_parser = subparsers.add_parser("simulate", help="Simulate changes to products.json")
-    simulate_parser.add_argument("--interval", type=int, default=5, help="Time interval between changes in seconds")
-    simulate_parser.add_argument("--max-changes", type=int, default=10, help="Maximum number of changes to make")
+    add_simulation_arguments(simulate_parser)
     
     # Test connection command
     subparsers.add_parser("test", help="Test MongoDB connection")
     
     # Run both sync and simulate
     demo_parser = subparsers.add_parser("demo", help="Run both sync and simulation")
-    demo_parser.add_argument("--interval", type=int, default=5, help="Time interval between changes in seconds")
-    demo_parser.add_argument("--max-changes", type=int, default=10, help="Maximum number of changes to make")
+    add_simulation_arguments(demo_parser)
+    demo_parser.add_argument("--feed", action="store_true", help="Sync from the app's change feed instead of products.json")
+    demo_parser.add_argument("--ready-timeout", type=float, default=30.0, help="Seconds to wait for the sync process to be ready")
+    add_sync_arguments(demo_parser)
+    
+    # End-to-end sync lag benchmark
+    bench_parser = subparsers.add_parser("bench", help="Measure products.json to MongoDB propagation lag under load")
+    sync_benchmark.add_arguments(bench_parser)
     
     args = parser.parse_args()
     
@@ -129,14 +341,11 @@ def main():
         parser.print_help()
         return
     
+    if args.command in ("sync", "demo") and args.shards > 1 and args.feed:
+        parser.error("--shards cannot be combined with --feed: the change feed has a single consumer")
+    
     if args.command == "sync":
-        process = run_db_sync()
-        if process:
-            try:
-                process.wait()
-            except KeyboardInterrupt:
-                logging.info("Stopping sync process...")
-                process.terminate()
+        run_supervised(supervise_sync(args))
     elif args.command == "query":
         run_query(args)
     elif args.command == "simulate":
@@ -144,7 +353,9 @@ def main():
     elif args.command == "test":
         test_connection()
     elif args.command == "demo":
-        start_sync_and_simulate(args)
+        run_supervised(supervise_demo(args))
+    elif args.command == "bench":
+        sync_benchmark.run(args)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
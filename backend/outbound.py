@@ -0,0 +1,222 @@
+"""
+Per-client outbound queues for Socket.IO broadcasts.
+
+Broadcast events are not handed to Socket.IO for every client at once.
+Instead each connected client gets a bounded queue (an Outbox), and a
+dispatcher thread forwards queued events only while that client's engine.io
+send queue is shallow. A backgrounded tab or a slow connection therefore
+holds at most ``max_queue`` pending events instead of an ever-growing
+backlog, and never slows down sends to other clients.
+
+When events back up for a client:
+
+- a new product-update for a product that is already queued is merged into
+  the queued one, so the client only receives the latest state
+- when the queue is full, queued activity-update entries are dropped first
+- when it is still full, the queue is cleared and a ``resync`` event is sent
+  in its place; the client reloads its data over REST
+- a client that has to be resynced more than ``max_resyncs`` times within
+  ``resync_window`` seconds is disconnected
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+import metrics
+
+# Events routed through the per-client queues; everything else is emitted directly
+QUEUED_EVENTS = ('product-update', 'activity-update')
+
+# engine.io packets a client may have waiting to be written before the dispatcher holds back
+MAX_IN_FLIGHT = 64
+
+# How often clients that are being held back are re-checked
+POLL_INTERVAL = 0.05
+
+QUEUE_DROPS = metrics.Counter('socketio_outbound_dropped_total', 'Queued events dropped for slow clients, by event',
+                              labels=('event',))
+QUEUE_COLLAPSED = metrics.Counter('socketio_outbound_collapsed_total',
+                                  'Queued product updates merged into a newer update for the same product')
+QUEUE_RESYNCS = metrics.Counter('socketio_outbound_resyncs_total', 'Clients told to resync after their queue overflowed')
+QUEUE_DISCONNECTS = metrics.Counter('socketio_overload_disconnects_total',
+                                    'Clients disconnected for falling behind repeatedly')
+
+
+def event_key(event, data):
+    """Queue key of an event; queued events with the same key are merged"""
+    if event == 'product-update':
+        return (event, data.get('company_id'), data['id'])
+    return (event, data.get('id'))
+
+
+def merge_product_updates(older, newer):
+    """Combine two product-update events for the same product into one.
+
+    Deltas are stacked so the result still applies on top of the version the
+    client had before the older one (``base_version``).
+    """
+    if newer['type'] == 'delete' or older['type'] == 'delete':
+        return newer
+    if 'data' in older:
+        # A queued create or full update: fold the newer state into it
+        merged = dict(newer)
+        merged['type'] = older['type']
+        merged.pop('changes', None)
+        merged['data'] = dict(older['data'], **newer.get('changes', {})) if 'changes' in newer else newer['data']
+        if 'version' in newer:
+            merged['data']['version'] = newer['version']
+        return merged
+    if 'changes' in newer:
+        merged = dict(newer)
+        merged['changes'] = dict(older['changes'], **newer['changes'])
+        merged['base_version'] = older.get('base_version', older.get('version', 1) - 1)
+        return merged
+    return newer
+
+
+class Outbox:
+    """Events waiting to be sent to one client"""
+
+    def __init__(self, sid, eio_sid):
+        self.sid = sid
+        self.eio_sid = eio_sid
+        self.pending = OrderedDict()
+        self.resyncs = deque()
+        self.overloaded = False
+
+
+class OutboundQueues:
+    """Bounded per-client queues drained by a single dispatcher thread"""
+
+    def __init__(self, socketio, max_queue=256, max_resyncs=3, resync_window=60.0, max_in_flight=MAX_IN_FLIGHT):
+        self.socketio = socketio
+        self.max_queue = max_queue
+        self.max_resyncs = max_resyncs
+        self.resync_window = resync_window
+        self.max_in_flight = max_in_flight
+        self._outboxes = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='socketio-outbound', daemon=True)
+        self._thread.start()
+
+    def depth(self):
+        """Events queued across all clients"""
+        with self._lock:
+            return sum(len(outbox.pending) for outbox in self._outboxes.values())
+
+    def max_depth(self):
+        """Length of the longest client queue"""
+        with self._lock:
+            return max((len(outbox.pending) for outbox in self._outboxes.values()), default=0)
+
+    def discard(self, sid):
+        with self._lock:
+            self._outboxes.pop(sid, None)
+
+    def enqueue(self, event, data, room=None):
+        """Queue an event for every client in room (all clients when None)"""
+        key = event_key(event, data)
+        participants = list(self.socketio.server.manager.get_participants('/', room))
+        with self._lock:
+            for sid, eio_sid in participants:
+                outbox = self._outboxes.get(sid)
+                if outbox is None:
+                    outbox = self._outboxes[sid] = Outbox(sid, eio_sid)
+                self._add(outbox, key, event, data)
+        self._wake.set()
+
+    def _add(self, outbox, key, event, data):
+        pending = outbox.pending
+        if key in pending:
+            if event == 'product-update':
+                pending[key] = (event, merge_product_updates(pending[key][1], data))
+                QUEUE_COLLAPSED.inc()
+            else:
+                pending[key] = (event, data)
+            return
+        if len(pending) >= self.max_queue:
+            # Activity entries are informational, so they go first
+            stale = next((queued for queued in pending if queued[0] == 'activity-update'), None)
+            if stale is not None:
+                del pending[stale]
+                QUEUE_DROPS.inc('activity-update')
+            else:
+                # The resync reloads current state, which already includes this event
+                self._resync(outbox)
+                return
+        pending[key] = (event, data)
+
+    def _resync(self, outbox):
+        # A resync still waiting to be sent already covers everything; it is not counted again
+        already_queued = ('resync', None) in outbox.pending
+        resync = outbox.pending.get(('resync', None)) or ('resync', {
+            'reason': 'queue_overflow',
+            'timestamp': datetime.now().isoformat()
+        })
+        for event, _ in outbox.pending.values():
+            if event != 'resync':
+                QUEUE_DROPS.inc(event)
+        outbox.pending.clear()
+        outbox.pending[('resync', None)] = resync
+        if already_queued:
+            return
+        QUEUE_RESYNCS.inc()
+
+        now = time.monotonic()
+        outbox.resyncs.append(now)
+        while outbox.resyncs and outbox.resyncs[0] < now - self.resync_window:
+            outbox.resyncs.popleft()
+        if len(outbox.resyncs) > self.max_resyncs:
+            outbox.overloaded = True
+
+    def _in_flight(self, outbox):
+        """Packets already handed to engine.io but not yet written to the client"""
+        socket = self.socketio.server.eio.sockets.get(outbox.eio_sid)
+        return socket.queue.qsize() if socket is not None else 0
+
+    def _take(self):
+        """Pop what each client can accept now; returns (batches, overloaded, anything left)"""
+        batches, overloaded, waiting = [], [], False
+        with self._lock:
+            for sid, outbox in list(self._outboxes.items()):
+                if outbox.overloaded:
+                    overloaded.append(sid)
+                    del self._outboxes[sid]
+                    continue
+                if not outbox.pending:
+                    continue
+                room = self.max_in_flight - self._in_flight(outbox)
+                batch = []
+                while outbox.pending and len(batch) < room:
+                    batch.append(outbox.pending.popitem(last=False)[1])
+                if batch:
+                    batches.append((sid, batch))
+                if outbox.pending:
+                    waiting = True
+        return batches, overloaded, waiting
+
+    def _run(self):
+        while True:
+            batches, overloaded, waiting = self._take()
+            for sid in overloaded:
+                QUEUE_DISCONNECTS.inc()
+                try:
+                    self.socketio.server.disconnect(sid)
+                except Exception as e:
+                    print(f"Error disconnecting overloaded client {sid}: {e}")
+            for sid, batch in batches:
+                for event, data in batch:
+                    try:
+                        self.socketio.emit(event, data, to=sid)
+                    except Exception as e:
+                        print(f"Error sending {event} to {sid}: {e}")
+            if not batches and not overloaded:
+                # Idle until the next enqueue, or re-check held-back clients shortly
+                self._wake.wait(timeout=POLL_INTERVAL if waiting else 1.0)
+                self._wake.clear()
@@ -0,0 +1,189 @@
+"""
+Asyncio-based supervisor for the MongoDB helper processes.
+
+Each child's combined stdout/stderr is read concurrently and echoed with a
+``[NAME]`` prefix, so several workers can run side by side without one
+blocking the others. A child can declare a readiness pattern (a regex matched
+against its output) that callers wait for instead of sleeping a fixed time.
+Children that exit unexpectedly are restarted with exponential backoff, and
+shutdown terminates every child, killing any that do not exit in time.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import sys
+import time
+
+
+class ManagedProcess:
+    """Specification and runtime state of one supervised child process"""
+
+    def __init__(self, name, cmd, ready_pattern=None, restart=True, backoff=1.0, max_backoff=30.0,
+                 max_restarts=None, stable_after=60.0, on_line=None):
+        self.name = name
+        self.cmd = cmd
+        self.ready_pattern = re.compile(ready_pattern) if ready_pattern else None
+        self.restart = restart
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_restarts = max_restarts
+        # A child that ran this long before exiting resets its restart backoff
+        self.stable_after = stable_after
+        # Called as on_line(child, text) for every line of output
+        self.on_line = on_line
+        self.process = None
+        self.restarts = 0
+        self.returncode = None
+        self.ready = None
+        self.finished = None
+        self.replacing = False
+
+    def restart_delay(self):
+        return min(self.backoff * (2 ** max(0, self.restarts - 1)), self.max_backoff)
+
+
+class Supervisor:
+    """Run several ManagedProcess children concurrently"""
+
+    def __init__(self, shutdown_timeout=5.0):
+        self.shutdown_timeout = shutdown_timeout
+        self.children = {}
+        self.tasks = {}
+        self.stopping = False
+
+    def add(self, child):
+        self.children[child.name] = child
+        return child
+
+    def start(self, child=None):
+        """Start one child (or every registered child) under supervision"""
+        children = [child] if child is not None else list(self.children.values())
+        for child in children:
+            self.children[child.name] = child
+            child.ready = asyncio.Event()
+            child.finished = asyncio.Event()
+            self.tasks[child.name] = asyncio.create_task(self._supervise(child))
+
+    async def restart(self, name):
+        """Restart a child now (picking up any change to its cmd) without counting a failure"""
+        child = self.children[name]
+        if child.finished is None or child.finished.is_set():
+            child.restarts = 0
+            self.start(child)
+            return
+        if child.process is not None and child.process.returncode is None:
+            child.replacing = True
+            await self._stop_child(child)
+        # Otherwise it is waiting out a restart backoff and will start with the new cmd
+
+    async def wait_ready(self, name, timeout=30.0):
+        """Wait until a child prints its readiness line; returns False on timeout or exit"""
+        child = self.children[name]
+        ready = asyncio.create_task(child.ready.wait())
+        finished = asyncio.create_task(child.finished.wait())
+        try:
+            await asyncio.wait([ready, finished], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            ready.cancel()
+            finished.cancel()
+        return child.ready.is_set()
+
+    async def wait_finished(self, name):
+        """Wait until a child exits for good (no more restarts) and return its exit code"""
+        child = self.children[name]
+        await child.finished.wait()
+        return child.returncode
+
+    async def run_forever(self):
+        """Block until every child has finished for good"""
+        if self.tasks:
+            await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+    async def _pump_output(self, child, stream):
+        while True:
+            line = await stream.readline()
+            if not line:
+                return
+            text = line.decode(errors="replace").rstrip("\n")
+            print(f"[{child.name}] {text}", flush=True)
+            if child.on_line is not None:
+                child.on_line(child, text)
+            if child.ready_pattern is not None and not child.ready.is_set() and child.ready_pattern.search(text):
+                logging.info(f"{child.name} is ready")
+                child.ready.set()
+
+    async def _supervise(self, child):
+        env = dict(os.environ, PYTHONUNBUFFERED="1")
+        try:
+            while not self.stopping:
+                started = time.monotonic()
+                try:
+                    child.process = await asyncio.create_subprocess_exec(
+                        *child.cmd,
+                        stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.STDOUT,
+                        env=env
+                    )
+                except OSError as e:
+                    logging.error(f"Failed to start {child.name}: {e}")
+                    child.returncode = None
+                else:
+                    logging.info(f"Started {child.name} (pid {child.process.pid})")
+                    if child.ready_pattern is None:
+                        child.ready.set()
+                    await self._pump_output(child, child.process.stdout)
+                    child.returncode = await child.process.wait()
+
+                if self.stopping:
+                    break
+                if child.replacing:
+                    child.replacing = False
+                    child.ready.clear()
+                    continue
+                if not child.restart:
+                    break
+                if time.monotonic() - started >= child.stable_after:
+                    child.restarts = 0
+                child.restarts += 1
+                if child.max_restarts is not None and child.restarts > child.max_restarts:
+                    logging.error(f"{child.name} exited with code {child.returncode}; giving up after {child.max_restarts} restarts")
+                    break
+                delay = child.restart_delay()
+                logging.warning(f"{child.name} exited with code {child.returncode}; restarting in {delay:.1f}s")
+                child.ready.clear()
+                await asyncio.sleep(delay)
+        finally:
+            child.finished.set()
+
+    async def _stop_child(self, child):
+        process = child.process
+        if process is None or process.returncode is not None:
+            return
+        try:
+            process.terminate()
+        except ProcessLookupError:
+            return
+        try:
+            await asyncio.wait_for(process.wait(), timeout=self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"{child.name} did not exit in {self.shutdown_timeout}s; killing it")
+            process.kill()
+            await process.wait()
+
+    async def shutdown(self):
+        """Stop restarting children and terminate every running one"""
+        self.stopping = True
+        await asyncio.gather(*(self._stop_child(child) for child in self.children.values()))
+        if self.tasks:
+            await asyncio.wait(list(self.tasks.values()), timeout=self.shutdown_timeout)
+        for child in self.children.values():
+            if child.process is not None and child.process.returncode is not None:
+                child.returncode = child.process.returncode
+            logging.info(f"{child.name} stopped (exit code {child.returncode})")
+
+
+def python_command(script, *args):
+    """Build the command line for running one of the backend scripts"""
+    return [sys.executable, script, *args]
@@ -0,0 +1,97 @@
+"""
+Incremental readers for product files.
+
+``iter_products`` yields product dicts one at a time from either a JSON array
+(the products.json format) or JSON Lines, reading the file in fixed-size
+blocks, so memory use stays bounded by the block size and the largest single
+product rather than the size of the file.
+"""
+
+import json
+from itertools import islice
+
+READ_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+
+
+def _skip_separators(buffer, pos):
+    """Skip whitespace and array commas starting at pos"""
+    length = len(buffer)
+    while pos < length and (buffer[pos] in _WHITESPACE or buffer[pos] == ","):
+        pos += 1
+    return pos
+
+
+def _iter_json_array(f, buffer, read_size):
+    """Yield the elements of a JSON array whose opening bracket was consumed"""
+    decoder = json.JSONDecoder()
+    pos = 0
+    while True:
+        pos = _skip_separators(buffer, pos)
+        if pos >= len(buffer):
+            chunk = f.read(read_size)
+            if not chunk:
+                raise ValueError("Unterminated JSON array")
+            buffer, pos = chunk, 0
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The element is split across blocks; read more and retry
+            chunk = f.read(read_size)
+            if not chunk:
+                raise
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield item
+        pos = end
+        if pos > read_size:
+            buffer, pos = buffer[pos:], 0
+
+
+def iter_products(file_path, read_size=READ_SIZE):
+    """Yield products from a JSON array or JSON Lines file without loading it whole.
+
+    An empty or whitespace-only file raises ValueError: it is far more likely
+    to be a file caught mid-write than a catalogue with no products (which
+    is written as ``[]``).
+    """
+    with open(file_path, "r", encoding="utf-8") as f:
+        head = f.read(read_size)
+        stripped = head.lstrip(_WHITESPACE)
+        while not stripped:
+            head = f.read(read_size)
+            if not head:
+                raise ValueError(f"{file_path} has no content")
+            stripped = head.lstrip(_WHITESPACE)
+        if stripped.startswith("["):
+            yield from _iter_json_array(f, stripped[1:], read_size)
+            return
+
+        # JSON Lines: one product per line
+        pending = head
+        while True:
+            lines = pending.split("\n")
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+            chunk = f.read(read_size)
+            if not chunk:
+                break
+            pending += chunk
+        if pending.strip():
+            yield json.loads(pending)
+
+
+def chunked(iterable, size):
+    """Yield lists of up to size items from iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,211 @@
+"""
+On-demand profiling for the live server.
+
+Two profile modes are supported:
+
+- ``sampling``: a background thread snapshots the stacks of every thread with
+  ``sys._current_frames()`` at a fixed interval and aggregates them into
+  collapsed stacks (one ``frame;frame;frame count`` line per unique stack),
+  ready for flamegraph tools.
+- ``deterministic``: request handlers and the periodic update loop run under a
+  per-thread ``cProfile.Profile`` while a session is active; the per-thread
+  results are merged into a single pstats report.
+
+Also provides the per-request timing breakdown returned in the
+``Server-Timing`` response header when a client sends ``X-Timing-Breakdown``.
+"""
+
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+MODES = ('sampling', 'deterministic')
+
+# Header a client sends to opt into a per-request timing breakdown
+TIMING_REQUEST_HEADER = 'X-Timing-Breakdown'
+
+_lock = threading.Lock()
+_session = None
+_last_result = None
+
+
+class ProfileSession:
+    """A single profiling run, stopped manually or after a fixed duration"""
+
+    def __init__(self, mode, seconds, interval=0.005):
+        self.mode = mode
+        self.seconds = seconds
+        self.interval = interval
+        self.started_at = time.time()
+        self.stopped = threading.Event()
+        self.stacks = Counter()
+        self.samples = 0
+        self.stats = None
+        self.profiled_calls = 0
+        self._stats_lock = threading.Lock()
+        self._sampler = None
+        self._timer = None
+
+    def start(self):
+        if self.mode == 'sampling':
+            self._sampler = threading.Thread(target=self._sample_loop, name='profile-sampler', daemon=True)
+            self._sampler.start()
+        self._timer = threading.Timer(self.seconds, stop)
+        self._timer.name = 'profile-timer'
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self.stopped.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def add_profile(self, profiler):
+        """Merge a finished per-thread profiler into the session"""
+        with self._stats_lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profiler)
+            else:
+                self.stats.add(profiler)
+            self.profiled_calls += 1
+
+    def finish(self):
+        self.stopped.set()
+        if self._timer is not None:
+            self._timer.cancel()
+        if self._sampler is not None and self._sampler is not threading.current_thread():
+            self._sampler.join()
+
+    def report(self, sort='cumulative', limit=50):
+        """Render the collapsed stacks or the pstats output as text"""
+        if self.mode == 'sampling':
+            return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + '\n'
+        if self.stats is None:
+            return 'No profiled calls were recorded.\n'
+        buffer = io.StringIO()
+        self.stats.stream = buffer
+        self.stats.sort_stats(sort).print_stats(limit)
+        return buffer.getvalue()
+
+    def summary(self):
+        return {
+            'mode': self.mode,
+            'seconds': self.seconds,
+            'started_at': self.started_at,
+            'running': not self.stopped.is_set(),
+            'samples': self.samples,
+            'profiled_calls': self.profiled_calls
+        }
+
+
+def start(mode='sampling', seconds=10, interval=0.005):
+    """Start a profiling session; returns None if one is already running"""
+    global _session
+    if mode not in MODES:
+        raise ValueError(f"Unknown profile mode: {mode}")
+    with _lock:
+        if _session is not None:
+            return None
+        _session = ProfileSession(mode, seconds, interval)
+    _session.start()
+    return _session
+
+
+def stop():
+    """Stop the active session and keep it as the last result"""
+    global _session, _last_result
+    with _lock:
+        session, _session = _session, None
+    if session is None:
+        return _last_result
+    session.finish()
+    _last_result = session
+    return session
+
+
+def status():
+    """Return the active session if any, otherwise the last finished one"""
+    return _session or _last_result
+
+
+@contextmanager
+def profiled():
+    """Run the enclosed block under cProfile when a deterministic session is active"""
+    session = _session
+    if session is None or session.mode != 'deterministic':
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        session.add_profile(profiler)
+
+
+def begin_request_profile():
+    """Start profiling the current request when a deterministic session is active"""
+    session = _session
+    if session is None or session.mode != 'deterministic':
+        return
+    profiler = cProfile.Profile()
+    g.profile = (session, profiler)
+    profiler.enable()
+
+
+def end_request_profile():
+    """Finish profiling the current request, if it was profiled"""
+    entry = g.pop('profile', None)
+    if entry is not None:
+        session, profiler = entry
+        profiler.disable()
+        session.add_profile(profiler)
+
+
+def begin_timing(headers):
+    """Enable the per-request timing breakdown if the client asked for it"""
+    if headers.get(TIMING_REQUEST_HEADER):
+        g.timings = {}
+
+
+@contextmanager
+def phase(name):
+    """Time a named phase of the current request when a breakdown was requested"""
+    timings = g.get('timings') if has_request_context() else None
+    if timings is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start_time
+
+
+def server_timing_header():
+    """Render the recorded phases as a Server-Timing header value, or None"""
+    timings = g.get('timings')
+    if timings is None:
+        return None
+    return ', '.join(f"{name};dur={duration * 1000:.3f}" for name, duration in timings.items())
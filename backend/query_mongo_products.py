@@ -1,8 +1,14 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from collections import OrderedDict
+import cmd
+import csv
 import json
 import logging
 from tabulate import tabulate
 import sys
+import time
+
+from mongo_queries import ANALYTICS, run_analytics, check_query_plans, ensure_indexes
 
 # Setup logging
 logging.basicConfig(
@@ -15,13 +21,100 @@ MONGO_URI = "mongodb://localhost:27017/"
 DB_NAME = "neunatics_db"
 COLLECTION_NAME = "products"
 
-def query_products(limit=5, product_id=None, category=None):
+# Cursor batch size for exports: large enough to amortise round trips
+EXPORT_BATCH_SIZE = 5000
+
+# How long query shell results and collection metadata are reused
+CACHE_TTL_SECONDS = 1.0
+METADATA_TTL_SECONDS = 30.0
+
+# Fields shown in the results table; full documents are only fetched on request
+TABLE_PROJECTION = {"_id": 0, "id": 1, "name": 1, "category": 1, "selling_price": 1, "current_stock": 1, "status": 1}
+
+class QuerySession:
+    """A long-lived MongoDB connection for repeated lookups.
+
+    The pooled client is opened once, collection metadata and the estimated
+    product count are cached for metadata_ttl seconds, and results of lookups
+    by id or category are kept in a small LRU cache for cache_ttl seconds, so
+    repeated queries skip the round trips entirely.
+    """
+    
+    def __init__(self, uri=MONGO_URI, cache_ttl=CACHE_TTL_SECONDS, metadata_ttl=METADATA_TTL_SECONDS,
+                 max_cache_entries=1024):
+        self.client = MongoClient(uri, serverSelectionTimeoutMS=5000, maxPoolSize=10)
+        self.collection = self.client[DB_NAME][COLLECTION_NAME]
+        self.cache_ttl = cache_ttl
+        self.metadata_ttl = metadata_ttl
+        self.max_cache_entries = max_cache_entries
+        self._exists = None
+        self._count = None
+        self._metadata_at = 0.0
+        self._cache = OrderedDict()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def _refresh_metadata(self):
+        if self._exists is not None and time.monotonic() - self._metadata_at < self.metadata_ttl:
+            return
+        # One filtered listCollections call covers both the database and the collection
+        names = self.client[DB_NAME].list_collection_names(filter={"name": COLLECTION_NAME})
+        self._exists = COLLECTION_NAME in names
+        self._count = self.collection.estimated_document_count() if self._exists else 0
+        self._metadata_at = time.monotonic()
+    
+    def collection_exists(self):
+        self._refresh_metadata()
+        return self._exists
+    
+    def estimated_count(self):
+        self._refresh_metadata()
+        return self._count
+    
+    def find(self, query_filter, projection=None, limit=0):
+        """Run a find, answering from the cache when an identical query is fresh"""
+        # A dict projection's values matter: {"name": 1} and {"name": 0} return different fields
+        fields = tuple(sorted(projection.items())) if isinstance(projection, dict) else tuple(sorted(projection or ()))
+        key = (tuple(sorted(query_filter.items())), fields, limit)
+        entry = self._cache.get(key)
+        now = time.monotonic()
+        if entry is not None and now - entry[0] < self.cache_ttl:
+            self._cache.move_to_end(key)
+            return entry[1]
+        
+        products = list(self.collection.find(query_filter, projection, limit=limit))
+        self._cache[key] = (now, products)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.max_cache_entries:
+            self._cache.popitem(last=False)
+        return products
+    
+    def get_by_id(self, product_id, projection=None):
+        products = self.find({"id": product_id}, projection, limit=1)
+        return products[0] if products else None
+    
+    def by_category(self, category, limit=0, projection=TABLE_PROJECTION):
+        return self.find({"category": category}, projection, limit)
+    
+    def refresh(self):
+        """Drop cached metadata and results"""
+        self._exists = None
+        self._cache.clear()
+    
+    def close(self):
+        self.client.close()
+
+def query_products(limit=5, product_id=None, category=None, session=None):
     """Query products from MongoDB and display them"""
+    owns_session = session is None
     try:
         # Connect to MongoDB
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-        db = client[DB_NAME]
-        products_collection = db[COLLECTION_NAME]
+        if owns_session:
+            session = QuerySession()
         
         # Build query filter
         query_filter = {}
@@ -30,44 +123,157 @@ def query_products(limit=5, product_id=None, category=None):
         if category:
             query_filter["category"] = category
             
-        # Check if database exists
-        if DB_NAME not in client.list_database_names():
-            logging.error(f"Database '{DB_NAME}' does not exist!")
-            return False
-            
-        # Check if collection exists
-        if COLLECTION_NAME not in db.list_collection_names():
-            logging.error(f"Collection '{COLLECTION_NAME}' does not exist!")
+        # Check if the collection exists
+        if not session.collection_exists():
+            logging.error(f"Collection '{DB_NAME}.{COLLECTION_NAME}' does not exist!")
             return False
             
-        # Count total products
-        total_count = products_collection.count_documents({})
+        # Count total products (from collection metadata, without scanning)
+        total_count = session.estimated_count()
         logging.info(f"Total products in database: {total_count}")
         
         if total_count == 0:
             logging.info("No products found in the database.")
             return False
             
-        # Fetch products
-        cursor = products_collection.find(query_filter).limit(limit)
-        products = list(cursor)
+        # Fetch only the fields shown in the table
+        products = session.find(query_filter, TABLE_PROJECTION, limit)
         
         if not products:
             logging.info("No products found matching the criteria.")
             return False
             
         # Display products in table format
-        display_products_table(products)
+        display_products_table(products, session.collection)
+        return True
         
+    except Exception as e:
+        logging.error(f"Error querying MongoDB: {e}")
+        return False
+    finally:
         # Close connection
-        client.close()
+        if owns_session and session is not None:
+            session.close()
+
+class QueryShell(cmd.Cmd):
+    """Interactive shell that keeps one QuerySession open between queries"""
+    
+    intro = "Product query shell. Type 'help' for commands, 'quit' to exit."
+    prompt = "products> "
+    
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+    
+    def _timed(self, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        print(f"({(time.perf_counter() - start) * 1000:.3f} ms)")
+        return result
+    
+    def _show(self, products):
+        if not products:
+            print("No products found.")
+            return
+        rows = [[p.get(field, "N/A") for field in ("id", "name", "category", "selling_price", "current_stock", "status")]
+                for p in products]
+        print(tabulate(rows, headers=["ID", "Name", "Category", "Price", "Stock", "Status"], tablefmt="simple"))
+    
+    def do_id(self, arg):
+        """id ID: show the full product with this id"""
+        product = self._timed(self.session.get_by_id, arg.strip(), {"_id": 0})
+        print(json.dumps(product, indent=2, default=str) if product else "No product found.")
+    
+    def do_category(self, arg):
+        """category NAME [LIMIT]: list products in a category"""
+        parts = arg.split()
+        if not parts:
+            print("Usage: category NAME [LIMIT]")
+            return
+        limit = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 20
+        self._show(self._timed(self.session.by_category, parts[0], limit))
+    
+    def do_count(self, arg):
+        """count: estimated number of products"""
+        print(self._timed(self.session.estimated_count))
+    
+    def do_report(self, arg):
+        """report NAME: run a server-side report (stock-value, low-stock, top-sellers)"""
+        name = arg.strip()
+        if name not in ANALYTICS:
+            print(f"Unknown report. Choose from: {', '.join(ANALYTICS)}")
+            return
+        rows = self._timed(run_analytics, self.session.collection, name)
+        print(tabulate(rows, headers="keys", tablefmt="simple") if rows else "No results.")
+    
+    def do_refresh(self, arg):
+        """refresh: drop cached metadata and results"""
+        self.session.refresh()
+    
+    def do_quit(self, arg):
+        """quit: exit the shell"""
         return True
+    
+    do_exit = do_quit
+    
+    def do_EOF(self, arg):
+        print()
+        return True
+    
+    def emptyline(self):
+        pass
+
+def run_shell(cache_ttl=CACHE_TTL_SECONDS):
+    """Run the interactive query shell on a single pooled connection"""
+    with QuerySession(cache_ttl=cache_ttl) as session:
+        try:
+            QueryShell(session).cmdloop()
+        except KeyboardInterrupt:
+            print()
+
+def run_report(report, limit=10, category=None):
+    """Run a server-side analytics pipeline and display the result"""
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+    try:
+        products_collection = client[DB_NAME][COLLECTION_NAME]
+        if report == "top-sellers":
+            rows = run_analytics(products_collection, report, limit=limit or 10)
+        elif report == "stock-value":
+            rows = run_analytics(products_collection, report, category=category)
+        else:
+            rows = run_analytics(products_collection, report)
         
+        if not rows:
+            logging.info("No results.")
+            return False
+        print(f"\n{report}:")
+        print(tabulate(rows, headers="keys", tablefmt="grid"))
+        return True
     except Exception as e:
-        logging.error(f"Error querying MongoDB: {e}")
+        logging.error(f"Error running {report} report: {e}")
+        return False
+    finally:
+        client.close()
+
+def check_indexes(drop_undeclared=False):
+    """Ensure the declared indexes exist and verify no common query scans the collection"""
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+    try:
+        products_collection = client[DB_NAME][COLLECTION_NAME]
+        ensure_indexes(products_collection, drop_undeclared=drop_undeclared)
+        scans = check_query_plans(products_collection)
+        if scans:
+            logging.error(f"{len(scans)} query shape(s) use a collection scan: {', '.join(scans)}")
+            return False
+        logging.info("All common query shapes are index-backed.")
+        return True
+    except Exception as e:
+        logging.error(f"Error checking query plans: {e}")
         return False
+    finally:
+        client.close()
 
-def display_products_table(products):
+def display_products_table(products, products_collection=None):
     """Display products in a formatted table"""
     # Select key fields to display
     table_data = []
@@ -95,47 +301,172 @@ def display_products_table(products):
     if choice:
         for product in products:
             if product.get("id") == choice:
+                if products_collection is not None:
+                    product = products_collection.find_one({"id": choice}, {"_id": 0}) or product
                 print("\nFull product details:")
-                print(json.dumps(product, indent=2))
+                print(json.dumps(product, indent=2, default=str))
                 break
 
+def export_products(product_id=None, category=None, fields=None, sort=None, skip=0, limit=0,
+                    output_format="jsonl", output=None, batch_size=EXPORT_BATCH_SIZE):
+    """Stream matching products to stdout or a file as JSON Lines or CSV.
+
+    Documents are written as they arrive from the cursor, so memory use is
+    constant regardless of how many products are exported.
+    """
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+    out = open(output, "w", newline="", encoding="utf-8") if output else sys.stdout
+    try:
+        products_collection = client[DB_NAME][COLLECTION_NAME]
+        
+        query_filter = {}
+        if product_id:
+            query_filter["id"] = product_id
+        if category:
+            query_filter["category"] = category
+        
+        projection = {"_id": 0}
+        if fields:
+            projection.update({field: 1 for field in fields})
+        
+        cursor = products_collection.find(query_filter, projection, batch_size=batch_size)
+        if sort:
+            cursor = cursor.sort(sort)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        
+        count = 0
+        if output_format == "csv":
+            writer = None
+            for product in cursor:
+                if writer is None:
+                    writer = csv.DictWriter(out, fieldnames=fields or list(product), extrasaction="ignore")
+                    writer.writeheader()
+                writer.writerow(product)
+                count += 1
+        else:
+            for product in cursor:
+                out.write(json.dumps(product, default=str))
+                out.write("\n")
+                count += 1
+        out.flush()
+        
+        logging.info(f"Exported {count} products")
+        return True
+    except BrokenPipeError:
+        # The reading end of a pipeline (e.g. `| head`) closed early
+        return True
+    except Exception as e:
+        logging.error(f"Error exporting products: {e}")
+        return False
+    finally:
+        if output:
+            out.close()
+        client.close()
+
+def parse_sort(value):
+    """Parse a sort spec such as 'sales_count:desc,name' into (field, direction) pairs"""
+    sort = []
+    for part in value.split(","):
+        field, _, direction = part.partition(":")
+        sort.append((field, DESCENDING if direction.lower() == "desc" else ASCENDING))
+    return sort
+
 def display_usage():
     """Display usage information"""
     print(f"Usage: python {sys.argv[0]} [OPTIONS]")
     print("\nOptions:")
-    print("  --limit N       Limit results to N products (default: 5)")
+    print("  --limit N       Limit results to N products (default: 5, none when exporting)")
     print("  --id ID         Filter by product ID")
     print("  --category CAT  Filter by product category")
     print("  --all           Show all products")
+    print(f"  --report NAME   Run a server-side report: {', '.join(ANALYTICS)}")
+    print("  --check-indexes Create declared indexes and verify query plans avoid collection scans")
+    print("  --drop-undeclared  With --check-indexes, also drop indexes not declared in mongo_queries")
+    print("  --shell         Start an interactive query shell on one pooled connection")
+    print("\nExport options (non-interactive, streamed from the cursor):")
+    print("  --export        Export instead of showing the interactive table")
+    print("  --format FMT    jsonl (default) or csv; implies --export")
+    print("  --output FILE   Write to FILE instead of stdout; implies --export")
+    print("  --fields A,B,C  Only export these fields")
+    print("  --sort SPEC     Sort by fields, e.g. sales_count:desc,name")
+    print("  --skip N        Skip the first N products")
+    print(f"  --batch-size N  Cursor batch size (default: {EXPORT_BATCH_SIZE})")
     print("  --help          Display this help message")
 
 def parse_args():
     """Parse command line arguments"""
-    limit = 5
-    product_id = None
-    category = None
+    options = {
+        "limit": None,
+        "product_id": None,
+        "category": None,
+        "report": None,
+        "check": False,
+        "drop_undeclared": False,
+        "shell": False,
+        "export": False,
+        "format": "jsonl",
+        "output": None,
+        "fields": None,
+        "sort": None,
+        "skip": 0,
+        "batch_size": EXPORT_BATCH_SIZE
+    }
+    int_options = {"--limit": "limit", "--skip": "skip", "--batch-size": "batch_size"}
     
     # Process command line arguments
     i = 1
     while i < len(sys.argv):
         arg = sys.argv[i]
-        if arg == "--limit" and i + 1 < len(sys.argv):
+        has_value = i + 1 < len(sys.argv)
+        if arg in int_options and has_value:
             try:
-                limit = int(sys.argv[i + 1])
+                options[int_options[arg]] = int(sys.argv[i + 1])
                 i += 2
             except ValueError:
-                logging.error("Limit must be a number")
+                logging.error(f"{arg} must be a number")
                 display_usage()
                 sys.exit(1)
-        elif arg == "--id" and i + 1 < len(sys.argv):
-            product_id = sys.argv[i + 1]
+        elif arg == "--id" and has_value:
+            options["product_id"] = sys.argv[i + 1]
             i += 2
-        elif arg == "--category" and i + 1 < len(sys.argv):
-            category = sys.argv[i + 1]
+        elif arg == "--category" and has_value:
+            options["category"] = sys.argv[i + 1]
             i += 2
         elif arg == "--all":
-            limit = 0  # No limit
+            options["limit"] = 0  # No limit
             i += 1
+        elif arg == "--report" and has_value and sys.argv[i + 1] in ANALYTICS:
+            options["report"] = sys.argv[i + 1]
+            i += 2
+        elif arg == "--check-indexes":
+            options["check"] = True
+            i += 1
+        elif arg == "--drop-undeclared":
+            options["drop_undeclared"] = True
+            i += 1
+        elif arg == "--shell":
+            options["shell"] = True
+            i += 1
+        elif arg == "--export":
+            options["export"] = True
+            i += 1
+        elif arg == "--format" and has_value and sys.argv[i + 1] in ("jsonl", "csv"):
+            options["format"] = sys.argv[i + 1]
+            options["export"] = True
+            i += 2
+        elif arg == "--output" and has_value:
+            options["output"] = sys.argv[i + 1]
+            options["export"] = True
+            i += 2
+        elif arg == "--fields" and has_value:
+            options["fields"] = [field for field in sys.argv[i + 1].split(",") if field]
+            i += 2
+        elif arg == "--sort" and has_value:
+            options["sort"] = parse_sort(sys.argv[i + 1])
+            i += 2
         elif arg == "--help":
             display_usage()
             sys.exit(0)
@@ -144,12 +475,30 @@ def parse_args():
             display_usage()
             sys.exit(1)
     
-    return limit, product_id, category
+    return options
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        limit, product_id, category = parse_args()
-    else:
-        limit, product_id, category = 5, None, None
+    options = parse_args()
     
-    query_products(limit, product_id, category) 
\ No newline at end of file
+    if options["check"]:
+        sys.exit(0 if check_indexes(options["drop_undeclared"]) else 1)
+    elif options["shell"]:
+        run_shell()
+    elif options["report"]:
+        run_report(options["report"], options["limit"] or 10, options["category"])
+    elif options["export"]:
+        succeeded = export_products(
+            product_id=options["product_id"],
+            category=options["category"],
+            fields=options["fields"],
+            sort=options["sort"],
+            skip=options["skip"],
+            limit=options["limit"] or 0,
+            output_format=options["format"],
+            output=options["output"],
+            batch_size=options["batch_size"]
+        )
+        sys.exit(0 if succeeded else 1)
+    else:
+        limit = 5 if options["limit"] is None else options["limit"]
+        query_products(limit, options["product_id"], options["category"])
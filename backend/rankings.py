@@ -0,0 +1,159 @@
+"""
+Top-K product rankings maintained on every mutation.
+
+Each ranking metric keeps a sorted index over the whole catalogue and one per
+category, so ``top(by, k)`` reads the first k entries instead of sorting all
+products. An update moves one product's entry with a bisect (O(log n) to find,
+plus a list shift).
+
+Metrics:
+
+- ``sales_count``: the product's sales_count field
+- ``stock_value``: current_stock * cost_price
+- ``velocity``: how fast stock is moving out, in units per hour, from the
+  decreases in current_stock seen by the server, exponentially decayed with a
+  half-life of ``half_life`` seconds. Scores use forward decay: every decrease
+  is stored weighted by exp(rate * (t - landmark)), so all products age by the
+  same factor and the ranking never has to be re-sorted as time passes.
+"""
+
+import math
+import threading
+import time
+from bisect import bisect_left, insort
+
+METRICS = ('sales_count', 'velocity', 'stock_value')
+
+# Default half-life of the velocity metric
+VELOCITY_HALF_LIFE = 3600.0
+
+# Forward-decay weights are rebased before exp() gets anywhere near overflowing
+MAX_DECAY_EXPONENT = 500.0
+
+
+class SortedIndex:
+    """Product ids ordered by descending score (ties by id)"""
+
+    def __init__(self):
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, product_id, score):
+        insort(self._entries, (-score, product_id))
+
+    def remove(self, product_id, score):
+        index = bisect_left(self._entries, (-score, product_id))
+        if index < len(self._entries) and self._entries[index] == (-score, product_id):
+            del self._entries[index]
+
+    def top(self, k):
+        return [(product_id, -negated) for negated, product_id in self._entries[:k]]
+
+    def scale(self, factor):
+        # Multiplying every score by the same positive factor keeps the order
+        self._entries = [(negated * factor, product_id) for negated, product_id in self._entries]
+
+
+class ProductRankings:
+    """Sorted indexes per metric, overall and per category"""
+
+    def __init__(self, half_life=VELOCITY_HALF_LIFE):
+        self.decay_rate = math.log(2) / half_life
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._landmark = time.time()
+        self._products = {}
+        self._scores = {}
+        self._moved = {}
+        self._overall = {metric: SortedIndex() for metric in METRICS}
+        self._by_category = {metric: {} for metric in METRICS}
+
+    def _metric_scores(self, product):
+        return {
+            'sales_count': float(product.get('sales_count') or 0),
+            'velocity': self._moved.get(product['id'], 0.0),
+            'stock_value': float(product['current_stock']) * float(product['cost_price'])
+        }
+
+    def _unindex(self, product_id):
+        entry = self._scores.pop(product_id, None)
+        if entry is None:
+            return
+        category, scores = entry
+        for metric, score in scores.items():
+            self._overall[metric].remove(product_id, score)
+            index = self._by_category[metric].get(category)
+            if index is not None:
+                index.remove(product_id, score)
+                if not len(index):
+                    del self._by_category[metric][category]
+
+    def _index(self, product):
+        product_id = product['id']
+        scores = self._metric_scores(product)
+        category = product.get('category')
+        for metric, score in scores.items():
+            self._overall[metric].add(product_id, score)
+            self._by_category[metric].setdefault(category, SortedIndex()).add(product_id, score)
+        self._scores[product_id] = (category, scores)
+        self._products[product_id] = product
+
+    def _rebase(self, now):
+        factor = math.exp(-self.decay_rate * (now - self._landmark))
+        self._landmark = now
+        self._moved = {product_id: moved * factor for product_id, moved in self._moved.items()}
+        for _, scores in self._scores.values():
+            scores['velocity'] *= factor
+        self._overall['velocity'].scale(factor)
+        for index in self._by_category['velocity'].values():
+            index.scale(factor)
+
+    def rebuild(self, products):
+        """Index a freshly loaded catalogue (velocity history starts empty)"""
+        with self._lock:
+            self._reset()
+            for product in products:
+                self._index(product)
+
+    def update(self, product, previous_stock=None, now=None):
+        """Re-index a created or changed product; previous_stock feeds the velocity metric"""
+        with self._lock:
+            if previous_stock is not None:
+                moved = float(previous_stock) - float(product['current_stock'])
+                if moved > 0:
+                    now = now or time.time()
+                    if self.decay_rate * (now - self._landmark) > MAX_DECAY_EXPONENT:
+                        self._rebase(now)
+                    weight = math.exp(self.decay_rate * (now - self._landmark))
+                    self._moved[product['id']] = self._moved.get(product['id'], 0.0) + moved * weight
+            self._unindex(product['id'])
+            self._index(product)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._unindex(product_id)
+            self._products.pop(product_id, None)
+            self._moved.pop(product_id, None)
+
+    def velocity(self, score, now=None):
+        """Convert a stored velocity score to units per hour"""
+        age = (now or time.time()) - self._landmark
+        return score * math.exp(-self.decay_rate * age) * self.decay_rate * 3600
+
+    def top(self, by, k, category=None):
+        """Return [(product, value)] for the k highest-ranked products"""
+        if by not in METRICS:
+            raise ValueError(f"Unknown ranking: {by} (expected one of {', '.join(METRICS)})")
+        with self._lock:
+            index = self._overall[by] if category is None else self._by_category[by].get(category)
+            if index is None:
+                return []
+            ranked = [(self._products[product_id], score) for product_id, score in index.top(k)]
+            if by == 'velocity':
+                now = time.time()
+                ranked = [(product, self.velocity(score, now)) for product, score in ranked]
+            return ranked
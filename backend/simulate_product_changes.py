@@ -1,6 +1,7 @@
 import json
 import os
 import random
+import tempfile
 import time
 import logging
 from datetime import datetime, timedelta
@@ -14,28 +15,45 @@ logging.basicConfig(
 # Path to products.json file
 PRODUCTS_JSON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "products.json")
 
-def load_products():
+def load_products(file_path=None):
     """Load products from JSON file"""
     try:
-        with open(PRODUCTS_JSON_PATH, 'r') as file:
+        with open(file_path or PRODUCTS_JSON_PATH, 'r') as file:
             products = json.load(file)
         return products
     except Exception as e:
         logging.error(f"Error loading products: {e}")
         return None
 
-def save_products(products):
-    """Save products to JSON file"""
+def save_products(products, file_path=None):
+    """Save products to JSON file.
+
+    The products are written to a temporary file in the same directory which
+    then replaces the original with an atomic rename, so readers (such as the
+    MongoDB sync) only ever see the old or the new complete file.
+    """
+    file_path = file_path or PRODUCTS_JSON_PATH
+    temp_path = None
     try:
-        with open(PRODUCTS_JSON_PATH, 'w') as file:
+        fd, temp_path = tempfile.mkstemp(prefix=".products-", suffix=".tmp", dir=os.path.dirname(file_path))
+        with os.fdopen(fd, 'w') as file:
             json.dump(products, file, indent=2)
+        # mkstemp creates the file as 0600; keep the mode the app and sync worker rely on
+        try:
+            mode = os.stat(file_path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, file_path)
         return True
     except Exception as e:
         logging.error(f"Error saving products: {e}")
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
         return False
 
 def update_random_product(products):
-    """Update a random product in the products list"""
+    """Update a random product in the products list; returns the product"""
     if not products:
         return False
         
@@ -79,15 +97,16 @@ def update_random_product(products):
     # Add updated_at timestamp
     product["updated_at"] = datetime.now().isoformat()
     
-    return True
+    return product
 
 def add_new_product(products):
-    """Add a new product to the products list"""
-    # Generate a new product ID
+    """Add a new product to the products list; returns the product"""
+    # Generate a new product ID; the range grows with the catalogue so a free id is always found quickly
     existing_ids = set(p["id"] for p in products)
-    new_id = str(random.randint(1, 1000))
+    id_range = max(1000, 2 * len(products))
+    new_id = str(random.randint(1, id_range))
     while new_id in existing_ids:
-        new_id = str(random.randint(1, 1000))
+        new_id = str(random.randint(1, id_range))
         
     # Generate random product data
     categories = ["fruits", "vegetables", "meat", "bakery", "dairy", "snacks", "beverages", "canned goods", "spices"]
@@ -112,10 +131,10 @@ def add_new_product(products):
     products.append(new_product)
     logging.info(f"Added new product: {new_product['name']} (ID: {new_id})")
     
-    return True
+    return new_product
 
 def delete_random_product(products):
-    """Delete a random product from the products list"""
+    """Delete a random product from the products list; returns the deleted product"""
     if not products or len(products) <= 5:  # Keep at least 5 products
         return False
         
@@ -129,47 +148,81 @@ def delete_random_product(products):
     
     logging.info(f"Deleted product: {product_name} (ID: {product_id})")
     
-    return True
+    return product
+
+def apply_random_change(products):
+    """Apply one random update, addition or deletion to the products list"""
+    action = random.choices(
+        ["update", "add", "delete"], 
+        weights=[0.7, 0.2, 0.1]
+    )[0]
+    
+    if action == "update":
+        return update_random_product(products)
+    elif action == "add":
+        return add_new_product(products)
+    elif action == "delete":
+        return delete_random_product(products)
+
+def positive_int(value):
+    """argparse type for counts that must be at least 1"""
+    number = int(value)
+    if number < 1:
+        raise ValueError(f"{value} is not a positive integer")
+    return number
+
+def simulate_changes(interval=5, max_changes=10, batch_size=1, seed=None):
+    """Simulate changes to the products.json file.
 
-def simulate_changes(interval=5, max_changes=10):
-    """Simulate changes to the products.json file"""
+    Products are loaded once and kept in memory. Every interval seconds (which
+    may be fractional) batch_size changes are applied and written in a single
+    atomic save. Writes follow a fixed schedule, so the time spent writing does
+    not lower the rate. With a seed, the same starting file always produces
+    the same sequence of changes. max_changes of 0 runs until interrupted.
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}")
     changes_made = 0
+    writes = 0
     
-    logging.info(f"Starting simulation. Will make up to {max_changes} changes.")
+    if seed is not None:
+        random.seed(seed)
+    
+    limit = max_changes if max_changes else "unlimited"
+    logging.info(f"Starting simulation. Will make up to {limit} changes, {batch_size} per write every {interval} seconds.")
     logging.info(f"Press Ctrl+C to stop the simulation.")
     
     try:
-        while changes_made < max_changes:
-            # Load current products
-            products = load_products()
-            if not products:
-                break
-                
-            # Choose a random action
-            action = random.choices(
-                ["update", "add", "delete"], 
-                weights=[0.7, 0.2, 0.1]
-            )[0]
+        products = load_products()
+        if not products:
+            return
+        
+        next_write = time.monotonic()
+        while not max_changes or changes_made < max_changes:
+            batch = batch_size if not max_changes else min(batch_size, max_changes - changes_made)
+            for _ in range(batch):
+                apply_random_change(products)
             
-            if action == "update":
-                update_random_product(products)
-            elif action == "add":
-                add_new_product(products)
-            elif action == "delete":
-                delete_random_product(products)
-                
             # Save changes
-            save_products(products)
-            changes_made += 1
+            if not save_products(products):
+                break
+            changes_made += batch
+            writes += 1
             
             # Wait before making the next change
-            logging.info(f"Change {changes_made}/{max_changes} completed. Waiting {interval} seconds...")
-            time.sleep(interval)
+            logging.info(f"Change {changes_made}/{limit} completed. Waiting {interval} seconds...")
+            next_write += interval
+            delay = next_write - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Falling behind; don't try to catch up with a burst of writes
+                next_write = time.monotonic()
             
-        logging.info(f"Simulation completed. Made {changes_made} changes.")
+        logging.info(f"Simulation completed. Made {changes_made} changes in {writes} writes.")
         
     except KeyboardInterrupt:
-        logging.info(f"Simulation stopped by user. Made {changes_made} changes.")
+        logging.info(f"Simulation stopped by user. Made {changes_made} changes in {writes} writes.")
     except Exception as e:
         logging.error(f"Error during simulation: {e}")
         
@@ -177,9 +230,11 @@ if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description="Simulate changes to products.json file")
-    parser.add_argument("--interval", type=int, default=5, help="Time interval between changes in seconds")
-    parser.add_argument("--max-changes", type=int, default=10, help="Maximum number of changes to make")
+    parser.add_argument("--interval", type=float, default=5, help="Time interval between writes in seconds (fractions allowed)")
+    parser.add_argument("--max-changes", type=int, default=10, help="Maximum number of changes to make (0 for no limit)")
+    parser.add_argument("--batch", type=positive_int, default=1, help="Number of changes applied per write")
+    parser.add_argument("--seed", type=int, help="Random seed for a reproducible sequence of changes")
     
     args = parser.parse_args()
     
-    simulate_changes(interval=args.interval, max_changes=args.max_changes) 
\ No newline at end of file
+    simulate_changes(interval=args.interval, max_changes=args.max_changes, batch_size=args.batch, seed=args.seed)
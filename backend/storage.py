@@ -0,0 +1,251 @@
+"""
+Pluggable storage backends for the product store.
+
+Every backend implements the same small interface:
+
+    load()                       -> list of all products
+    get(product_id)              -> product dict or None
+    upsert(product)              -> insert or replace one product
+    delete(product_id)           -> remove one product
+    scan(**filters)              -> iterator of products whose fields equal the filters
+    batch(upserts=(), deletes=()) -> apply many changes in one write
+    close()
+
+Available backends (selected with ``create_backend``):
+
+- ``json``: the original whole-file products.json dump
+- ``sqlite``: embedded SQLite in WAL mode with indexes on id, sku, category and status
+- ``mongo``: the MongoDB products collection used by db_sync
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+
+BACKENDS = ('json', 'sqlite', 'mongo')
+
+# Columns SQLite stores separately (and indexes) so scans on them avoid decoding every row
+INDEXED_FIELDS = ('sku', 'category', 'status')
+
+
+def _matches(product, filters):
+    return all(product.get(key) == value for key, value in filters.items())
+
+
+class StorageBackend:
+    """Base class; subclasses implement the storage primitives"""
+
+    name = None
+
+    # Bytes written by the last write, when the backend can tell
+    last_write_bytes = 0
+
+    def load(self):
+        raise NotImplementedError
+
+    def get(self, product_id):
+        raise NotImplementedError
+
+    def upsert(self, product):
+        self.batch(upserts=[product])
+
+    def delete(self, product_id):
+        self.batch(deletes=[product_id])
+
+    def scan(self, **filters):
+        raise NotImplementedError
+
+    def batch(self, upserts=(), deletes=()):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonFileBackend(StorageBackend):
+    """Products kept in memory and written to one JSON file on every change.
+
+    Each write goes to a temporary file in the same directory that then
+    replaces products.json with an atomic rename, so a crash mid-write never
+    truncates the catalogue and the file watcher never sees a partial file.
+    """
+
+    name = 'json'
+
+    def __init__(self, path):
+        self.path = path
+        self._products = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                with open(self.path, 'r') as f:
+                    self._products = {product['id']: product for product in json.load(f)}
+            else:
+                self._products = {}
+            return list(self._products.values())
+
+    def get(self, product_id):
+        return self._products.get(product_id)
+
+    def scan(self, **filters):
+        return (product for product in list(self._products.values()) if _matches(product, filters))
+
+    def batch(self, upserts=(), deletes=()):
+        with self._lock:
+            for product in upserts:
+                self._products[product['id']] = product
+            for product_id in deletes:
+                self._products.pop(product_id, None)
+            fd, temp_path = tempfile.mkstemp(prefix='.products-', suffix='.tmp', dir=os.path.dirname(self.path))
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(list(self._products.values()), f, indent=2)
+                    self.last_write_bytes = f.tell()
+                # mkstemp creates the file as 0600; keep the mode readers of products.json rely on
+                try:
+                    mode = os.stat(self.path).st_mode & 0o777
+                except FileNotFoundError:
+                    mode = 0o644
+                os.chmod(temp_path, mode)
+                os.replace(temp_path, self.path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+
+class SqliteBackend(StorageBackend):
+    """Embedded SQLite store; each product is a JSON document plus indexed columns"""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS products ('
+            'id TEXT PRIMARY KEY, sku TEXT, category TEXT, status TEXT, data TEXT NOT NULL)'
+        )
+        for field in INDEXED_FIELDS:
+            self._conn.execute(f'CREATE INDEX IF NOT EXISTS idx_products_{field} ON products ({field})')
+
+    @staticmethod
+    def row(product):
+        """The table row of a product, for write_rows (bulk writers build rows in other processes)"""
+        data = json.dumps(product, separators=(',', ':'))
+        return (product['id'], product.get('sku'), product.get('category'), product.get('status'), data)
+
+    def load(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT data FROM products ORDER BY rowid').fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def get(self, product_id):
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM products WHERE id = ?', (product_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def scan(self, **filters):
+        indexed = {key: value for key, value in filters.items() if key in INDEXED_FIELDS or key == 'id'}
+        remaining = {key: value for key, value in filters.items() if key not in indexed}
+        sql = 'SELECT data FROM products'
+        if indexed:
+            sql += ' WHERE ' + ' AND '.join(f'{key} = ?' for key in indexed)
+        with self._lock:
+            rows = self._conn.execute(sql + ' ORDER BY rowid', tuple(indexed.values())).fetchall()
+        for (data,) in rows:
+            product = json.loads(data)
+            if _matches(product, remaining):
+                yield product
+
+    def batch(self, upserts=(), deletes=()):
+        self.write_rows([self.row(product) for product in upserts], deletes)
+
+    def write_rows(self, rows, deletes=()):
+        """Upsert rows built by row() and delete products by id, in one transaction"""
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                if rows:
+                    self._conn.executemany(
+                        'INSERT INTO products (id, sku, category, status, data) VALUES (?, ?, ?, ?, ?) '
+                        'ON CONFLICT(id) DO UPDATE SET sku = excluded.sku, category = excluded.category, '
+                        'status = excluded.status, data = excluded.data',
+                        rows
+                    )
+                if deletes:
+                    self._conn.executemany('DELETE FROM products WHERE id = ?', [(product_id,) for product_id in deletes])
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        self.last_write_bytes = sum(len(row[4]) for row in rows)
+
+    def clear(self):
+        """Delete every product"""
+        with self._lock:
+            self._conn.execute('DELETE FROM products')
+
+    def close(self):
+        self._conn.close()
+
+
+class MongoBackend(StorageBackend):
+    """Products stored directly in the MongoDB products collection.
+
+    db_sync also writes that collection, so it leaves it alone (no
+    products.json sync) when run with STORAGE_BACKEND=mongo.
+    """
+
+    name = 'mongo'
+
+    def __init__(self, uri, db_name, collection_name):
+        # pymongo is only needed when this backend is selected
+        from pymongo import MongoClient
+        from mongo_queries import ensure_indexes
+
+        self.client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+        self.collection = self.client[db_name][collection_name]
+        ensure_indexes(self.collection)
+
+    def load(self):
+        return list(self.collection.find({}, {'_id': 0}))
+
+    def get(self, product_id):
+        return self.collection.find_one({'id': product_id}, {'_id': 0})
+
+    def scan(self, **filters):
+        return self.collection.find(filters, {'_id': 0})
+
+    def batch(self, upserts=(), deletes=()):
+        from pymongo import ReplaceOne, DeleteOne
+
+        operations = [
+            ReplaceOne({'id': product['id']}, {k: v for k, v in product.items() if k != '_id'}, upsert=True)
+            for product in upserts
+        ]
+        operations.extend(DeleteOne({'id': product_id}) for product_id in deletes)
+        if operations:
+            self.collection.bulk_write(operations, ordered=True)
+
+    def close(self):
+        self.client.close()
+
+
+def create_backend(name, data_dir, mongo_uri='mongodb://localhost:27017/',
+                   db_name='neunatics_db', collection_name='products'):
+    """Create the storage backend called name, keeping its files in data_dir"""
+    if name == 'json':
+        return JsonFileBackend(os.path.join(data_dir, 'products.json'))
+    if name == 'sqlite':
+        return SqliteBackend(os.path.join(data_dir, 'products.sqlite3'))
+    if name == 'mongo':
+        return MongoBackend(mongo_uri, db_name, collection_name)
+    raise ValueError(f"Unknown storage backend: {name} (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark the storage backends at large catalogue sizes.
+
+For each backend this measures bulk load, single-product upserts, lookups by
+id and scans by category, and prints the throughput in operations per second.
+The MongoDB backend is skipped when no server is reachable.
+
+Usage:
+    python storage_benchmark.py --products 100000 --backends json sqlite mongo
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+from storage import BACKENDS, create_backend
+from product_stream import chunked
+
+CATEGORIES = ['fruits', 'vegetables', 'dairy', 'meat', 'bakery', 'beverages', 'snacks', 'canned goods', 'frozen foods', 'spices']
+UNITS = ['kg', 'g', 'lb', 'pcs', 'bottles', 'boxes', 'cans', 'packages']
+
+
+def make_products(count, seed=42):
+    """Generate synthetic products shaped like data_generator's output"""
+    rng = random.Random(seed)
+    products = []
+    for i in range(count):
+        current_stock = rng.randint(0, 100)
+        min_stock = rng.randint(10, 20)
+        cost_price = round(rng.uniform(1, 50), 2)
+        products.append({
+            'id': str(i + 1),
+            'name': f"Product {i + 1}",
+            'sku': f"SKU-{i + 1:08d}",
+            'category': rng.choice(CATEGORIES),
+            'description': 'Benchmark product',
+            'current_stock': current_stock,
+            'min_stock_level': min_stock,
+            'unit': rng.choice(UNITS),
+            'cost_price': cost_price,
+            'selling_price': round(cost_price * rng.uniform(1.1, 1.5), 2),
+            'status': 'out_of_stock' if current_stock == 0 else 'low_stock' if current_stock <= min_stock else 'active',
+            'sales_count': rng.randint(0, 500),
+            'created_at': '2025-01-01T00:00:00'
+        })
+    return products
+
+
+def timed(operation_count, fn):
+    """Run fn and return operations per second"""
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    return operation_count / elapsed if elapsed > 0 else float('inf')
+
+
+def benchmark_backend(name, data_dir, products, upserts, lookups, scans):
+    backend = create_backend(name, data_dir, db_name='neunatics_benchmark')
+    rng = random.Random(7)
+    try:
+        if name == 'mongo':
+            backend.collection.delete_many({})
+        results = {}
+        results['bulk load'] = timed(len(products), lambda: [backend.batch(upserts=chunk) for chunk in chunked(products, 5000)])
+        if name == 'json':
+            # The JSON backend keeps products in memory once loaded
+            backend.load()
+
+        targets = [rng.choice(products) for _ in range(upserts)]
+
+        def run_upserts():
+            for product in targets:
+                product = dict(product, current_stock=rng.randint(0, 100))
+                backend.upsert(product)
+        results['upsert'] = timed(upserts, run_upserts)
+
+        ids = [rng.choice(products)['id'] for _ in range(lookups)]
+        results['get by id'] = timed(lookups, lambda: [backend.get(product_id) for product_id in ids])
+
+        categories = [rng.choice(CATEGORIES) for _ in range(scans)]
+        results['scan by category'] = timed(scans, lambda: [list(backend.scan(category=category)) for category in categories])
+
+        results['full load'] = timed(1, backend.load)
+        return results
+    finally:
+        if name == 'mongo':
+            backend.collection.drop()
+        backend.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark product storage backends")
+    parser.add_argument("--products", type=int, default=100000, help="Catalogue size")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--upserts", type=int, default=1000, help="Single-product upserts (JSON is capped at 20)")
+    parser.add_argument("--lookups", type=int, default=10000, help="Lookups by id")
+    parser.add_argument("--scans", type=int, default=20, help="Scans by category")
+    args = parser.parse_args()
+
+    products = make_products(args.products)
+    print(f"Benchmarking {args.products} products\n")
+    print(f"{'backend':<8} {'operation':<18} {'ops/s':>14}")
+    print("-" * 42)
+
+    for name in args.backends:
+        data_dir = tempfile.mkdtemp(prefix=f"storage-bench-{name}-")
+        # Every JSON upsert rewrites the whole file, so keep its count small
+        upserts = min(args.upserts, 20) if name == 'json' else args.upserts
+        try:
+            results = benchmark_backend(name, data_dir, products, upserts, args.lookups, args.scans)
+        except Exception as e:
+            print(f"{name:<8} skipped: {e}")
+            continue
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+        for operation, rate in results.items():
+            print(f"{name:<8} {operation:<18} {rate:>14,.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Measure how far MongoDB lags behind products.json under load.
+
+The benchmark seeds a scratch products file and collection, then runs the
+file-watching sync from db_sync in a background thread. It applies
+simulate_product_changes' random updates, additions and deletions at a fixed
+rate. Every change stamps the product with a sequence number. A poller
+records when that sequence number (or, for deletes, the product's absence)
+becomes visible in the collection. The report gives p50/p95/p99 propagation
+lag, sync throughput and the CPU time used by the sync thread.
+
+It runs against a local mongod, or fully in-process with mongomock (--mock).
+
+Usage:
+    python sync_benchmark.py --rate 20 --duration 30
+    python sync_benchmark.py --mock --rate 50 --duration 10
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import db_sync
+import simulate_product_changes as simulator
+from mongo_queries import ensure_indexes
+from storage_benchmark import make_products
+
+# Field stamped on each changed product so its write can be matched in MongoDB
+SEQ_FIELD = "bench_seq"
+
+# Time allowed for the sync thread to start watching before changes begin
+WARMUP_SECONDS = 0.5
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def thread_cpu_seconds(thread):
+    """CPU time used so far by another thread, or None where the platform cannot tell"""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+    except (AttributeError, OSError):
+        return None
+
+
+def open_collection(mongo_uri, mock):
+    if mock:
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("--mock needs the mongomock package (pip install mongomock)")
+        client = mongomock.MongoClient()
+    else:
+        from pymongo import MongoClient
+        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+    collection = client["neunatics_benchmark"]["sync_lag"]
+    collection.drop()
+    ensure_indexes(collection)
+    return client, collection
+
+
+class VisibilityTracker:
+    """Poll the collection until each pending change is visible.
+
+    Changes are tracked per product. A later change to the same product that
+    becomes visible also resolves the earlier ones it overwrote in the file.
+    """
+
+    def __init__(self, collection, poll_interval):
+        self.collection = collection
+        self.poll_interval = poll_interval
+        self.pending = {}
+        self.lags = []
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="visibility-poller", daemon=True)
+
+    def add(self, product_id, seq, deleted, written_at):
+        with self.lock:
+            self.pending.setdefault(product_id, []).append((seq, deleted, written_at))
+
+    def outstanding(self):
+        with self.lock:
+            return sum(len(changes) for changes in self.pending.values())
+
+    def poll(self):
+        with self.lock:
+            product_ids = list(self.pending)
+        if not product_ids:
+            return
+        visible = {
+            document["id"]: document.get(SEQ_FIELD, -1)
+            for document in self.collection.find({"id": {"$in": product_ids}}, {"_id": 0, "id": 1, SEQ_FIELD: 1})
+        }
+        now = time.time()
+        with self.lock:
+            for product_id in product_ids:
+                changes = self.pending.get(product_id, [])
+                if product_id in visible:
+                    # Everything up to the stamped sequence number has landed
+                    resolved = [change for change in changes if change[0] <= visible[product_id]]
+                else:
+                    # Gone: resolved if the latest change was a delete
+                    resolved = changes if changes and changes[-1][1] else []
+                if resolved:
+                    self.lags.extend(now - written_at for _, _, written_at in resolved)
+                    remaining = changes[len(resolved):] if product_id in visible else []
+                    if remaining:
+                        self.pending[product_id] = remaining
+                    else:
+                        self.pending.pop(product_id, None)
+
+    def run(self):
+        while not self.stop.is_set():
+            self.poll()
+            time.sleep(self.poll_interval)
+
+
+def apply_change(products, seq):
+    """Apply one random simulator change; returns (product_id, deleted) or None"""
+    action = random.choices(["update", "add", "delete"], weights=[0.7, 0.2, 0.1])[0]
+    if action == "update":
+        product = simulator.update_random_product(products)
+    elif action == "add":
+        product = simulator.add_new_product(products)
+    else:
+        product = simulator.delete_random_product(products)
+    if not product:
+        return None
+    if action == "delete":
+        return product["id"], True
+    product[SEQ_FIELD] = seq
+    return product["id"], False
+
+
+def run_benchmark(rate=20.0, duration=30.0, products=500, mongo_uri=db_sync.MONGO_URI, mock=False,
+                  poll_interval=0.005, timeout=10.0, seed=42):
+    """Run the benchmark and return a dict of results"""
+    random.seed(seed)
+    data_dir = tempfile.mkdtemp(prefix="sync-bench-")
+    file_path = os.path.join(data_dir, "products.json")
+    client, collection = open_collection(mongo_uri, mock)
+    catalogue = make_products(products, seed=seed)
+    simulator.save_products(catalogue, file_path)
+
+    stop = threading.Event()
+    db_sync.synced_hashes = None
+    db_sync.sync_products_to_mongodb(collection, file_path=file_path)
+    sync_thread = threading.Thread(
+        target=db_sync.monitor_json_file, name="db-sync", daemon=True,
+        kwargs={"products_collection": collection, "file_path": file_path, "stop": stop}
+    )
+    sync_thread.start()
+    tracker = VisibilityTracker(collection, poll_interval)
+    tracker.thread.start()
+    time.sleep(WARMUP_SECONDS)
+
+    cpu_started = thread_cpu_seconds(sync_thread)
+    process_cpu_started = time.process_time()
+    started = time.time()
+    written = 0
+    try:
+        # Open-loop schedule: a slow write does not push back the ones after it
+        while time.time() - started < duration:
+            change = apply_change(catalogue, written + 1)
+            if change is None:
+                continue
+            simulator.save_products(catalogue, file_path)
+            written += 1
+            tracker.add(change[0], written, change[1], time.time())
+            delay = started + written / rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        write_seconds = time.time() - started
+
+        deadline = time.time() + timeout
+        while tracker.outstanding() and time.time() < deadline:
+            time.sleep(poll_interval)
+        elapsed = time.time() - started
+        cpu_finished = thread_cpu_seconds(sync_thread)
+        process_cpu = time.process_time() - process_cpu_started
+    finally:
+        tracker.stop.set()
+        stop.set()
+        sync_thread.join(timeout=5)
+        tracker.thread.join(timeout=5)
+        collection.drop()
+        client.close()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    lags = sorted(tracker.lags)
+    sync_cpu = None if cpu_started is None or cpu_finished is None else cpu_finished - cpu_started
+    return {
+        "written": written,
+        "write_rate": written / write_seconds if write_seconds > 0 else 0.0,
+        "visible": len(lags),
+        "lost": tracker.outstanding(),
+        "p50": percentile(lags, 0.50),
+        "p95": percentile(lags, 0.95),
+        "p99": percentile(lags, 0.99),
+        "max": lags[-1] if lags else float("nan"),
+        "throughput": len(lags) / elapsed if elapsed > 0 else 0.0,
+        "sync_cpu": sync_cpu,
+        "process_cpu": process_cpu,
+        "elapsed": elapsed,
+    }
+
+
+def print_report(results, rate, mock):
+    print(f"\nSync lag benchmark ({'mongomock' if mock else 'mongod'})")
+    print(f"Changes written:   {results['written']} at {results['write_rate']:.1f}/s (target {rate:g}/s)")
+    print(f"Changes visible:   {results['visible']} ({results['lost']} not visible before the timeout)")
+    print(f"Propagation lag:   p50 {results['p50'] * 1000:.1f} ms, p95 {results['p95'] * 1000:.1f} ms, "
+          f"p99 {results['p99'] * 1000:.1f} ms, max {results['max'] * 1000:.1f} ms")
+    print(f"Sync throughput:   {results['throughput']:.1f} changes/s")
+    if results["sync_cpu"] is not None:
+        print(f"Sync thread CPU:   {results['sync_cpu']:.2f}s ({results['sync_cpu'] / results['elapsed'] * 100:.1f}% of one core)")
+    print(f"Process CPU:       {results['process_cpu']:.2f}s ({results['process_cpu'] / results['elapsed'] * 100:.1f}% of one core, "
+          f"includes the simulator and poller)")
+
+
+def add_arguments(parser):
+    parser.add_argument("--rate", type=float, default=20.0, help="Changes written per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to keep writing changes")
+    parser.add_argument("--products", type=int, default=500, help="Catalogue size of the scratch products file")
+    parser.add_argument("--mongo-uri", default=db_sync.MONGO_URI, help="MongoDB server to benchmark against")
+    parser.add_argument("--mock", action="store_true", help="Use an in-process mongomock collection instead of a server")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds to wait for outstanding changes at the end")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+
+
+def run(args):
+    # Per-change logging from the simulator and the sync would swamp the report
+    logging.getLogger().setLevel(logging.WARNING)
+    results = run_benchmark(rate=args.rate, duration=args.duration, products=args.products,
+                            mongo_uri=args.mongo_uri, mock=args.mock, timeout=args.timeout)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results, args.rate, args.mock)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark products.json to MongoDB sync lag")
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Per-company product partitions.
+
+Each company (the ``company_id`` of data_generator's relational data) gets its
+own Tenant: a product index, incrementally maintained aggregates, an activity
+log, a Socket.IO room and its own storage backend under
+``data/companies/<company_id>/``. A write to one company only touches that
+company's index and rewrites that company's file.
+
+Tenants are loaded on first use and evicted by ``TenantRegistry.evict_idle``
+once they have not been used for a while. Every write is already persisted,
+so eviction only drops the in-memory copy.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+import storage as storage_backends
+
+# Company ids become directory and collection names, so only safe characters are allowed
+COMPANY_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# Activities kept per company
+MAX_ACTIVITIES = 100
+
+
+def valid_company_id(company_id):
+    return bool(COMPANY_ID_PATTERN.match(company_id or ''))
+
+
+def company_room(company_id):
+    """Socket.IO room that receives a company's product and activity updates"""
+    return f'company:{company_id}'
+
+
+class Tenant:
+    """One company's products, aggregates and activity log"""
+
+    def __init__(self, company_id, backend):
+        self.company_id = company_id
+        self.room = company_room(company_id)
+        self.storage = backend
+        self.products = {}
+        self.activities = []
+        self.total_stock_value = 0.0
+        self.low_stock_count = 0
+        self.category_counts = {}
+        self.last_used = time.monotonic()
+        self.in_use = 0
+        self.lock = threading.RLock()
+
+    def load(self):
+        self.products = {product['id']: product for product in self.storage.load()}
+        for product in self.products.values():
+            self._account(product, 1)
+        return len(self.products)
+
+    def _account(self, product, sign):
+        """Add (sign=1) or remove (sign=-1) a product's contribution to the aggregates"""
+        self.total_stock_value += sign * float(product['current_stock']) * float(product['cost_price'])
+        if product.get('status') == 'low_stock':
+            self.low_stock_count += sign
+        category = product['category']
+        count = self.category_counts.get(category, 0) + sign
+        if count:
+            self.category_counts[category] = count
+        else:
+            self.category_counts.pop(category, None)
+
+    def get(self, product_id):
+        return self.products.get(product_id)
+
+    def put(self, product, previous=None):
+        """Insert a product, or account for changes made to it in place (previous is its old copy)"""
+        if previous is not None:
+            self._account(previous, -1)
+        self.products[product['id']] = product
+        self._account(product, 1)
+
+    def remove(self, product_id):
+        product = self.products.pop(product_id, None)
+        if product is not None:
+            self._account(product, -1)
+        return product
+
+    def add_activity(self, activity):
+        with self.lock:
+            self.activities.append(activity)
+            if len(self.activities) > MAX_ACTIVITIES:
+                del self.activities[:-MAX_ACTIVITIES]
+
+    def stats(self):
+        return {
+            'company_id': self.company_id,
+            'total_products': len(self.products),
+            'total_categories': len(self.category_counts),
+            'total_stock_value': self.total_stock_value,
+            'low_stock_count': self.low_stock_count
+        }
+
+    def close(self):
+        self.storage.close()
+
+
+class TenantRegistry:
+    """Lazily loaded, idle-evicted tenants keyed by company id"""
+
+    def __init__(self, data_dir, storage_name='json', idle_seconds=600, mongo_uri='mongodb://localhost:27017/'):
+        self.directory = os.path.join(data_dir, 'companies')
+        self.storage_name = storage_name
+        self.idle_seconds = idle_seconds
+        self.mongo_uri = mongo_uri
+        self._tenants = {}
+        self._lock = threading.Lock()
+
+    def _create_backend(self, company_id):
+        company_dir = os.path.join(self.directory, company_id)
+        os.makedirs(company_dir, exist_ok=True)
+        return storage_backends.create_backend(self.storage_name, company_dir, mongo_uri=self.mongo_uri,
+                                               collection_name=f'products_{company_id}')
+
+    def exists(self, company_id):
+        return company_id in self._tenants or os.path.isdir(os.path.join(self.directory, company_id))
+
+    def company_ids(self):
+        """Companies with data on disk or loaded in memory"""
+        on_disk = os.listdir(self.directory) if os.path.isdir(self.directory) else []
+        return sorted(set(on_disk) | set(self._tenants))
+
+    def is_loaded(self, company_id):
+        return company_id in self._tenants
+
+    def loaded(self):
+        return len(self._tenants)
+
+    def company_info(self, company_id):
+        """Company details written by data_generator.py --companies, if any"""
+        path = os.path.join(self.directory, company_id, 'company.json')
+        if not os.path.exists(path):
+            return {'id': company_id}
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def acquire(self, company_id, create=False):
+        """Return the loaded tenant, loading it first if needed; release() it when done.
+
+        Returns None for unknown companies unless create is set.
+        """
+        with self._lock:
+            tenant = self._tenants.get(company_id)
+            if tenant is None:
+                if not create and not self.exists(company_id):
+                    return None
+                tenant = Tenant(company_id, self._create_backend(company_id))
+                tenant.load()
+                self._tenants[company_id] = tenant
+            tenant.in_use += 1
+            tenant.last_used = time.monotonic()
+            return tenant
+
+    def release(self, tenant):
+        with self._lock:
+            tenant.in_use -= 1
+            tenant.last_used = time.monotonic()
+
+    def evict_idle(self):
+        """Drop tenants unused for idle_seconds; returns the evicted company ids"""
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [tenant for tenant in self._tenants.values() if not tenant.in_use and tenant.last_used < cutoff]
+            for tenant in idle:
+                del self._tenants[tenant.company_id]
+        for tenant in idle:
+            tenant.close()
+        return [tenant.company_id for tenant in idle]
+
+    def close(self):
+        with self._lock:
+            tenants, self._tenants = list(self._tenants.values()), {}
+        for tenant in tenants:
+            tenant.close()
@@ -0,0 +1,130 @@
+"""
+Record the running app's traffic to a compact trace file for load testing.
+
+A trace is gzip-compressed JSON Lines. The first line is a header; every
+other line is one event with short keys. ``t`` is always the milliseconds
+since recording started, and ``k`` is the event kind:
+
+    r  HTTP request: m method, p route rule, id product id, co company id,
+       l lot id, q query string, b JSON body, s status, d duration in ms,
+       i id of a created product, il id of a created lot
+    u  background mutation (e.g. periodic_updates): type, id, f changed fields
+    a  activity stream entry: action, id
+    c  Socket.IO client connected: sid
+    x  Socket.IO client disconnected: sid
+
+Events are queued and written by a background thread, so recording never
+blocks a request; if the queue is full the event is dropped and counted.
+trace_replay.py re-drives a trace against a running server.
+"""
+
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+TRACE_VERSION = 1
+
+TRACE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'traces')
+
+
+def default_trace_path():
+    return os.path.join(TRACE_DIR, f"trace-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl.gz")
+
+
+def trace_path(name):
+    """Path in TRACE_DIR of a trace named by a client; ValueError unless name is a bare file name"""
+    # Leading dots rule out '.', '..' and hidden files; separators rule out leaving TRACE_DIR
+    if not isinstance(name, str) or not name or name.startswith('.') \
+            or any(separator in name for separator in ('/', '\\', '\0')):
+        raise ValueError('Trace name must be a plain file name')
+    if not name.endswith('.gz'):
+        name += '.jsonl.gz'
+    return os.path.join(TRACE_DIR, name)
+
+
+class TraceRecorder:
+    """Append trace events to a gzip JSON Lines file from a writer thread"""
+
+    def __init__(self, path=None, max_queue=100000):
+        self.path = path or default_trace_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.started = time.monotonic()
+        self.started_at = datetime.now().isoformat()
+        self.events = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file = gzip.open(self.path, 'wt', encoding='utf-8')
+        self._write({'v': TRACE_VERSION, 'started': self.started_at})
+        self._thread = threading.Thread(target=self._run, name='trace-writer', daemon=True)
+        self._thread.start()
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, separators=(',', ':'), default=str))
+        self._file.write('\n')
+
+    def record(self, kind, **fields):
+        entry = {'k': kind, 't': int((time.monotonic() - self.started) * 1000)}
+        entry.update((key, value) for key, value in fields.items() if value is not None)
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            try:
+                entry = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                # Sync-flush the gzip stream when idle, so a crash loses at most a second of events
+                self._file.flush()
+                continue
+            if entry is None:
+                break
+            self._write(entry)
+            self.events += 1
+
+    def close(self):
+        """Flush outstanding events and close the file; returns a summary"""
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        return self.summary()
+
+    def summary(self):
+        return {
+            'path': self.path,
+            'started': self.started_at,
+            'seconds': round(time.monotonic() - self.started, 3),
+            'events': self.events,
+            'dropped': self.dropped,
+            'bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+
+def read_trace(path):
+    """Return (header, events) for a trace file, plain or gzip-compressed"""
+    opener = gzip.open if path.endswith('.gz') else open
+    lines = []
+    with opener(path, 'rt', encoding='utf-8') as f:
+        try:
+            lines.extend(line for line in f if line.strip())
+        except EOFError:
+            # The recorder was killed before closing the gzip stream
+            pass
+    if not lines:
+        raise ValueError(f"Empty trace file: {path}")
+    header = json.loads(lines[0])
+    if header.get('v') != TRACE_VERSION:
+        raise ValueError(f"Unsupported trace version in {path}: {header.get('v')}")
+    events = []
+    for line in lines[1:]:
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            # Partial last line from an interrupted write
+            break
+    return header, events
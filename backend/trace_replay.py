@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Replay a recorded trace against a running server and report latency.
+
+Requests to /api/products* and background mutations (replayed as the
+equivalent POST/PUT/DELETE) are sent on the trace's original schedule,
+sped up by --speed, from a pool of concurrent HTTP clients with keep-alive
+connections. Socket.IO clients connect and disconnect as they did in the
+trace, or a fixed number stays connected with --ws-clients. They measure
+how long broadcasts take to arrive.
+
+Product ids in the trace are translated to ids on the target: products
+created during the replay map to the ids the target assigns. Other ids map
+deterministically onto the target's existing products, unless --no-remap is
+given. Requests for the same product are sent in trace order, however many
+clients run concurrently.
+
+Socket.IO clients need the optional client extras:
+    pip install "python-socketio[client]"
+
+Usage:
+    python trace_replay.py data/traces/trace-20250101-120000.jsonl.gz --speed 10
+    python trace_replay.py trace.jsonl.gz --target http://localhost:5000 --speed 100 --http-clients 32 --ws-clients 50
+"""
+
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+import urllib.parse
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from trace_recorder import read_trace
+
+# Fields the update endpoint accepts; anything else in a mutation is derived by the server
+UPDATABLE_FIELDS = ('name', 'category', 'sku', 'unit', 'description',
+                    'current_stock', 'min_stock_level', 'cost_price', 'selling_price')
+
+
+def percentiles(values):
+    """(p50, p95, p99) of values in milliseconds, or Nones when there are too few"""
+    if len(values) < 2:
+        value = values[0] * 1000 if values else None
+        return value, value, value
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000
+
+
+class IdMapper:
+    """Translate product and lot ids in the trace to ids on the target server"""
+
+    def __init__(self, target_ids, remap=True):
+        self.target_ids = sorted(target_ids) if remap else []
+        self.mapping = {}
+        self.lock = threading.Lock()
+
+    def created(self, trace_id, target_id):
+        with self.lock:
+            self.mapping[trace_id] = target_id
+
+    def resolve_lot(self, trace_id):
+        """Lots only exist on the target once the trace created them, so unknown ids pass through"""
+        with self.lock:
+            return self.mapping.get(trace_id) or trace_id
+
+    def resolve(self, trace_id):
+        with self.lock:
+            if trace_id in self.mapping:
+                return self.mapping[trace_id]
+        if not self.target_ids:
+            return trace_id
+        return self.target_ids[zlib.crc32(trace_id.encode('utf-8')) % len(self.target_ids)]
+
+
+class HttpClients:
+    """One keep-alive HTTP connection per worker thread"""
+
+    def __init__(self, target, timeout=30.0):
+        parsed = urllib.parse.urlsplit(target)
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        self.connection_class = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def request(self, method, path, body=None):
+        """Send one request; returns (status, parsed JSON body or None, Location header or None)"""
+        payload = json.dumps(body).encode('utf-8') if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        for attempt in range(2):
+            connection = getattr(self.local, 'connection', None)
+            if connection is None:
+                connection = self.local.connection = self.connection_class(self.host, self.port, timeout=self.timeout)
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # Stale keep-alive connection: reconnect once, then give up
+                connection.close()
+                self.local.connection = None
+                if attempt:
+                    raise
+        location = response.getheader('Location')
+        try:
+            return response.status, json.loads(data) if data else None, location
+        except ValueError:
+            return response.status, None, location
+
+
+class ReplayStats:
+    """Latencies and errors by route, shared by the client threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.recorded = {}
+        self.errors = {}
+        self.schedule_lag = []
+        self.broadcast_lag = []
+        self.broadcasts = {}
+        self.ws_connected = 0
+        self.ws_failed = 0
+
+    def request(self, route, latency, schedule_lag, error=None, recorded=None):
+        with self.lock:
+            self.latencies.setdefault(route, []).append(latency)
+            self.schedule_lag.append(schedule_lag)
+            if recorded is not None:
+                self.recorded.setdefault(route, []).append(recorded / 1000)
+            if error is not None:
+                self.errors.setdefault(route, {}).setdefault(error, 0)
+                self.errors[route][error] += 1
+
+    def broadcast(self, event, data):
+        received = datetime.now()
+        with self.lock:
+            self.broadcasts[event] = self.broadcasts.get(event, 0) + 1
+            try:
+                self.broadcast_lag.append(max(0.0, (received - datetime.fromisoformat(data['timestamp'])).total_seconds()))
+            except (KeyError, TypeError, ValueError):
+                pass
+
+
+class SocketClients:
+    """Socket.IO clients that count broadcasts and their delivery lag"""
+
+    def __init__(self, target, stats):
+        self.target = target
+        self.stats = stats
+        self.clients = {}
+        self.lock = threading.Lock()
+        try:
+            import socketio
+            self.socketio = socketio
+        except ImportError:
+            self.socketio = None
+
+    def connect(self, key):
+        if self.socketio is None:
+            return
+        client = self.socketio.Client(reconnection=False)
+        for event in ('product-update', 'activity-update'):
+            client.on(event, lambda data, event=event: self.stats.broadcast(event, data))
+        try:
+            client.connect(self.target, wait_timeout=10)
+        except Exception:
+            with self.stats.lock:
+                self.stats.ws_failed += 1
+            return
+        with self.stats.lock:
+            self.stats.ws_connected += 1
+        with self.lock:
+            self.clients[key] = client
+
+    def disconnect(self, key):
+        with self.lock:
+            client = self.clients.pop(key, None)
+        if client is not None:
+            client.disconnect()
+
+    def close(self):
+        with self.lock:
+            keys = list(self.clients)
+        for key in keys:
+            self.disconnect(key)
+
+
+def build_request(event, mapper):
+    """Turn a trace event into (route, method, path, body, created (kind, trace id)), or None to skip it"""
+    if event['k'] == 'r':
+        route, method, body = event['p'], event['m'], event.get('b')
+        path = route
+        if '<product_id>' in route:
+            path = route.replace('<product_id>', urllib.parse.quote(mapper.resolve(event['id']), safe=''))
+        if '<company_id>' in route:
+            path = path.replace('<company_id>', urllib.parse.quote(event['co'], safe=''))
+        if '<lot_id>' in route:
+            path = path.replace('<lot_id>', urllib.parse.quote(mapper.resolve_lot(event['l']), safe=''))
+        if event.get('q'):
+            path += '?' + event['q']
+        if event.get('il'):
+            return route, method, path, body, ('lot', event['il'])
+        return route, method, path, body, ('product', event['i']) if event.get('i') else None
+
+    # Background mutation, replayed through the REST API
+    product_id, fields = event['id'], event.get('f') or {}
+    if event['type'] == 'create':
+        return 'POST /api/products (background)', 'POST', '/api/products', fields, ('product', product_id)
+    path = '/api/products/' + urllib.parse.quote(mapper.resolve(product_id), safe='')
+    if event['type'] == 'update':
+        body = {key: value for key, value in fields.items() if key in UPDATABLE_FIELDS}
+        return 'PUT /api/products/<product_id> (background)', 'PUT', path, body, None
+    if event['type'] == 'delete':
+        return 'DELETE /api/products/<product_id> (background)', 'DELETE', path, None, None
+    return None
+
+
+def product_key(event):
+    """Trace product id an event touches, used to keep its requests in order"""
+    if event['k'] == 'r':
+        return event.get('id') or event.get('i')
+    return event.get('id')
+
+
+def send(clients, mapper, stats, event, scheduled, previous=None):
+    if previous is not None:
+        # Wait for the previous request for the same product; it was submitted
+        # earlier to the same FIFO pool, so it is already running or finished
+        previous.result()
+    started = time.monotonic()
+    request = build_request(event, mapper)
+    if request is None:
+        return
+    route, method, path, body, created = request
+    label = route if route.endswith(')') else f"{method} {route}"
+    error = None
+    try:
+        status, data, location = clients.request(method, path, body)
+        if status >= 400:
+            error = f"HTTP {status}"
+        if created is not None and status < 400:
+            kind, created_id = created
+            if kind == 'lot':
+                # The new lot's id is the last segment of its URL
+                mapper.created(created_id, (location or '').rsplit('/', 1)[-1] or None)
+            else:
+                mapper.created(created_id, ((data or {}).get('data') or {}).get('id'))
+    except Exception as e:
+        error = type(e).__name__
+    stats.request(label, time.monotonic() - started, max(0.0, started - scheduled), error, event.get('d'))
+
+
+def fetch_target_ids(clients):
+    status, data, _ = clients.request('GET', '/api/products')
+    if status != 200 or not data:
+        raise SystemExit(f"Could not list products on the target (HTTP {status})")
+    return [product['id'] for product in data.get('data', [])]
+
+
+def replay(trace_path, target='http://localhost:5000', speed=1.0, http_clients=16, ws_clients=None,
+           routes=('/api/products',), background=True, remap=True):
+    """Replay a trace and return its ReplayStats plus a summary dict"""
+    header, events = read_trace(trace_path)
+    clients = HttpClients(target)
+    mapper = IdMapper(fetch_target_ids(clients), remap)
+    stats = ReplayStats()
+    sockets = SocketClients(target, stats)
+
+    requests = [
+        event for event in events
+        if (event['k'] == 'r' and event['p'].startswith(routes)) or (event['k'] == 'u' and background)
+    ]
+    connections = [event for event in events if event['k'] in ('c', 'x')] if ws_clients is None else []
+    if ws_clients or connections:
+        if sockets.socketio is None:
+            print("Socket.IO client not installed; replaying HTTP traffic only")
+        else:
+            print("Connecting Socket.IO clients...")
+    for index in range(ws_clients or 0):
+        sockets.connect(index)
+
+    schedule = sorted(requests + connections, key=lambda event: event['t'])
+    pool = ThreadPoolExecutor(max_workers=http_clients)
+    socket_pool = ThreadPoolExecutor(max_workers=8)
+    last_request = {}
+    started = time.monotonic()
+    try:
+        for event in schedule:
+            scheduled = started + event['t'] / 1000 / speed
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if event['k'] == 'c':
+                socket_pool.submit(sockets.connect, event['sid'])
+            elif event['k'] == 'x':
+                socket_pool.submit(sockets.disconnect, event['sid'])
+            else:
+                key = product_key(event)
+                future = pool.submit(send, clients, mapper, stats, event, scheduled, last_request.get(key))
+                if key is not None:
+                    last_request[key] = future
+    finally:
+        pool.shutdown(wait=True)
+        elapsed = time.monotonic() - started
+        socket_pool.shutdown(wait=True)
+        # Let broadcasts from the last requests arrive
+        time.sleep(0.5)
+        sockets.close()
+
+    summary = {
+        'trace': trace_path,
+        'recorded_at': header.get('started'),
+        'recorded_seconds': (events[-1]['t'] / 1000) if events else 0.0,
+        'replay_seconds': elapsed,
+        'speed': speed,
+        'requests': sum(len(values) for values in stats.latencies.values()),
+        'errors': sum(sum(kinds.values()) for kinds in stats.errors.values()),
+    }
+    return stats, summary
+
+
+def report(stats, summary):
+    """Build a JSON-friendly report of a replay"""
+    routes = {}
+    for route in sorted(stats.latencies):
+        p50, p95, p99 = percentiles(stats.latencies[route])
+        recorded = percentiles(stats.recorded.get(route, []))
+        routes[route] = {
+            'count': len(stats.latencies[route]),
+            'errors': stats.errors.get(route, {}),
+            'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+            'recorded_p50_ms': recorded[0], 'recorded_p99_ms': recorded[2],
+        }
+    p50, p95, p99 = percentiles(stats.broadcast_lag)
+    return dict(
+        summary,
+        throughput=summary['requests'] / summary['replay_seconds'] if summary['replay_seconds'] > 0 else 0.0,
+        schedule_lag_p99_ms=percentiles(stats.schedule_lag)[2],
+        routes=routes,
+        websocket={
+            'connected': stats.ws_connected,
+            'failed': stats.ws_failed,
+            'events': stats.broadcasts,
+            'delivery_p50_ms': p50, 'delivery_p95_ms': p95, 'delivery_p99_ms': p99,
+        },
+    )
+
+
+def print_report(result):
+    def ms(value):
+        return f"{value:9.1f}" if value is not None else f"{'-':>9}"
+
+    print(f"\nReplayed {result['requests']} requests from {result['trace']}")
+    print("Latencies are client-side; 'srv p50' is the handler time recorded in the trace")
+    print(f"Recorded {result['recorded_seconds']:.1f}s, replayed in {result['replay_seconds']:.1f}s at {result['speed']:g}x "
+          f"({result['throughput']:.1f} requests/s)")
+    if result['schedule_lag_p99_ms'] is not None and result['schedule_lag_p99_ms'] > 50:
+        print(f"Warning: p99 schedule lag {result['schedule_lag_p99_ms']:.0f}ms; add --http-clients to keep up")
+    print(f"\n{'route':<52} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'srv p50':>9}")
+    print("-" * 108)
+    for route, row in result['routes'].items():
+        errors = sum(row['errors'].values())
+        print(f"{route:<52} {row['count']:>7} {errors:>7} {ms(row['p50_ms'])} {ms(row['p95_ms'])} "
+              f"{ms(row['p99_ms'])} {ms(row['recorded_p50_ms'])}")
+    for route, row in result['routes'].items():
+        for error, count in row['errors'].items():
+            print(f"  {route}: {count} x {error}")
+    ws = result['websocket']
+    if ws['connected'] or ws['failed']:
+        events = ', '.join(f"{count} {event}" for event, count in sorted(ws['events'].items())) or 'no events'
+        print(f"\nSocket.IO: {ws['connected']} clients connected ({ws['failed']} failed), received {events}")
+        if ws['delivery_p50_ms'] is not None:
+            print(f"Broadcast delivery: p50 {ws['delivery_p50_ms']:.1f} ms, p95 {ws['delivery_p95_ms']:.1f} ms, "
+                  f"p99 {ws['delivery_p99_ms']:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded trace against the REST API")
+    parser.add_argument("trace", help="Trace file recorded with --trace or /admin/trace/start")
+    parser.add_argument("--target", default="http://localhost:5000", help="Server to replay against")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier, e.g. 1 to 100")
+    parser.add_argument("--http-clients", type=int, default=16, help="Concurrent HTTP clients")
+    parser.add_argument("--ws-clients", type=int,
+                        help="Keep this many Socket.IO clients connected (default: replay the trace's connections)")
+    parser.add_argument("--routes", nargs="+", default=["/api/products"], help="Route prefixes to replay")
+    parser.add_argument("--skip-background", action="store_true",
+                        help="Do not replay background mutations (the target's own periodic updates still run)")
+    parser.add_argument("--no-remap", action="store_true", help="Use the trace's product ids unchanged")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+
+    stats, summary = replay(args.trace, target=args.target, speed=args.speed, http_clients=args.http_clients,
+                            ws_clients=args.ws_clients, routes=tuple(args.routes),
+                            background=not args.skip_background, remap=not args.no_remap)
+    result = report(stats, summary)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
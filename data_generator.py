@@ -1,13 +1,38 @@
 from faker import Faker
+import argparse
+import multiprocessing
 import random
 import json
 import os
+import string
+import sys
+import tempfile
+import time
 from datetime import datetime, timedelta
 
 fake = Faker()
 
-# Create data directory if it doesn't exist
-os.makedirs('backend/data', exist_ok=True)
+# Backend data directory, resolved relative to this file so the generator
+# works the same when imported in-process from backend/app.py
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+DATA_DIR = os.path.join(BACKEND_DIR, 'data')
+
+PRODUCT_CATEGORIES = ['fruits', 'vegetables', 'dairy', 'meat', 'bakery', 'beverages', 'snacks', 'canned goods', 'frozen foods', 'spices']
+PRODUCT_UNITS = ['kg', 'g', 'lb', 'pcs', 'bottles', 'boxes', 'cans', 'packages']
+
+# Output formats for generated products
+OUTPUT_FORMATS = ('json', 'jsonl', 'sqlite')
+
+# Records generated together; shards are split into batches of this size
+BATCH_SIZE = 1000
+
+# Records per shard. Shards are the unit of work for the process pool and
+# each has its own seed, so the output does not depend on the process count.
+SHARD_SIZE = 20000
+
+# Size of the pre-built Faker vocabulary pools
+VOCABULARY_WORDS = 2000
+VOCABULARY_SENTENCES = 2000
 
 def generate_company():
     return {
@@ -68,57 +93,288 @@ def save_to_json(data, filename="fake_data.json"):
     with open(filename, 'w') as f:
         json.dump(data, f, indent=4)
 
-def generate_products(num_products=30):
-    categories = ['fruits', 'vegetables', 'dairy', 'meat', 'bakery', 'beverages', 'snacks', 'canned goods', 'frozen foods', 'spices']
-    units = ['kg', 'g', 'lb', 'pcs', 'bottles', 'boxes', 'cans', 'packages']
+def build_vocabulary(seed=0):
+    """Pre-generate the Faker words and sentences products are assembled from.
+
+    Calling Faker per field dominates generation time, so each process builds
+    these pools once and records are then drawn from them.
+    """
+    vocabulary_fake = Faker()
+    vocabulary_fake.seed_instance(seed)
+    words = sorted({vocabulary_fake.word().capitalize() for _ in range(VOCABULARY_WORDS)})
+    return {
+        'words': words,
+        'sentences': [vocabulary_fake.sentence() for _ in range(VOCABULARY_SENTENCES)],
+        'sku_prefixes': [a + b for a in string.ascii_letters for b in string.ascii_letters],
+        'categories': PRODUCT_CATEGORIES,
+        'category_names': [category.capitalize() for category in PRODUCT_CATEGORIES],
+    }
+
+def generate_product_batch(first_id, count, rng, vocabulary, reference_time):
+    """Generate count products with ids first_id, first_id + 1, ...
+
+    Each field is sampled for the whole batch at once with rng.choices /
+    list comprehensions rather than record by record.
+    """
+    category_indexes = rng.choices(range(len(vocabulary['categories'])), k=count)
+    name_words = rng.choices(vocabulary['words'], k=count)
+    sku_prefixes = rng.choices(vocabulary['sku_prefixes'], k=count)
+    descriptions = rng.choices(vocabulary['sentences'], k=count)
+    units = rng.choices(PRODUCT_UNITS, k=count)
+    randint, uniform = rng.randint, rng.uniform
+    stocks = [randint(0, 100) for _ in range(count)]
+    min_stocks = [randint(10, 20) for _ in range(count)]
+    cost_prices = [round(uniform(1, 50), 2) for _ in range(count)]
+    margins = [uniform(1.1, 1.5) for _ in range(count)]
+    sku_numbers = [randint(0, 9999) for _ in range(count)]
+    sales_counts = [randint(0, 500) for _ in range(count)]
+    ages = [randint(86400, 30 * 86400) for _ in range(count)]
     
     products = []
-    
-    for i in range(num_products):
-        category = random.choice(categories)
-        current_stock = random.randint(0, 100)
-        min_stock = random.randint(10, 20)
-        
-        # Determine status based on stock level
+    for i in range(count):
+        category = category_indexes[i]
+        current_stock = stocks[i]
+        min_stock = min_stocks[i]
         if current_stock == 0:
             status = 'out_of_stock'
         elif current_stock <= min_stock:
             status = 'low_stock'
         else:
             status = 'active'
-        
-        cost_price = round(random.uniform(1, 50), 2)
-        selling_price = round(cost_price * random.uniform(1.1, 1.5), 2)
-        
-        # Generate random sales data (for hot selling tracking)
-        sales_count = random.randint(0, 500)
-        
-        product = {
-            'id': str(i + 1),  # Ensure ID is a string to match backend expectation
-            'name': fake.word().capitalize() + ' ' + category.capitalize(),
-            'sku': f'SKU-{fake.bothify(text="??####")}',
-            'category': category,
-            'description': fake.sentence(),
+        products.append({
+            'id': str(first_id + i),
+            'name': name_words[i] + ' ' + vocabulary['category_names'][category],
+            'sku': f'SKU-{sku_prefixes[i]}{sku_numbers[i]:04d}',
+            'category': vocabulary['categories'][category],
+            'description': descriptions[i],
             'current_stock': current_stock,
             'min_stock_level': min_stock,
-            'unit': random.choice(units),
-            'cost_price': cost_price,
-            'selling_price': selling_price,
+            'unit': units[i],
+            'cost_price': cost_prices[i],
+            'selling_price': round(cost_prices[i] * margins[i], 2),
             'status': status,
-            'sales_count': sales_count,
-            'created_at': (datetime.now() - timedelta(days=random.randint(1, 30))).isoformat()
-        }
-        products.append(product)
-    
+            'sales_count': sales_counts[i],
+            'created_at': (reference_time - timedelta(seconds=ages[i])).isoformat()
+        })
     return products
 
-if __name__ == "__main__":
-    # Generate products data
-    products_data = generate_products(num_products=30)
+def shard_seed(seed, shard):
+    """Deterministic, well-separated seed for one shard"""
+    return seed * 1000003 + shard
+
+def iter_shard(shard, num_products, seed, reference_time, vocabulary, batch_size=BATCH_SIZE, shard_size=SHARD_SIZE):
+    """Yield the batches of products making up one shard"""
+    rng = random.Random(shard_seed(seed, shard))
+    start = shard * shard_size
+    end = min(start + shard_size, num_products)
+    for first in range(start, end, batch_size):
+        yield generate_product_batch(first + 1, min(batch_size, end - first), rng, vocabulary, reference_time)
+
+def iter_products(num_products, seed=None, reference_time=None, batch_size=BATCH_SIZE, shard_size=SHARD_SIZE):
+    """Yield batches of products in a single process (same output as the process pool)"""
+    seed = random.randrange(2 ** 32) if seed is None else seed
+    reference_time = reference_time or datetime.now()
+    vocabulary = build_vocabulary(seed)
+    for shard in range((num_products + shard_size - 1) // shard_size):
+        yield from iter_shard(shard, num_products, seed, reference_time, vocabulary, batch_size, shard_size)
+
+def generate_products(num_products=30, seed=None):
+    return [product for batch in iter_products(num_products, seed) for product in batch]
+
+# Per-process state for the generator pool, set up once by _init_worker
+_worker = {}
+
+def _sqlite_backend_class():
+    """storage.SqliteBackend, importable from the generator's processes"""
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    from storage import SqliteBackend
+    return SqliteBackend
+
+def _init_worker(seed, reference_time, batch_size, shard_size, output_format):
+    _worker.update(seed=seed, reference_time=reference_time, batch_size=batch_size, shard_size=shard_size,
+                   output_format=output_format, vocabulary=build_vocabulary(seed))
+    if output_format == 'sqlite':
+        _worker['sqlite_row'] = _sqlite_backend_class().row
+
+def _serialize_shard(args):
+    """Generate one shard in a worker and return it already serialized.
+
+    JSON formats get one encoded line per product; SQLite gets ready-to-insert
+    rows. Serializing in the workers keeps the single writer from becoming
+    the bottleneck.
+    """
+    shard, num_products = args
+    lines = []
+    for batch in iter_shard(shard, num_products, _worker['seed'], _worker['reference_time'], _worker['vocabulary'],
+                            _worker['batch_size'], _worker['shard_size']):
+        for product in batch:
+            if _worker['output_format'] == 'sqlite':
+                lines.append(_worker['sqlite_row'](product))
+            else:
+                lines.append(json.dumps(product, separators=(',', ':')))
+    return lines
+
+def _open_temp_file(path):
+    """A temporary file next to path, for a write that replaces path when complete"""
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '-', suffix='.tmp',
+                                     dir=os.path.dirname(os.path.abspath(path)))
+    return os.fdopen(fd, 'w'), temp_path
+
+def _replace_file(temp_path, path):
+    """Atomically move a finished temporary file over path, keeping path's mode (0644 when new)"""
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644
+    os.chmod(temp_path, mode)
+    os.replace(temp_path, path)
+
+class _JsonWriter:
+    """Stream products as a JSON array (json) or one object per line (jsonl).
+
+    Products go to a temporary file that replaces the output only once it is
+    complete, so the app and the MongoDB sync never read a partial catalogue.
+    """
+    
+    def __init__(self, path, output_format):
+        self.path = path
+        self.file, self.temp_path = _open_temp_file(path)
+        self.array = output_format == 'json'
+        self.first = True
+        if self.array:
+            self.file.write('[')
+    
+    def write(self, lines):
+        if not lines:
+            return
+        if self.array:
+            self.file.write(('\n' if self.first else ',\n') + ',\n'.join(lines))
+        else:
+            self.file.write('\n'.join(lines) + '\n')
+        self.first = False
+    
+    def close(self):
+        if self.array:
+            self.file.write('\n]\n')
+        self.file.close()
+        _replace_file(self.temp_path, self.path)
+    
+    def abort(self):
+        """Drop the partial output, leaving any existing file untouched"""
+        self.file.close()
+        os.remove(self.temp_path)
+
+class _SqliteWriter:
+    """Write rows built by SqliteBackend.row through the SQLite storage backend"""
+    
+    def __init__(self, path):
+        self.backend = _sqlite_backend_class()(path)
+        self.backend.clear()
+    
+    def write(self, rows):
+        self.backend.write_rows(rows)
+    
+    def close(self):
+        self.backend.close()
+    
+    def abort(self):
+        self.backend.close()
+
+def default_output_path(output_format):
+    return os.path.join(DATA_DIR, {'json': 'products.json', 'jsonl': 'products.jsonl', 'sqlite': 'products.sqlite3'}[output_format])
+
+def generate_to_file(num_products, output=None, output_format='json', processes=None, seed=None,
+                     batch_size=BATCH_SIZE, shard_size=SHARD_SIZE):
+    """Generate products across a process pool and stream them to output.
+
+    Shards are written in order, so for a given seed the output is identical
+    whatever the number of processes. Returns the output path.
+    """
+    output = output or default_output_path(output_format)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    seed = random.randrange(2 ** 32) if seed is None else seed
+    # Midnight today, so the same seed gives the same catalogue all day
+    reference_time = datetime.combine(datetime.now().date(), datetime.min.time())
+    shards = [(shard, num_products) for shard in range((num_products + shard_size - 1) // shard_size)]
+    processes = max(1, min(processes or os.cpu_count() or 1, len(shards)))
     
+    writer = _SqliteWriter(output) if output_format == 'sqlite' else _JsonWriter(output, output_format)
+    init_args = (seed, reference_time, batch_size, shard_size, output_format)
+    try:
+        if processes == 1:
+            _init_worker(*init_args)
+            for shard in shards:
+                writer.write(_serialize_shard(shard))
+        else:
+            with multiprocessing.Pool(processes, initializer=_init_worker, initargs=init_args) as pool:
+                for lines in pool.imap(_serialize_shard, shards):
+                    writer.write(lines)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return output
+
+def write_products(products_data, products_file=None):
     # Save to the correct location for the backend
-    products_file = os.path.join('backend', 'data', 'products.json')
-    with open(products_file, 'w') as f:
-        json.dump(products_data, f, indent=2)
+    if products_file is None:
+        products_file = os.path.join(DATA_DIR, 'products.json')
+    os.makedirs(os.path.dirname(products_file), exist_ok=True)
+    f, temp_path = _open_temp_file(products_file)
+    try:
+        with f:
+            json.dump(products_data, f, indent=2)
+        _replace_file(temp_path, products_file)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return products_file
+
+def write_company_catalogues(num_companies, products_per_company=30, seed=None, companies_dir=None):
+    """Write a products.json and company.json per generated company.
+
+    These are the per-company partitions the backend serves under
+    /api/companies/<company_id>/. Returns the generated companies.
+    """
+    companies_dir = companies_dir or os.path.join(DATA_DIR, 'companies')
+    if seed is not None:
+        Faker.seed(seed)
+    companies = []
+    for index in range(num_companies):
+        company = generate_company()
+        company_seed = None if seed is None else shard_seed(seed, index)
+        company_products = generate_products(products_per_company, seed=company_seed)
+        for product in company_products:
+            product['company_id'] = company['id']
+        company_dir = os.path.join(companies_dir, company['id'])
+        write_products(company_products, os.path.join(company_dir, 'products.json'))
+        with open(os.path.join(company_dir, 'company.json'), 'w') as f:
+            json.dump(company, f, indent=2)
+        companies.append(company)
+    return companies
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate sample product data")
+    parser.add_argument("--count", type=int, default=30, help="Number of products to generate")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default='json', help="JSON array, JSON Lines or SQLite store")
+    parser.add_argument("--output", help="Output file (default: backend/data/products.json, .jsonl or .sqlite3)")
+    parser.add_argument("--processes", type=int, help="Generator processes (default: all cores)")
+    parser.add_argument("--seed", type=int, help="Seed for a reproducible catalogue")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Products generated per batch")
+    parser.add_argument("--companies", type=int,
+                        help="Instead write this many per-company catalogues of --count products to backend/data/companies/")
+    args = parser.parse_args()
+    
+    if args.companies:
+        companies = write_company_catalogues(args.companies, args.count, args.seed)
+        print(f"Generated {len(companies)} companies with {args.count} products each in {os.path.join(DATA_DIR, 'companies')}")
+        sys.exit(0)
+    
+    started = time.perf_counter()
+    products_file = generate_to_file(args.count, args.output, args.format, args.processes, args.seed, args.batch_size)
+    elapsed = time.perf_counter() - started
     
-    print(f"Generated {len(products_data)} products and saved to {products_file}") 
\ No newline at end of file
+    print(f"Generated {args.count} products and saved to {products_file} "
+          f"in {elapsed:.2f}s ({args.count / max(elapsed, 1e-9):,.0f} products/s)")
@@ -2,7 +2,11 @@
 let charts = {};
 let lowStockItems = [];
 let unreadLowStockCount = 0;
-let productsData = [];
+let analyticsData = null;
+let analyticsRefreshTimer = null;
+
+// Real-time updates trigger at most one analytics refetch per this many ms
+const ANALYTICS_REFRESH_DELAY = 1000;
 
 document.addEventListener('DOMContentLoaded', async () => {
   try {
@@ -261,36 +265,17 @@ const loadAnalyticsData = async () => {
   try {
     console.log('Loading analytics data...');
     
-    // Load products data
-    const productsResponse = await productAPI.getAllProducts();
-    if (!productsResponse.success) {
-      throw new Error('Failed to load products data');
+    // Aggregates are computed by the server; only chart-sized results are sent
+    const analyticsResponse = await analyticsAPI.getAnalytics();
+    if (!analyticsResponse.success) {
+      throw new Error('Failed to load analytics data');
     }
     
-    productsData = productsResponse.data;
-    console.log(`Loaded ${productsData.length} products for analytics`);
-    
-    // Add summary metrics section
-    addSummaryMetrics(productsData);
-    
-    // Update existing charts with real-time data
-    updateInventoryTrendsChart(productsData);
-    updateCategoryDistributionChart(productsData);
-    
-    // Add stock level chart
-    addStockLevelChart(productsData);
-    
-    // Add price comparison chart
-    addPriceComparisonChart(productsData);
-    
-    // Add inventory turnover chart
-    addInventoryTurnoverChart(productsData);
-    
-    // Add profit margin analysis chart
-    addProfitMarginChart(productsData);
+    analyticsData = analyticsResponse.data;
+    console.log(`Loaded analytics for ${analyticsData.totals.products} products`);
     
-    // Add stock level vs minimum stock comparison
-    addStockLevelComparisonChart(productsData);
+    // Add summary metrics section and update all charts
+    updateAllAnalytics(analyticsData);
     
     // Load low stock alerts for notifications
     await loadLowStockAlerts();
@@ -302,39 +287,20 @@ const loadAnalyticsData = async () => {
 };
 
 // Add summary metrics section at the top
-const addSummaryMetrics = (products) => {
+const addSummaryMetrics = (analytics) => {
   // Check if metrics section already exists
   if (document.getElementById('summary-metrics')) {
     // If it exists, update it instead of creating a new one
-    updateMetricsSection(products);
+    updateMetricsSection(analytics);
     return;
   }
   
-  // Calculate key metrics
-  const totalProducts = products.length;
-  const totalInventoryValue = products.reduce((sum, product) => {
-    return sum + (product.current_stock * product.selling_price || 0);
-  }, 0);
-  const totalInventoryCost = products.reduce((sum, product) => {
-    return sum + (product.current_stock * product.cost_price || 0);
-  }, 0);
-  const potentialProfit = totalInventoryValue - totalInventoryCost;
-  const profitMargin = totalInventoryValue > 0 ? (potentialProfit / totalInventoryValue * 100) : 0;
-  
-  // Count products by status
-  const statusCounts = {
-    active: 0,
-    low_stock: 0,
-    inactive: 0,
-    out_of_stock: 0
-  };
-  
-  products.forEach(product => {
-    const status = product.status || 'unknown';
-    if (statusCounts.hasOwnProperty(status)) {
-      statusCounts[status]++;
-    }
-  });
+  // Key metrics, as totalled by the server
+  const totals = analytics.totals;
+  const totalProducts = totals.products;
+  const totalInventoryValue = totals.inventory_value;
+  const potentialProfit = totals.potential_profit;
+  const profitMargin = totals.profit_margin;
   
   // Create metrics container
   const metricsContainer = document.createElement('div');
@@ -381,7 +347,7 @@ const addSummaryMetrics = (products) => {
         </div>
         <div class="metric-content">
           <h4>Low Stock</h4>
-          <p class="metric-value">${statusCounts.low_stock}</p>
+          <p class="metric-value">${totals.low_stock}</p>
           <p class="metric-subtitle">products need attention</p>
         </div>
       </div>
@@ -508,25 +474,16 @@ const addMetricsStyles = () => {
 };
 
 // Update inventory trends chart with real-time data
-const updateInventoryTrendsChart = (products) => {
-  // Calculate total inventory value
-  const totalValue = products.reduce((sum, product) => {
-    return sum + (product.current_stock * product.selling_price || 0);
-  }, 0);
+const updateInventoryTrendsChart = (analytics) => {
+  const totalValue = analytics.totals.inventory_value;
   
-  // Sort products by value (product.current_stock * product.selling_price)
-  const sortedProducts = [...products]
-    .sort((a, b) => {
-      const valueA = (a.current_stock * a.selling_price) || 0;
-      const valueB = (b.current_stock * b.selling_price) || 0;
-      return valueB - valueA; // Descending order
-    })
-    .slice(0, 10); // Top 10 products by value
+  // Top 10 products by value (current_stock * selling_price)
+  const sortedProducts = analytics.top.inventory_value.slice(0, 10);
   
   // Prepare data for the chart
   const labels = sortedProducts.map(p => p.name);
-  const inventoryValues = sortedProducts.map(p => (p.current_stock * p.selling_price) || 0);
-  const stockCounts = sortedProducts.map(p => p.current_stock || 0);
+  const inventoryValues = sortedProducts.map(p => p.value);
+  const stockCounts = sortedProducts.map(p => p.current_stock);
   
   // Update chart
   charts.inventoryTrends.data.labels = labels;
@@ -542,17 +499,13 @@ const updateInventoryTrendsChart = (products) => {
 };
 
 // Update category distribution chart with real-time data
-const updateCategoryDistributionChart = (products) => {
-  // Calculate product counts by category
-  const categoryCounts = {};
-  products.forEach(product => {
-    const category = product.category || 'Uncategorized';
-    categoryCounts[category] = (categoryCounts[category] || 0) + 1;
-  });
+const updateCategoryDistributionChart = (analytics) => {
+  // Product counts by category
+  const groups = analytics.groups.category || [];
   
   // Prepare data for the chart
-  const categories = Object.keys(categoryCounts);
-  const counts = categories.map(category => categoryCounts[category]);
+  const categories = groups.map(group => group.key);
+  const counts = groups.map(group => group.count);
   
   // Update chart
   charts.categoryDistribution.data.labels = categories;
@@ -561,13 +514,21 @@ const updateCategoryDistributionChart = (products) => {
 };
 
 // Add stock level chart (new chart)
-const addStockLevelChart = (products) => {
+const addStockLevelChart = (analytics) => {
   // Use the dedicated container for stock level chart
   const container = document.getElementById('stock-level-container');
   if (!container) return;
   
+  // Products by status; zero stock counts as out of stock regardless of status
+  const statusCounts = analytics.stock_status;
+  const counts = [statusCounts.active, statusCounts.low_stock, statusCounts.out_of_stock];
+  
   // Check if this chart already exists
-  if (document.getElementById('stock-level-chart')) return;
+  if (charts.stockLevel && document.getElementById('stock-level-chart')) {
+    charts.stockLevel.data.datasets[0].data = counts;
+    charts.stockLevel.update();
+    return;
+  }
   
   // Create the chart content
   container.innerHTML = `
@@ -581,33 +542,6 @@ const addStockLevelChart = (products) => {
     </div>
   `;
   
-  // Count products by status
-  const statusCounts = {
-    'active': 0,
-    'low_stock': 0,
-    'out_of_stock': 0
-  };
-  
-  products.forEach(product => {
-    // First check if product has zero stock - should count as out_of_stock regardless of status
-    if (product.current_stock === 0) {
-      statusCounts.out_of_stock++;
-    } 
-    // Then check status for other products
-    else {
-      const status = product.status || 'unknown';
-      if (statusCounts.hasOwnProperty(status)) {
-        statusCounts[status]++;
-      } else if (status === 'inactive') {
-        // Count inactive products (probably older term for out_of_stock)
-        statusCounts.out_of_stock++;
-      } else {
-        // Default to active if status is unknown
-        statusCounts.active++;
-      }
-    }
-  });
-  
   console.log('Stock level counts:', statusCounts);
   
   // Create the chart
@@ -618,11 +552,7 @@ const addStockLevelChart = (products) => {
       labels: ['Active', 'Low Stock', 'Out of Stock'],
       datasets: [{
         label: 'Number of Products',
-        data: [
-          statusCounts.active,
-          statusCounts.low_stock,
-          statusCounts.out_of_stock
-        ],
+        data: counts,
         backgroundColor: [
           'rgba(75, 192, 192, 0.7)', // Active - teal
           'rgba(255, 205, 86, 0.7)', // Low Stock - yellow
@@ -722,22 +652,11 @@ const loadLowStockAlerts = async () => {
     
     console.log('Loading low stock alerts...');
     
-    // Get low stock products from the products data
-    const lowStockProducts = productsData.filter(product => 
-      product.status === 'low_stock' || 
-      (product.current_stock <= product.min_stock_level && product.current_stock > 0)
-    );
-    
-    // Get out of stock products 
-    const outOfStockProducts = productsData.filter(product => 
-      product.status === 'out_of_stock' || 
-      product.current_stock === 0
-    );
-    
-    // Combine the arrays, with out of stock first (more critical)
-    const alertProducts = [...outOfStockProducts, ...lowStockProducts];
+    // Products needing attention come with the analytics, out of stock first (more critical)
+    const alertProducts = analyticsData ? analyticsData.alerts : [];
+    const alertCount = analyticsData ? analyticsData.alert_count : 0;
     
-    console.log(`Found ${alertProducts.length} products needing attention`);
+    console.log(`Found ${alertCount} products needing attention`);
     
     // Update the lowStockItems global array
     lowStockItems = alertProducts;
@@ -786,7 +705,7 @@ const loadLowStockAlerts = async () => {
     // Update the badge count
     const stockAlertCount = document.getElementById('stock-alert-count');
     if (stockAlertCount) {
-      stockAlertCount.textContent = alertProducts.length;
+      stockAlertCount.textContent = alertCount;
     }
     
     // Update global notification badge
@@ -802,60 +721,21 @@ const setupWebSocketListeners = () => {
   // Connect to Socket.IO
   connectWebSocket();
   
-  // Listen for product updates
+  // Listen for product updates; the aggregates are refetched rather than recomputed here
   subscribeToEvent('product-update', (data) => {
     console.log('WebSocket: Received product update event', data);
-    
-    // Handle product creation
-    if (data.type === 'create') {
-      // Add new product to productsData array
-      productsData.push(data.data);
-      console.log('New product added to analytics data:', data.data.name);
-    }
-    // Handle product update
-    else if (data.type === 'update') {
-      // Find and update the product in productsData array
-      const index = productsData.findIndex(p => p.id === data.data.id);
-      if (index !== -1) {
-        productsData[index] = data.data;
-        console.log('Product updated in analytics data:', data.data.name);
-      }
-    }
-    // Handle product deletion
-    else if (data.type === 'delete') {
-      // Remove product from productsData array
-      const productName = productsData.find(p => p.id === data.data.id)?.name || 'Unknown';
-      productsData = productsData.filter(p => p.id !== data.data.id);
-      console.log('Product removed from analytics data:', productName);
-    }
-    
-    // Update the metrics section with real-time data
-    updateMetricsSection(productsData);
-    
-    // Update all analytics visualizations with the new data
-    updateAllAnalytics(productsData);
+    scheduleAnalyticsRefresh();
   });
   
   // Listen for stock updates
   subscribeToEvent('stock-update', (data) => {
     console.log('WebSocket: Received stock update event', data);
-    
-    // Find and update the product in productsData array
-    const index = productsData.findIndex(p => p.id === data.productId);
-    if (index !== -1) {
-      // Update product stock
-      const oldStock = productsData[index].current_stock;
-      productsData[index].current_stock = data.newStock;
-      console.log(`Stock updated for ${productsData[index].name}: ${oldStock} → ${data.newStock}`);
-      
-      // Update the metrics section with real-time data
-      updateMetricsSection(productsData);
-      
-      // Update all analytics visualizations with the new data
-      updateAllAnalytics(productsData);
-    }
+    scheduleAnalyticsRefresh();
   });
   
+  // The server dropped updates this tab was too slow to receive
+  subscribeToEvent('resync', () => loadAnalyticsData());
+  
   // Listen for low stock alerts
   subscribeToEvent('low-stock-update', (data) => {
     console.log('WebSocket: Received low stock update event', data);
@@ -863,24 +743,11 @@ const setupWebSocketListeners = () => {
     // Increment unread count for notification badge
     unreadLowStockCount++;
     
-    // If data includes the affected product, update its status in productsData
-    if (data.product_id) {
-      const index = productsData.findIndex(p => p.id === data.product_id);
-      if (index !== -1) {
-        // Update the product status
-        productsData[index].status = 'low_stock';
-        console.log(`Updated status for ${productsData[index].name} to low_stock`);
-      }
-    }
-    
-    // Update low stock alerts list
-    loadLowStockAlerts();
-    
     // Update notification badge
     updateNotificationBadge();
     
-    // Update the metrics section with real-time data
-    updateMetricsSection(productsData);
+    // The refetch also reloads the low stock alerts list
+    scheduleAnalyticsRefresh();
   });
   
   // Listen for direct events from the events API
@@ -896,41 +763,32 @@ const setupWebSocketListeners = () => {
   });
 };
 
+// Refetch the analytics once per ANALYTICS_REFRESH_DELAY while real-time updates
+// arrive. Later updates join the pending refetch instead of postponing it, so a
+// steady stream of updates still refreshes the page.
+const scheduleAnalyticsRefresh = () => {
+  if (analyticsRefreshTimer !== null) return;
+  analyticsRefreshTimer = setTimeout(() => {
+    analyticsRefreshTimer = null;
+    loadAnalyticsData();
+  }, ANALYTICS_REFRESH_DELAY);
+};
+
 // Function to update just the metrics section with real-time data
-const updateMetricsSection = (products) => {
+const updateMetricsSection = (analytics) => {
   // Find existing metrics section
   const metricsSection = document.getElementById('summary-metrics');
   if (!metricsSection) {
     // If it doesn't exist yet, create it
-    addSummaryMetrics(products);
+    addSummaryMetrics(analytics);
     return;
   }
   
-  // Calculate updated metrics
-  const totalProducts = products.length;
-  const totalInventoryValue = products.reduce((sum, product) => {
-    return sum + (product.current_stock * product.selling_price || 0);
-  }, 0);
-  const totalInventoryCost = products.reduce((sum, product) => {
-    return sum + (product.current_stock * product.cost_price || 0);
-  }, 0);
-  const potentialProfit = totalInventoryValue - totalInventoryCost;
-  const profitMargin = totalInventoryValue > 0 ? (potentialProfit / totalInventoryValue * 100) : 0;
-  
-  // Count products by status
-  const statusCounts = {
-    active: 0,
-    low_stock: 0,
-    inactive: 0,
-    out_of_stock: 0
-  };
-  
-  products.forEach(product => {
-    const status = product.status || 'unknown';
-    if (statusCounts.hasOwnProperty(status)) {
-      statusCounts[status]++;
-    }
-  });
+  const totals = analytics.totals;
+  const totalProducts = totals.products;
+  const totalInventoryValue = totals.inventory_value;
+  const potentialProfit = totals.potential_profit;
+  const profitMargin = totals.profit_margin;
   
   // Update the values in existing metrics section
   const valueElements = metricsSection.querySelectorAll('.metric-value');
@@ -949,7 +807,7 @@ const updateMetricsSection = (products) => {
     }
     
     // Low Stock
-    valueElements[3].textContent = statusCounts.low_stock;
+    valueElements[3].textContent = totals.low_stock;
   }
   
   // Update timestamp
@@ -973,59 +831,40 @@ const updateMetricsSection = (products) => {
 };
 
 // Helper function to update all analytics visualizations at once
-const updateAllAnalytics = (products) => {
+const updateAllAnalytics = (analytics) => {
   // Update summary metrics first
-  updateMetricsSection(products);
-  
-  // Update all charts with the latest data
-  updateInventoryTrendsChart(products);
-  updateCategoryDistributionChart(products);
-  
-  if (charts.stockLevel) {
-    // Update existing chart
-    addStockLevelChart(products);
-  } else {
-    // Initialize if not yet created
-    addStockLevelChart(products);
-  }
-  
-  // Update price comparison chart
-  if (charts.priceComparison) {
-    addPriceComparisonChart(products);
-  } else {
-    addPriceComparisonChart(products);
-  }
-  
-  // Update inventory turnover chart
-  if (charts.inventoryTurnover) {
-    addInventoryTurnoverChart(products);
-  } else {
-    addInventoryTurnoverChart(products);
-  }
-  
-  // Update profit margin chart
-  if (charts.profitMargin) {
-    addProfitMarginChart(products);
-  } else {
-    addProfitMarginChart(products);
-  }
-  
-  // Update stock level comparison chart
-  if (charts.stockComparison) {
-    addStockLevelComparisonChart(products);
-  } else {
-    addStockLevelComparisonChart(products);
-  }
+  updateMetricsSection(analytics);
+  
+  // Update all charts with the latest data; each one is created on first use
+  updateInventoryTrendsChart(analytics);
+  updateCategoryDistributionChart(analytics);
+  addStockLevelChart(analytics);
+  addPriceComparisonChart(analytics);
+  addInventoryTurnoverChart(analytics);
+  addProfitMarginChart(analytics);
+  addStockLevelComparisonChart(analytics);
 };
 
 // Add price comparison chart (cost vs selling)
-const addPriceComparisonChart = (products) => {
+const addPriceComparisonChart = (analytics) => {
   // Check if the container element exists
   const container = document.getElementById('additional-charts-container');
   if (!container) return;
   
+  // Top 5 products by selling price
+  const topProducts = analytics.top.selling_price.slice(0, 5);
+  const labels = topProducts.map(p => p.name);
+  const costPrices = topProducts.map(p => p.cost_price);
+  const sellingPrices = topProducts.map(p => p.selling_price);
+  
   // Check if this chart already exists
-  if (document.getElementById('price-comparison-chart')) return;
+  if (charts.priceComparison && document.getElementById('price-comparison-chart')) {
+    charts.priceComparison.data.labels = labels;
+    charts.priceComparison.data.datasets[0].data = costPrices;
+    charts.priceComparison.data.datasets[1].data = sellingPrices;
+    charts.priceComparison.update();
+    return;
+  }
   
   // Create a new chart container
   const chartContainer = document.createElement('div');
@@ -1044,16 +883,6 @@ const addPriceComparisonChart = (products) => {
   // Add the new chart container to the grid
   container.appendChild(chartContainer);
   
-  // Sort products by selling price
-  const topProducts = [...products]
-    .sort((a, b) => (b.selling_price || 0) - (a.selling_price || 0))
-    .slice(0, 5);
-  
-  // Prepare data
-  const labels = topProducts.map(p => p.name);
-  const costPrices = topProducts.map(p => p.cost_price || 0);
-  const sellingPrices = topProducts.map(p => p.selling_price || 0);
-  
   // Create the chart
   const ctx = document.getElementById('price-comparison-chart').getContext('2d');
   charts.priceComparison = new Chart(ctx, {
@@ -1113,13 +942,23 @@ const addPriceComparisonChart = (products) => {
 };
 
 // Add inventory turnover chart
-const addInventoryTurnoverChart = (products) => {
+const addInventoryTurnoverChart = (analytics) => {
   // Check if the container element exists
   const container = document.getElementById('additional-charts-container');
   if (!container) return;
   
+  // Turnover ratio (sales count / inventory value) by category
+  const groups = analytics.groups.category || [];
+  const categories = groups.map(group => group.key);
+  const turnoverRatios = groups.map(group => group.turnover);
+  
   // Check if this chart already exists
-  if (document.getElementById('inventory-turnover-chart')) return;
+  if (charts.inventoryTurnover && document.getElementById('inventory-turnover-chart')) {
+    charts.inventoryTurnover.data.labels = categories;
+    charts.inventoryTurnover.data.datasets[0].data = turnoverRatios;
+    charts.inventoryTurnover.update();
+    return;
+  }
   
   // Create a new chart container
   const chartContainer = document.createElement('div');
@@ -1138,34 +977,6 @@ const addInventoryTurnoverChart = (products) => {
   // Add the new chart container to the grid
   container.appendChild(chartContainer);
   
-  // Calculate inventory turnover by category
-  const categoriesTurnover = {};
-  const categoriesValue = {};
-  
-  products.forEach(product => {
-    const category = product.category || 'Uncategorized';
-    const salesCount = product.sales_count || 0;
-    const inventoryValue = (product.current_stock || 0) * (product.selling_price || 0);
-    
-    if (!categoriesTurnover[category]) {
-      categoriesTurnover[category] = 0;
-      categoriesValue[category] = 0;
-    }
-    
-    categoriesTurnover[category] += salesCount;
-    categoriesValue[category] += inventoryValue;
-  });
-  
-  // Calculate turnover ratio
-  const categories = Object.keys(categoriesTurnover);
-  const turnoverRatios = categories.map(category => {
-    const inventoryValue = categoriesValue[category];
-    const salesCount = categoriesTurnover[category];
-    
-    if (inventoryValue === 0) return 0;
-    return salesCount / inventoryValue;
-  });
-  
   // Create the chart
   const ctx = document.getElementById('inventory-turnover-chart').getContext('2d');
   charts.inventoryTurnover = new Chart(ctx, {
@@ -1209,13 +1020,36 @@ const addInventoryTurnoverChart = (products) => {
 };
 
 // Add profit margin chart
-const addProfitMarginChart = (products) => {
+const addProfitMarginChart = (analytics) => {
   // Check if the container element exists
   const container = document.getElementById('additional-charts-container');
   if (!container) return;
   
+  // Profit margins by category, sorted by category name
+  const groups = analytics.groups.category || [];
+  const categories = groups.map(group => group.key);
+  const margins = groups.map(group => group.margin);
+  const backgroundColors = margins.map(margin => 
+    margin < 0 ? 'rgba(255, 99, 132, 0.7)' : 
+    margin < 10 ? 'rgba(255, 205, 86, 0.7)' : 
+    'rgba(75, 192, 192, 0.7)'
+  );
+  const borderColors = margins.map(margin => 
+    margin < 0 ? 'rgb(255, 99, 132)' : 
+    margin < 10 ? 'rgb(255, 205, 86)' : 
+    'rgb(75, 192, 192)'
+  );
+  
   // Check if this chart already exists
-  if (document.getElementById('profit-margin-chart')) return;
+  if (charts.profitMargin && document.getElementById('profit-margin-chart')) {
+    const dataset = charts.profitMargin.data.datasets[0];
+    charts.profitMargin.data.labels = categories;
+    dataset.data = margins;
+    dataset.backgroundColor = backgroundColors;
+    dataset.borderColor = borderColors;
+    charts.profitMargin.update();
+    return;
+  }
   
   // Create a new chart container
   const chartContainer = document.createElement('div');
@@ -1234,40 +1068,6 @@ const addProfitMarginChart = (products) => {
   // Add the new chart container to the grid
   container.appendChild(chartContainer);
   
-  // Calculate profit margins by category
-  const categoryProfits = {};
-  
-  products.forEach(product => {
-    const category = product.category || 'Uncategorized';
-    const costPrice = product.cost_price || 0;
-    const sellingPrice = product.selling_price || 0;
-    const stock = product.current_stock || 0;
-    
-    const totalCost = costPrice * stock;
-    const totalRevenue = sellingPrice * stock;
-    const profit = totalRevenue - totalCost;
-    
-    if (!categoryProfits[category]) {
-      categoryProfits[category] = {
-        totalCost: 0,
-        totalRevenue: 0,
-        profit: 0
-      };
-    }
-    
-    categoryProfits[category].totalCost += totalCost;
-    categoryProfits[category].totalRevenue += totalRevenue;
-    categoryProfits[category].profit += profit;
-  });
-  
-  // Calculate margins
-  const categories = Object.keys(categoryProfits).sort();
-  const margins = categories.map(category => {
-    const { totalRevenue, profit } = categoryProfits[category];
-    if (totalRevenue === 0) return 0;
-    return (profit / totalRevenue) * 100;
-  });
-  
   // Create the chart
   const ctx = document.getElementById('profit-margin-chart').getContext('2d');
   charts.profitMargin = new Chart(ctx, {
@@ -1277,16 +1077,8 @@ const addProfitMarginChart = (products) => {
       datasets: [{
         label: 'Profit Margin (%)',
         data: margins,
-        backgroundColor: margins.map(margin => 
-          margin < 0 ? 'rgba(255, 99, 132, 0.7)' : 
-          margin < 10 ? 'rgba(255, 205, 86, 0.7)' : 
-          'rgba(75, 192, 192, 0.7)'
-        ),
-        borderColor: margins.map(margin => 
-          margin < 0 ? 'rgb(255, 99, 132)' : 
-          margin < 10 ? 'rgb(255, 205, 86)' : 
-          'rgb(75, 192, 192)'
-        ),
+        backgroundColor: backgroundColors,
+        borderColor: borderColors,
         borderWidth: 1
       }]
     },
@@ -1325,13 +1117,25 @@ const addProfitMarginChart = (products) => {
 };
 
 // Add stock level vs minimum stock comparison chart
-const addStockLevelComparisonChart = (products) => {
+const addStockLevelComparisonChart = (analytics) => {
   // Check if the container element exists
   const container = document.getElementById('additional-charts-container');
   if (!container) return;
   
+  // Products with the lowest current / minimum stock ratio
+  const filteredProducts = analytics.top.stock_ratio.slice(0, 10);
+  const labels = filteredProducts.map(p => p.name);
+  const currentStocks = filteredProducts.map(p => p.current_stock);
+  const minStocks = filteredProducts.map(p => p.min_stock_level);
+  
   // Check if this chart already exists
-  if (document.getElementById('stock-comparison-chart')) return;
+  if (charts.stockComparison && document.getElementById('stock-comparison-chart')) {
+    charts.stockComparison.data.labels = labels;
+    charts.stockComparison.data.datasets[0].data = currentStocks;
+    charts.stockComparison.data.datasets[1].data = minStocks;
+    charts.stockComparison.update();
+    return;
+  }
   
   // Create a new chart container
   const chartContainer = document.createElement('div');
@@ -1350,24 +1154,6 @@ const addStockLevelComparisonChart = (products) => {
   // Add the new chart container to the grid
   container.appendChild(chartContainer);
   
-  // Get top products by stock gap percentage (current / min)
-  const filteredProducts = products
-    .filter(p => p.min_stock_level > 0 && p.current_stock >= 0)
-    .map(p => {
-      const ratio = p.current_stock / p.min_stock_level;
-      return {
-        ...p,
-        ratio
-      };
-    })
-    .sort((a, b) => a.ratio - b.ratio)
-    .slice(0, 10);
-  
-  // Prepare data
-  const labels = filteredProducts.map(p => p.name);
-  const currentStocks = filteredProducts.map(p => p.current_stock || 0);
-  const minStocks = filteredProducts.map(p => p.min_stock_level || 0);
-  
   // Create the chart
   const ctx = document.getElementById('stock-comparison-chart').getContext('2d');
   charts.stockComparison = new Chart(ctx, {
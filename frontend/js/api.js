@@ -87,6 +87,7 @@ const productAPI = {
     updateProduct: (id, data) => api.put(`/products/${id}`, data),
     deleteProduct: (id) => api.delete(`/products/${id}`),
     getProductEvents: (id) => api.get(`/products/${id}/events`),
+    getProductHistory: (id, params = '') => api.get(`/products/${id}/history${params ? `?${params}` : ''}`),
     updateStock: (id, quantity) => api.put(`/products/${id}/stock`, { quantity }),
     getLowStockProducts: () => api.get('/products/low-stock'),
     getProductStats: () => api.get('/products/stats')
@@ -100,6 +101,11 @@ const dashboardAPI = {
     getSalesTrends: () => api.get('/dashboard/trends')
 };
 
+// Analytics API (aggregates computed by the server)
+const analyticsAPI = {
+    getAnalytics: (params = '') => api.get(`/analytics${params ? `?${params}` : ''}`)
+};
+
 // Event API
 const eventAPI = {
     getEvents: () => api.get('/events'),
@@ -139,6 +145,50 @@ const subscribeToEvent = (event, callback) => {
     });
 };
 
+// Apply a product-update event to a cached product list, in place.
+// Updates only carry the changed fields and the new version. They apply to
+// the copy at base_version (the previous version unless the server merged
+// several queued updates). On a gap (a missed update) the product is
+// refetched instead and onResync is called once the list has been fixed up.
+const applyProductUpdate = (list, update, onResync) => {
+    const id = update.id || (update.data && update.data.id);
+    const index = list.findIndex(p => p.id === id);
+    
+    if (update.type === 'delete') {
+        if (index !== -1) list.splice(index, 1);
+        return list;
+    }
+    
+    if (update.type === 'create' || update.data) {
+        if (index === -1) list.push(update.data);
+        else list[index] = update.data;
+        return list;
+    }
+    
+    const cached = list[index];
+    const cachedVersion = cached ? (cached.version || 0) : null;
+    const baseVersion = update.base_version !== undefined ? update.base_version : update.version - 1;
+    if (cached && cachedVersion === baseVersion) {
+        Object.assign(cached, update.changes, { version: update.version });
+        return list;
+    }
+    if (cached && cachedVersion >= update.version) {
+        // Already have this version or a newer one
+        return list;
+    }
+    
+    // Version gap: fetch the full product
+    productAPI.getProductById(id)
+        .then(response => {
+            const current = list.findIndex(p => p.id === id);
+            if (current === -1) list.push(response.data);
+            else list[current] = response.data;
+            if (onResync) onResync(response.data);
+        })
+        .catch(error => console.error(`Failed to resync product ${id}: ${error.message}`));
+    return list;
+};
+
 // Unsubscribe from events
 const unsubscribeFromEvent = (event) => {
     if (socket) {
@@ -163,7 +213,9 @@ const leaveProductRoom = (productId) => {
 
 // Export API objects
 window.productAPI = productAPI;
+window.applyProductUpdate = applyProductUpdate;
 window.dashboardAPI = dashboardAPI;
+window.analyticsAPI = analyticsAPI;
 window.eventAPI = eventAPI;
 window.subscribeToEvent = subscribeToEvent;
 window.unsubscribeFromEvent = unsubscribeFromEvent;
@@ -65,47 +65,20 @@ async function loadSummaryData() {
     }
 }
 
-// Load fallback summary data from products.json
+// Load fallback summary data from the analytics totals
 async function loadFallbackSummaryData() {
     try {
-        // Try to load products from the backend folder
-        const response = await fetch('/api/products');
-        
-        if (!response.ok) {
-            throw new Error('Failed to fetch from API');
-        }
-        
-        const data = await response.json();
-        if (!data.success || !Array.isArray(data.data)) {
+        // The server aggregates the catalogue; only the totals come back
+        const data = await analyticsAPI.getAnalytics('group_by=category&top=1');
+        if (!data.success || !data.data) {
             throw new Error('Invalid data format');
         }
         
-        const products = data.data;
-        
-        // Calculate summary data
-        const totalProducts = products.length;
-        const categories = new Set(products.map(p => p.category));
-        const totalCategories = categories.size;
-        
-        // Properly handle numeric calculations to prevent NaN
-        let totalStockValue = 0;
-        products.forEach(p => {
-            try {
-                const stock = parseFloat(p.current_stock) || 0;
-                const price = parseFloat(p.selling_price) || 0;
-                totalStockValue += stock * price;
-            } catch (e) {
-                console.error('Error calculating stock value:', e);
-            }
-        });
-        
-        const lowStockItems = products.filter(p => {
-            try {
-                return parseFloat(p.current_stock) <= parseFloat(p.min_stock_level);
-            } catch (e) {
-                return false;
-            }
-        }).length;
+        const totals = data.data.totals;
+        const totalProducts = totals.products;
+        const totalCategories = totals.categories;
+        const totalStockValue = totals.inventory_value;
+        const lowStockItems = data.data.alert_count;
         
         // Update summary cards
         document.getElementById('total-products').textContent = totalProducts;
@@ -353,7 +326,10 @@ function setupWebSocketListeners() {
                     message = `Product "${data.data.name}" was added`;
                     break;
                 case 'update':
-                    message = `Product "${data.data.name}" was updated`;
+                    // Updates only carry the changed fields, so the name may not be included
+                    message = data.changes && data.changes.name
+                        ? `Product "${data.changes.name}" was updated`
+                        : 'A product was updated';
                     break;
                 case 'delete':
                     message = `A product was deleted`;
@@ -362,7 +338,7 @@ function setupWebSocketListeners() {
             
             // Create activity entry for product updates
             const activityData = {
-                product_name: data.data?.name || 'Unknown Product',
+                product_name: data.data?.name || data.changes?.name || 'Unknown Product',
                 action: data.type === 'create' ? 'create' : data.type === 'update' ? 'update' : 'delete',
                 description: message,
                 timestamp: new Date().toISOString()
@@ -375,6 +351,12 @@ function setupWebSocketListeners() {
         // Subscribe to low stock alerts
         subscribeToEvent('low-stock-update', handleLowStockUpdate);
         
+        // Subscribe to perishable lot expiry alerts
+        subscribeToEvent('expiry-alert', handleExpiryAlert);
+        
+        // The server dropped updates this tab was too slow to receive
+        subscribeToEvent('resync', () => loadDashboardData());
+        
         // Setup reconnection handling
         subscribeToEvent('connection', (status) => {
             if (status.connected) {
@@ -511,6 +493,15 @@ function handleLowStockUpdate(data) {
     updateNotificationBadge();
 }
 
+// Handle a lot entering its expiry warning window or expiring
+function handleExpiryAlert(data) {
+    const expiresOn = data.expires_at ? new Date(data.expires_at).toLocaleDateString() : 'soon';
+    const message = data.state === 'expired'
+        ? `${data.quantity} ${data.unit} of ${data.product_name} expired on ${expiresOn}`
+        : `${data.quantity} ${data.unit} of ${data.product_name} expires on ${expiresOn}`;
+    showNotification(message, data.state === 'expired' ? 'error' : 'warning');
+}
+
 // Update last updated time
 function updateLastUpdatedTime() {
     const lastUpdatedElement = document.getElementById('last-updated-time');
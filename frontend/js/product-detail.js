@@ -1,6 +1,10 @@
 // Product detail page functionality
 let productId = null;
 let productData = null;
+let stockHistoryChart = null;
+
+// The server downsamples the stock history to at most this many points
+const STOCK_HISTORY_POINTS = 200;
 
 document.addEventListener('DOMContentLoaded', () => {
   // Get product ID from URL
@@ -38,6 +42,9 @@ const loadProductDetails = async () => {
     // Update UI with product details
     updateProductUI(productData);
     
+    // Chart how the stock level changed over the selected period
+    loadStockHistory();
+    
   } catch (error) {
     console.error('Error loading product details:', error);
     showNotification(`Error loading product: ${error.message}`, 'error');
@@ -97,6 +104,75 @@ const updateProductUI = (product) => {
   document.title = `${product.name} - Food Inventory Management`;
 };
 
+// Load the downsampled stock history for the selected range
+const loadStockHistory = async () => {
+  const canvas = document.getElementById('stock-history-chart');
+  if (!canvas || typeof Chart === 'undefined') return;
+  
+  try {
+    const range = document.getElementById('history-range').value;
+    const params = new URLSearchParams({ points: STOCK_HISTORY_POINTS });
+    if (range) {
+      params.set('from', Date.now() / 1000 - Number(range));
+    }
+    
+    const response = await productAPI.getProductHistory(productId, params.toString());
+    if (!response.success) {
+      throw new Error(response.message || 'Failed to load stock history');
+    }
+    
+    const points = response.data.points;
+    document.getElementById('history-empty').hidden = points.length > 0;
+    
+    const labels = points.map(([timestamp]) => new Date(timestamp * 1000).toLocaleString());
+    const stocks = points.map(([, stock]) => stock);
+    
+    if (stockHistoryChart) {
+      stockHistoryChart.data.labels = labels;
+      stockHistoryChart.data.datasets[0].data = stocks;
+      stockHistoryChart.update();
+      return;
+    }
+    
+    stockHistoryChart = new Chart(canvas.getContext('2d'), {
+      type: 'line',
+      data: {
+        labels: labels,
+        datasets: [{
+          label: `Stock (${productData.unit || 'units'})`,
+          data: stocks,
+          borderColor: '#2E7D32',
+          backgroundColor: 'rgba(46, 125, 50, 0.1)',
+          fill: true,
+          stepped: true,
+          pointRadius: 0
+        }]
+      },
+      options: {
+        responsive: true,
+        maintainAspectRatio: false,
+        plugins: {
+          legend: {
+            display: false
+          }
+        },
+        scales: {
+          x: {
+            ticks: {
+              maxTicksLimit: 8
+            }
+          },
+          y: {
+            beginAtZero: true
+          }
+        }
+      }
+    });
+  } catch (error) {
+    console.error('Error loading stock history:', error);
+  }
+};
+
 // Setup event listeners
 const setupEventListeners = () => {
   // Back button should navigate to products page
@@ -112,6 +188,9 @@ const setupEventListeners = () => {
 
   // Delete button logic
   document.getElementById('delete-product').addEventListener('click', confirmDeleteProduct);
+  
+  // Reload the stock history chart for another range
+  document.getElementById('history-range').addEventListener('change', loadStockHistory);
 };
 
 // Confirm delete product
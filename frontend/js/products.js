@@ -243,18 +243,12 @@ const updateProductsUI = () => {
 // Setup WebSocket listeners
 const setupWebSocketListeners = () => {
     subscribeToEvent('product-update', (data) => {
-        if (data.type === 'create') {
-            products.push(data.data);
-        } else if (data.type === 'update') {
-            const index = products.findIndex(p => p.id === data.data.id);
-            if (index !== -1) {
-                products[index] = data.data;
-            }
-        } else if (data.type === 'delete') {
-            products = products.filter(p => p.id !== data.data.id);
-        }
+        applyProductUpdate(products, data, updateProductsUI);
         updateProductsUI();
     });
+    
+    // The server dropped updates this tab was too slow to receive
+    subscribeToEvent('resync', () => loadProducts());
 };
 
 // Setup event listeners
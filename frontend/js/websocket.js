@@ -76,6 +76,11 @@ const initWebSocket = () => {
     dispatchEvent('resource-event', data);
   });
   
+  // Sent when this client fell too far behind and queued updates were dropped
+  socket.on('resync', (data) => {
+    dispatchEvent('resync', data);
+  });
+  
   // Handle custom product events
   socket.on('product-create', (data) => {
     console.log('WebSocket: Received product-create event', data);